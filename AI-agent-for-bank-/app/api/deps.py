@@ -0,0 +1,36 @@
+# app/api/deps.py
+from fastapi import HTTPException, Request
+from app.core.lifespan import ServiceContainer
+
+
+def get_container(request: Request) -> ServiceContainer:
+    return request.app.state.container
+
+
+def get_ready_container(request: Request) -> ServiceContainer:
+    """Trả về container khi các service đã được khởi tạo trong lifespan; 503 nếu ứng dụng chưa sẵn sàng."""
+    container = get_container(request)
+    if not container.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Dịch vụ đang khởi động, vui lòng thử lại sau." if container.status == "starting"
+            else "Dịch vụ không khả dụng.",
+            headers={"Retry-After": "5"},
+        )
+    return container
+
+
+def get_admission_controller(request: Request):
+    return get_container(request).admission_controller
+
+
+def get_gemini_service(request: Request):
+    return get_ready_container(request).gemini_service
+
+
+def get_session_service(request: Request):
+    return get_ready_container(request).session_service
+
+
+def get_tenant_registry(request: Request):
+    return get_ready_container(request).tenant_registry
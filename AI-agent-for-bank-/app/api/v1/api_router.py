@@ -1,6 +1,7 @@
 # app/api/v1/api_router.py
 from fastapi import APIRouter
-from app.api.v1.endpoints import chat
+from app.api.v1.endpoints import chat, health
 
 api_router = APIRouter()
-api_router.include_router(chat.router, prefix="/chat", tags=["Chat"])
\ No newline at end of file
+api_router.include_router(chat.router, prefix="/chat", tags=["Chat"])
+api_router.include_router(health.router, prefix="/health", tags=["Health"])
@@ -1,29 +1,236 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import functools
+import json
+import logging
+from typing import Callable, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from app.api.deps import get_admission_controller, get_session_service, get_tenant_registry
+from app.core.config import settings
+from app.core.telemetry import ADMISSION_REJECTED, ERRORS, log_event
 from app.schemas.chat import ChatRequest, ChatResponse
-from app.services.gemini_service import gemini_service
+from app.services.admission_service import AdmissionController, AdmissionRejected, Ticket
+from app.services.session_service import window_messages
+from app.services.tenant_registry import TenantLease, TenantRegistry
 
-# ✅ THAY ĐỔI: Import đúng instance `gemini_service` thay vì các service con
-# Điều này giúp endpoint gọn gàng hơn
+# ✅ THAY ĐỔI: `gemini_service` được tạo trong lifespan và inject qua Depends,
+# nên việc import module này không còn nạp chỉ mục FAISS
 
 router = APIRouter()
 
+# Định dạng stream: "text" (mặc định, tương thích client cũ), "sse" hoặc "ndjson" (sự kiện có cấu trúc)
+STREAM_MEDIA_TYPES = {
+    "text": "text/plain",
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def negotiate_stream_format(http_request: Request, stream_format: Optional[str]) -> str:
+    """Chọn định dạng theo tham số `?format=` hoặc header Accept; mặc định là text/plain."""
+    if stream_format:
+        if stream_format not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"format không hợp lệ: '{stream_format}'")
+        return stream_format
+    accept = http_request.headers.get("accept", "")
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return "text"
+
+
+# Chu kỳ kiểm tra client còn kết nối trong lúc request chờ trong hàng đợi
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+def tenant_key(http_request: Request) -> str:
+    """Tenant của request: header X-Tenant-ID, bỏ trống thì dùng tenant mặc định."""
+    return (http_request.headers.get("x-tenant-id") or settings.DEFAULT_TENANT_ID)[:64]
+
+
+def client_key(http_request: Request) -> str:
+    """Định danh client cho việc chia lượt công bằng: header X-Client-ID (ví dụ mã kiosk) hoặc địa chỉ IP."""
+    client_id = http_request.headers.get("x-client-id")
+    if client_id:
+        return client_id[:64]
+    return http_request.client.host if http_request.client else "unknown"
+
+
+async def wait_for_admission(http_request: Request, admission: AdmissionController) -> Ticket:
+    """
+    Xin suất xử lý; từ chối ngay với 429/503 + Retry-After khi quá tải.
+    Nếu client ngắt kết nối trong lúc chờ, request được rút khỏi hàng đợi.
+    """
+    task = asyncio.create_task(admission.acquire(client_key(http_request)))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise HTTPException(status_code=499, detail="Client đã ngắt kết nối.")
+    except AdmissionRejected as e:
+        ADMISSION_REJECTED.inc(reason=e.reason)
+        detail = ("Bạn đang gửi quá nhiều yêu cầu cùng lúc, vui lòng thử lại sau." if e.status_code == 429
+                  else "Hệ thống đang quá tải, vui lòng thử lại sau.")
+        raise HTTPException(status_code=e.status_code, detail=detail, headers={"Retry-After": str(e.retry_after)})
+
+
+async def release_when_done(stream, ticket: Ticket, admission: AdmissionController, lease: TenantLease):
+    """
+    Trả suất xử lý và lease của tenant khi stream kết thúc; client ngắt kết nối thì truy xuất/sinh câu trả lời
+    bị hủy theo.
+    """
+    try:
+        async for item in stream:
+            yield item
+    except (asyncio.CancelledError, GeneratorExit):
+        admission.record_disconnect()
+        raise
+    finally:
+        await stream.aclose()
+        ticket.release()
+        lease.release()
+
+
+async def release_all(ticket: Ticket, lease: TenantLease) -> None:
+    """
+    BackgroundTask của response: phải là hàm async để chạy trên event loop. Hàm thường sẽ bị Starlette đẩy sang
+    threadpool, trong khi AdmissionController và TenantRegistry không an toàn khi gọi từ thread khác.
+    """
+    ticket.release()
+    lease.release()
+
+
+def hand_off_all(ticket: Ticket, lease: TenantLease) -> Callable[[], None]:
+    """
+    Request mở luồng sinh câu trả lời dùng chung chuyển suất xử lý và lease tenant cho luồng đó:
+    client ngắt kết nối thì luồng vẫn chạy cho các request khác và vẫn được tính là một lời gọi model đang chạy.
+    """
+    release_ticket, release_lease = ticket.hand_off(), lease.hand_off()
+
+    def release() -> None:
+        release_ticket()
+        release_lease()
+    return release
+
+
+def encode_event(stream_format: str, event: str, data: dict) -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, **data}, ensure_ascii=False) + "\n"
+
+
 @router.post("/query")
-async def handle_chat_query(request: ChatRequest):
+async def handle_chat_query(request: ChatRequest, http_request: Request,
+                            stream_format: Optional[str] = Query(None, alias="format"),
+                            session_service=Depends(get_session_service),
+                            tenant_registry: TenantRegistry = Depends(get_tenant_registry),
+                            admission=Depends(get_admission_controller)):
     """
     Endpoint để xử lý yêu cầu chat và trả về câu trả lời dạng stream.
+    Lịch sử hội thoại được giữ phía server theo `session_id` (trả về trong header X-Session-ID).
+    Client cũ vẫn có thể gửi kèm `history`; khi đó lịch sử chỉ được cắt theo ngân sách token, không lưu lại.
+
+    Với `?format=sse|ndjson` (hoặc header Accept tương ứng), server gửi các sự kiện:
+    `sources` (tên file nguồn, gửi ngay sau truy xuất), `token` (từng phần câu trả lời ngay khi model sinh ra)
+    và `done` (thời gian từng giai đoạn); lỗi giữa chừng được báo bằng sự kiện `error`.
+
+    Header X-Tenant-ID chọn tenant (ngân hàng/thương hiệu/ngôn ngữ, xem TenantRegistry); bỏ trống là tenant mặc định.
+
+    Số request gọi Gemini đồng thời bị giới hạn (xem AdmissionController): khi quá tải, request chờ
+    trong hàng đợi hoặc bị từ chối ngay với 429/503 kèm header Retry-After. Các request giống hệt nhau tới cùng lúc
+    (ví dụ nhiều kiosk cùng gửi một câu gợi ý) dùng chung một lần sinh câu trả lời (xem RequestCoalescer).
     """
+    stream_format = negotiate_stream_format(http_request, stream_format)
+    tenant_id = tenant_key(http_request)
+    if not tenant_registry.known(tenant_id):
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy tenant '{tenant_id}'.")
+    ticket = await wait_for_admission(http_request, admission)
+    try:
+        # Tenant chưa nạp được nạp ở đây (một lần cho mọi request đồng thời); lease giữ nó tới hết stream
+        lease = await tenant_registry.acquire(tenant_id)
+    except BaseException as e:
+        ticket.release()
+        if isinstance(e, Exception):
+            ERRORS.inc(stage="tenant_load")
+            log_event("tenant_load_failed", level=logging.ERROR, tenant=tenant_id, error=repr(e))
+            raise HTTPException(status_code=503, detail="Dịch vụ không khả dụng.", headers={"Retry-After": "5"})
+        raise
     try:
-        # Sử dụng async generator để nhận stream từ service
-        async def stream_generator():
-            full_response = ""
-            # Giả định gemini_service có một phương thức stream
-            async for chunk in gemini_service.stream_response(request.question, request.history):
-                full_response += chunk
-                yield chunk
-        
-        return StreamingResponse(stream_generator(), media_type="text/plain")
+        gemini_service = lease.gemini_service
+        session = None
+        if request.history:
+            history = window_messages(request.history, session_service.history_token_budget)
+            summary = ""
+        else:
+            session = session_service.get_or_create(request.session_id, tenant_id)
+            history = session_service.history(session)
+            summary = session.summary
+
+        def record(answer_parts, done):
+            # Chỉ lưu lượt hỏi-đáp khi câu trả lời đã được stream trọn vẹn; thông báo dự phòng khi không sinh được
+            # câu trả lời (degraded) không phải câu trả lời thật, không đưa vào lịch sử của các lượt sau
+            if session is not None and not done.get("degraded"):
+                session_service.record_turn(session, request.question, "".join(answer_parts))
+
+        # Sử dụng async generator để nhận stream từ service.
+        # Request được gộp vào một request giống hệt đang chạy không gọi model, nên trả suất xử lý ngay (on_coalesced);
+        # request mở luồng dùng chung giao suất của mình cho luồng, trả khi sinh xong (hand_off)
+        hand_off = functools.partial(hand_off_all, ticket, lease)
+
+        async def text_generator():
+            answer_parts, done = [], {}
+            async for event, data in gemini_service.stream_events(request.question, history, summary,
+                                                                  on_coalesced=ticket.release, hand_off=hand_off):
+                if event == "token":
+                    answer_parts.append(data)
+                    yield data
+                elif event == "done":
+                    done = data
+            record(answer_parts, done)
+
+        async def event_generator():
+            answer_parts, done = [], {}
+            try:
+                async for event, data in gemini_service.stream_events(request.question, history, summary,
+                                                                      on_coalesced=ticket.release, hand_off=hand_off):
+                    if event == "sources":
+                        payload = {"sources": data, "session_id": session.session_id if session else None}
+                    elif event == "token":
+                        answer_parts.append(data)
+                        payload = {"text": data}
+                    else:
+                        if event == "done":
+                            done = data
+                        payload = data
+                    yield encode_event(stream_format, event, payload)
+            except Exception as e:
+                ERRORS.inc(stage="stream")
+                log_event("stream_failed", level=logging.ERROR, error=repr(e))
+                yield encode_event(stream_format, "error", {"detail": "Lỗi xử lý nội bộ."})
+                return
+            record(answer_parts, done)
+
+        headers = {"X-Session-ID": session.session_id} if session is not None else {}
+        if stream_format == "text":
+            stream = text_generator()
+        else:
+            stream = event_generator()
+            # Tắt bộ đệm của proxy (nginx) để từng sự kiện tới client ngay lập tức
+            headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        # BackgroundTask bảo đảm suất được trả cả khi stream không bao giờ được bắt đầu
+        return StreamingResponse(release_when_done(stream, ticket, admission, lease),
+                                 media_type=STREAM_MEDIA_TYPES[stream_format], headers=headers,
+                                 background=BackgroundTask(release_all, ticket, lease))
 
     except Exception as e:
-        print(f"Lỗi xảy ra trong quá trình xử lý chat: {e}")
+        ticket.release()
+        lease.release()
+        ERRORS.inc(stage="chat")
+        log_event("chat_failed", level=logging.ERROR, error=repr(e))
         raise HTTPException(status_code=500, detail="Lỗi xử lý nội bộ.")
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from app.api.deps import get_container
+from app.core.lifespan import ServiceContainer
+
+router = APIRouter()
+
+
+@router.get("/live")
+async def liveness():
+    """Tiến trình còn sống và event loop còn phản hồi (không phụ thuộc việc nạp chỉ mục)."""
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness(container: ServiceContainer = Depends(get_container)):
+    """
+    Sẵn sàng nhận câu hỏi khi chỉ mục và pipeline RAG đã được nạp (và làm nóng nếu bật).
+    Trả về 503 khi đang khởi động hoặc khởi động thất bại.
+    """
+    body = {
+        "status": container.status,
+        "timings_ms": {name: round(value, 1) for name, value in container.timings.items()},
+    }
+    if container.error:
+        body["error"] = container.error
+
+    vector_db = container.vector_db_service
+    if vector_db is not None:
+        body["index"] = {
+            "snapshot": vector_db.snapshot.name,
+            "swaps": vector_db.swaps,
+            "documents": int(vector_db.index.ntotal),
+            "dimension": vector_db.dimension,
+            "embedding_model": vector_db.model_name,
+            "factory": vector_db.meta.get("factory", "Flat"),
+            "load_ms": round(vector_db.load_seconds * 1000, 1),
+        }
+    if container.tenant_registry is not None:
+        body["tenants"] = container.tenant_registry.stats()
+    body["admission"] = container.admission_controller.stats()
+    if container.session_service is not None:
+        body["sessions"] = container.session_service.stats()
+    gemini = container.gemini_service
+    if gemini is not None and gemini.answer_cache is not None:
+        body["answer_cache"] = gemini.answer_cache.stats()
+    if gemini is not None:
+        body["condense"] = dict(gemini.condense_stats)
+
+    return JSONResponse(body, status_code=200 if container.ready else 503)
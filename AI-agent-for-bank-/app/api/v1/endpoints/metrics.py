@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.api.deps import get_container
+from app.core import telemetry
+from app.core.lifespan import ServiceContainer
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(container: ServiceContainer = Depends(get_container)):
+    """Số liệu theo định dạng Prometheus: độ trễ từng giai đoạn, token, cache, lỗi, hàng đợi chat."""
+    if not telemetry.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics đang tắt (METRICS_ENABLED=false).")
+    admission = container.admission_controller.stats()
+    telemetry.ADMISSION_IN_FLIGHT.set(admission["in_flight"])
+    telemetry.ADMISSION_QUEUE_DEPTH.set(admission["queue_depth"])
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
@@ -2,13 +2,172 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     # Khai báo tất cả các biến bắt buộc phải có trong file .env
-    GOOGLE_API_KEY: str
-    GEMINI_EMBEDDING_MODEL: str
     CHAT_MODEL_NAME: str
+    # Provider chat: "google" (Gemini), "ollama" (model chạy tại chỗ qua Ollama) hoặc "fake" (model giả lập stream từng từ, không cần mạng)
+    CHAT_PROVIDER: str = "google"
+    FAKE_LLM_FIRST_TOKEN_MS: float = 300
+    FAKE_LLM_TOKEN_DELAY_MS: float = 20
+    # Thời gian xử lý prompt của model giả lập, tính thêm vào độ trễ token đầu theo số token đầu vào
+    FAKE_LLM_PREFILL_MS_PER_1K_TOKENS: float = 0
+    # Lỗi/độ trễ bơm vào model giả lập: tỷ lệ request lỗi ngay, tỷ lệ request chậm thêm FAKE_LLM_SLOW_MS trước token đầu
+    FAKE_LLM_ERROR_RATE: float = 0
+    FAKE_LLM_SLOW_RATE: float = 0
+    FAKE_LLM_SLOW_MS: float = 5000
+    # Sinh câu trả lời bền vững: hạn chót cho token đầu; khi provider chính chưa ra token đầu sau phân vị HEDGE_PERCENTILE
+    # độ trễ của chính nó (HEDGE_DEFAULT_DELAY_MS khi chưa đủ HEDGE_MIN_SAMPLES mẫu) thì gửi thêm request tới provider
+    # dự phòng, stream nào ra token trước thắng. FALLBACK_CHAT_PROVIDER: "" (không có), "ollama", "google" hoặc "fake";
+    # FALLBACK_CHAT_MODEL_NAME rỗng = dùng CHAT_MODEL_NAME (với Ollama phải đặt, vd. "qwen2.5:7b").
+    # Circuit breaker: CIRCUIT_FAILURE_THRESHOLD lỗi liên tiếp thì bỏ qua provider trong CIRCUIT_RESET_SECONDS
+    FIRST_TOKEN_TIMEOUT_SECONDS: float = 10
+    HEDGE_ENABLED: bool = True
+    HEDGE_PERCENTILE: float = 95
+    HEDGE_DEFAULT_DELAY_MS: float = 2000
+    HEDGE_MIN_DELAY_MS: float = 200
+    HEDGE_MIN_SAMPLES: int = 20
+    FALLBACK_CHAT_PROVIDER: str = ""
+    FALLBACK_CHAT_MODEL_NAME: str = ""
+    OLLAMA_BASE_URL: str = "http://localhost:11434"
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30
+    # Chỉ bắt buộc khi dùng các dịch vụ của Google
+    GOOGLE_API_KEY: str = ""
+    GEMINI_EMBEDDING_MODEL: str = "models/text-embedding-004"
+
+    # Provider embedding: "google" (API), "hashing" (CPU, không cần mạng),
+    # "local" (model sentence-transformers tải từ đĩa), "http" (dịch vụ nội bộ)
+    # hoặc "fake" (vector của "hashing" + độ trễ giả lập, dùng cho benchmark offline)
+    EMBEDDING_PROVIDER: str = "google"
+    HASHING_EMBEDDING_DIMENSION: int = 512
+    FAKE_EMBEDDING_LATENCY_MS: float = 50
+    FAKE_EMBEDDING_PER_TEXT_MS: float = 0.5
+    LOCAL_EMBEDDING_MODEL_PATH: str = "./models/embedding"
+    LOCAL_EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_HTTP_ENDPOINT: str = "http://localhost:8765/embed"
     
+    # Ngân hàng/thương hiệu và ngôn ngữ trả lời của tenant mặc định (dùng trong lời nhắn hệ thống)
+    BANK_NAME: str = "ABC"
+    ANSWER_LANGUAGE: str = "tiếng Việt"
+    # Nhiều tenant (ngân hàng, thương hiệu, ngôn ngữ) trong một deployment: TENANTS_FILE là file JSON
+    # {"<tenant_id>": {"bank_name", "vector_db_path", "language", "system_prompt", "chat_model_name", ...}}.
+    # Request chọn tenant bằng header X-Tenant-ID (bỏ trống = DEFAULT_TENANT_ID, dùng VECTOR_DB_PATH ở dưới).
+    # Chỉ mục của tenant được nạp khi có request đầu tiên và bị giải phóng theo LRU khi tổng dung lượng
+    # các chỉ mục đã nạp vượt TENANT_MEMORY_BUDGET_MB. Mọi tenant dùng chung model embedding.
+    TENANTS_FILE: str = ""
+    DEFAULT_TENANT_ID: str = "default"
+    TENANT_MEMORY_BUDGET_MB: float = 2048
+
     # Biến này sẽ đọc từ .env nếu có, nếu không sẽ dùng giá trị mặc định
     # Đổi tên thành VECTOR_DB_PATH để khớp với file .env
     VECTOR_DB_PATH: str = "./vectorstore/db_faiss" 
+    # Mỗi lần nạp dữ liệu xuất bản một snapshot mới; worker kiểm tra CURRENT định kỳ và tự chuyển sang,
+    # snapshot cũ bị xóa sau thời gian ân hạn
+    SNAPSHOT_POLL_SECONDS: float = 5.0
+    SNAPSHOT_GC_GRACE_SECONDS: float = 600
+    # Worker khởi tạo thất bại thử lại ngay khi CURRENT đổi, hoặc sau chừng này giây nếu CURRENT không đổi
+    STARTUP_RETRY_SECONDS: float = 30
+
+    # Loại chỉ mục FAISS dựng khi nạp dữ liệu: "flat", "flat_fp16", "ivf", "hnsw" hoặc "ivfpq"
+    FAISS_INDEX_TYPE: str = "flat"
+    FAISS_HNSW_M: int = 32
+    # Tham số tìm kiếm: số cụm IVF được duyệt và độ rộng tìm kiếm của HNSW
+    FAISS_NPROBE: int = 8
+    FAISS_HNSW_EF_SEARCH: int = 64
+
+    # Truy xuất: số chunk đưa vào prompt, kết hợp BM25 + FAISS bằng Reciprocal Rank Fusion
+    RETRIEVAL_TOP_K: int = 5
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_FETCH_K: int = 20
+    RRF_K: int = 60
+    # Gom lô truy xuất: các câu hỏi tới trong RETRIEVAL_BATCH_WINDOW_MS (hoặc đủ RETRIEVAL_MAX_BATCH câu) được embed
+    # bằng một lời gọi và tìm FAISS bằng một lần search trên ma trận; RETRIEVAL_SEARCH_THREADS thread tìm kiếm,
+    # tối đa RETRIEVAL_EMBED_CONCURRENCY lô embedding chạy song song
+    RETRIEVAL_BATCHING_ENABLED: bool = True
+    RETRIEVAL_BATCH_WINDOW_MS: float = 2.0
+    RETRIEVAL_MAX_BATCH: int = 32
+    RETRIEVAL_EMBED_CONCURRENCY: int = 4
+    RETRIEVAL_SEARCH_THREADS: int = 2
+    # Định tuyến theo danh mục: chỉ tìm trong tối đa ROUTER_MAX_CATEGORIES chỉ mục con có trọng tâm gần câu hỏi nhất
+    # (các danh mục cách điểm cao nhất không quá ROUTER_MARGIN); điểm cao nhất dưới ROUTER_MIN_SCORE hoặc quá nhiều
+    # danh mục sát nhau thì tìm trên toàn bộ chỉ mục. Ngưỡng phụ thuộc model embedding: hiệu chỉnh lại bằng scripts/bench_routing.py
+    CATEGORY_ROUTING_ENABLED: bool = True
+    ROUTER_MAX_CATEGORIES: int = 2
+    ROUTER_MIN_SCORE: float = 0.25
+    ROUTER_MARGIN: float = 0.08
+    # Bỏ qua embedding khi kết quả từ khóa đủ chắc chắn (độ phủ từ khóa và độ vượt trội so với hạng 2)
+    LEXICAL_FASTPATH_ENABLED: bool = True
+    LEXICAL_FASTPATH_MIN_COVERAGE: float = 1.0
+    LEXICAL_FASTPATH_MIN_MARGIN: float = 1.5
+
+    # Đóng gói ngữ cảnh trước khi sinh: bỏ trùng, nối các chunk kề nhau, cắt theo ngân sách token (ước lượng).
+    # CONTEXT_MMR_LAMBDA < 1 bật sắp xếp MMR (càng nhỏ càng ưu tiên đa dạng); 1 = chỉ theo độ liên quan
+    CONTEXT_PACKING_ENABLED: bool = True
+    CONTEXT_TOKEN_BUDGET: int = 800
+    CONTEXT_MMR_LAMBDA: float = 1.0
+
+    # Cache câu trả lời theo ngữ nghĩa (chỉ áp dụng cho câu hỏi không kèm lịch sử)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    # Gộp request giống hệt nhau (câu hỏi + lịch sử đã chuẩn hóa) đang chạy cùng lúc vào một lần gọi model
+    COALESCE_REQUESTS_ENABLED: bool = True
+
+    # Cache embedding của câu hỏi: LRU trong bộ nhớ + kho bền vững trên đĩa (theo từng model)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = "./vectorstore/embedding_cache"
+    EMBEDDING_CACHE_MAX_MEMORY_ENTRIES: int = 10_000
+    EMBEDDING_CACHE_MAX_DISK_ENTRIES: int = 100_000
+
+    # Kiểm soát tải cho endpoint chat: số request chạy đồng thời (gọi Gemini song song), hàng đợi có
+    # độ sâu và thời hạn tối đa, số request đồng thời tối đa của một client (header X-Client-ID hoặc IP)
+    CHAT_MAX_CONCURRENCY: int = 8
+    CHAT_MAX_QUEUE_DEPTH: int = 32
+    CHAT_QUEUE_TIMEOUT_SECONDS: float = 15
+    CHAT_MAX_REQUESTS_PER_CLIENT: int = 2
+
+    # Phiên hội thoại phía server: lịch sử gửi cho model giới hạn theo ngân sách token,
+    # các lượt cũ được gộp dần vào bản tóm tắt (SUMMARY_MODEL_NAME rỗng = dùng CHAT_MODEL_NAME)
+    SESSION_BACKEND: str = "memory"
+    SESSION_TTL_SECONDS: float = 1800
+    SESSION_MAX_SESSIONS: int = 10_000
+    HISTORY_TOKEN_BUDGET: int = 800
+    SUMMARY_MAX_TOKENS: int = 200
+    SUMMARY_MODEL_NAME: str = ""
+
+    # Câu hỏi nối tiếp: viết lại thành câu hỏi độc lập trước khi truy xuất.
+    # CONDENSE_MODE: "auto" (chỉ viết lại khi heuristic thấy câu hỏi phụ thuộc ngữ cảnh), "always" hoặc "off".
+    # CONDENSE_MODEL_NAME rỗng = dùng CHAT_MODEL_NAME; nên đặt model nhỏ hơn (vd. gemini-2.0-flash-lite).
+    # Khi bật SPECULATIVE_RETRIEVAL_ENABLED, truy xuất theo câu hỏi gốc chạy song song với bước viết lại.
+    CONDENSE_MODE: str = "auto"
+    CONDENSE_MODEL_NAME: str = ""
+    CONDENSE_TIMEOUT_SECONDS: float = 3.0
+    CONDENSE_HISTORY_MESSAGES: int = 4
+    SPECULATIVE_RETRIEVAL_ENABLED: bool = True
+
+    # Chia nhỏ tài liệu: cắt theo mục Markdown, mục dài hơn CHUNK_SIZE ký tự mới chia tiếp (chồng lấn CHUNK_OVERLAP).
+    # CHUNK_WORKERS: số tiến trình đọc/chia file song song (0 = số CPU)
+    CHUNK_SIZE: int = 1000
+    CHUNK_OVERLAP: int = 100
+    CHUNK_WORKERS: int = 0
+
+    # Nạp dữ liệu: số lô embed song song và giới hạn tốc độ gọi API embedding
+    INGEST_CONCURRENCY: int = 4
+    INGEST_BATCH_SIZE: int = 20
+    INGEST_MAX_RETRIES: int = 6
+    EMBEDDING_REQUESTS_PER_MINUTE: float = 1500
+    EMBEDDING_TOKENS_PER_MINUTE: float = 1_000_000
+
+    # Đo đạc: histogram/counter xuất tại /metrics (Prometheus), span theo request kèm request id.
+    # Log JSON mức INFO chỉ ghi cho LOG_SAMPLE_RATE phần request; lỗi và request chậm hơn LOG_SLOW_REQUEST_MS luôn được ghi
+    METRICS_ENABLED: bool = True
+    LOG_LEVEL: str = "INFO"
+    LOG_SAMPLE_RATE: float = 0.1
+    LOG_SLOW_REQUEST_MS: float = 5000
+
+    # Khởi động: nạp service ở nền trong lifespan, làm nóng bằng một lần embed + một truy vấn giả
+    WARMUP_ENABLED: bool = True
+    WARMUP_QUERY: str = "Số hotline của ngân hàng là gì?"
     
     # Cấu hình để đọc file .env
     model_config = SettingsConfigDict(env_file=".env")
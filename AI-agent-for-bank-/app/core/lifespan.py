@@ -0,0 +1,127 @@
+# app/core/lifespan.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI
+from app.core.config import settings
+from app.services.admission_service import create_admission_controller
+from app.services.snapshot_store import current_snapshot_name
+
+
+class ServiceContainer:
+    """
+    Giữ các service dùng chung của ứng dụng. Service được dựng trong lifespan (không phải lúc import),
+    ở một task nền, để tiến trình nhận request ngay còn chỉ mục FAISS và API client được nạp song song.
+    """
+
+    def __init__(self):
+        self.status = "starting"
+        self.error: Optional[str] = None
+        self.vector_db_service = None
+        self.gemini_service = None
+        self.session_service = None
+        self.tenant_registry = None
+        # Kiểm soát tải không phụ thuộc việc nạp chỉ mục nên được tạo ngay
+        self.admission_controller = create_admission_controller()
+        self.started_at = time.perf_counter()
+        self.timings = {}
+        # Lần khởi tạo thất bại gần nhất: thời điểm và snapshot CURRENT lúc đó (để biết khi nào nên thử lại)
+        self.failed_at: Optional[float] = None
+        self.failed_snapshot: Optional[str] = None
+        self.start_attempts = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    async def start(self) -> None:
+        # Import tại đây để việc import app.main không kéo theo FAISS và các API client
+        from app.services.vector_db_service import VectorDBService
+        from app.services.gemini_service import GeminiService
+        from app.services.session_service import create_session_service
+        from app.services.tenant_registry import create_tenant_registry
+
+        self.start_attempts += 1
+        try:
+            started = time.perf_counter()
+            # Việc tải chỉ mục chặn CPU/IO nên chạy trong thread, không chặn event loop
+            self.vector_db_service = await asyncio.to_thread(VectorDBService)
+            self.gemini_service = await asyncio.to_thread(GeminiService, self.vector_db_service)
+            # Tenant mặc định là các service ở trên; tenant khác được nạp khi có request đầu tiên
+            self.tenant_registry = create_tenant_registry(self.vector_db_service, self.gemini_service)
+            # Mỗi phiên được tóm tắt bởi tenant của nó (model, ngôn ngữ riêng)
+            self.session_service = create_session_service(summarizer=self.tenant_registry.summarize)
+            self.timings["services_ms"] = (time.perf_counter() - started) * 1000
+
+            if settings.WARMUP_ENABLED:
+                await self.warm_up()
+            self.timings["startup_ms"] = (time.perf_counter() - self.started_at) * 1000
+            self.status = "ready"
+            self.error = None
+            print(f"✅ Ứng dụng sẵn sàng phục vụ sau {self.timings['startup_ms']:.1f} ms.")
+        except Exception as e:
+            self.status = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            self.failed_at = time.monotonic()
+            self.failed_snapshot = current_snapshot_name(settings.VECTOR_DB_PATH)
+            print(f"⚠️ Không thể khởi tạo các service: {self.error}")
+            # Bỏ các service đã dựng dở; `watch_snapshots` sẽ thử lại từ đầu
+            await self.close()
+            self.vector_db_service = self.gemini_service = self.session_service = self.tenant_registry = None
+
+    async def warm_up(self) -> None:
+        """Một lần embed + một truy vấn giả để kết nối, cache và trang memory-map đã nóng trước request đầu tiên."""
+        started = time.perf_counter()
+        try:
+            embedding = await self.vector_db_service.embed_query(settings.WARMUP_QUERY)
+            await self.vector_db_service.search(settings.WARMUP_QUERY, query_embedding=embedding)
+        except Exception as e:
+            # Làm nóng thất bại (ví dụ mất mạng tạm thời) không ngăn ứng dụng phục vụ
+            print(f"⚠️ Làm nóng thất bại, bỏ qua: {e}")
+        self.timings["warmup_ms"] = (time.perf_counter() - started) * 1000
+
+    def should_retry_start(self) -> bool:
+        """
+        Khởi tạo thất bại được thử lại khi CURRENT trỏ tới snapshot khác lúc thất bại (ví dụ lần nạp dữ liệu đầu
+        tiên vừa xuất bản xong) hoặc đã qua STARTUP_RETRY_SECONDS (lỗi tạm thời như mất mạng).
+        """
+        if self.status != "failed":
+            return False
+        if current_snapshot_name(settings.VECTOR_DB_PATH) != self.failed_snapshot:
+            return True
+        return time.monotonic() - self.failed_at >= settings.STARTUP_RETRY_SECONDS
+
+    async def watch_snapshots(self) -> None:
+        """
+        Định kỳ kiểm tra CURRENT và chuyển sang snapshot chỉ mục mới mà không cần khởi động lại.
+        Worker chưa khởi tạo được (chưa có chỉ mục, lỗi tạm thời) tự thử lại thay vì trả 503 mãi.
+        """
+        while True:
+            await asyncio.sleep(settings.SNAPSHOT_POLL_SECONDS)
+            if self.ready:
+                await self.tenant_registry.refresh()
+            elif self.should_retry_start():
+                print("ℹ️ Thử khởi tạo lại các service...")
+                self.status = "starting"
+                await self.start()
+
+    async def close(self) -> None:
+        if self.tenant_registry is not None:
+            await self.tenant_registry.close()
+        if self.vector_db_service is not None:
+            await self.vector_db_service.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    container = ServiceContainer()
+    app.state.container = container
+    tasks = [asyncio.create_task(container.start()), asyncio.create_task(container.watch_snapshots())]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await container.close()
@@ -0,0 +1,85 @@
+# app/core/prompts.py
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+from app.schemas.tenant import TenantConfig
+
+# Lời nhắn hệ thống dùng chung cho mọi luồng RAG (GeminiService, ChatUseCase).
+# Mỗi tenant có thể thay bằng mẫu riêng (TenantConfig.system_prompt) với cùng các biến {bank_name}, {language}.
+SYSTEM_PROMPT_TEMPLATE = (
+    "Bạn là một trợ lý AI chuyên nghiệp cho ngân hàng {bank_name}. "
+    "Hãy trả lời câu hỏi của khách hàng dựa trên thông tin ngữ cảnh được cung cấp. "
+    "Nếu thông tin trong ngữ cảnh không đủ để trả lời câu hỏi, hãy nói rằng bạn không có đủ thông tin "
+    "và khuyên khách hàng liên hệ với bộ phận hỗ trợ khách hàng của ngân hàng.\n"
+    "Tuyệt đối không tự bịa ra thông tin. Trả lời bằng {language}.\n\n"
+)
+
+
+def build_system_prompt(bank_name: str, language: str, template: Optional[str] = None) -> str:
+    """Lời nhắn hệ thống của một ngân hàng/thương hiệu và ngôn ngữ trả lời."""
+    return (template or SYSTEM_PROMPT_TEMPLATE).format(bank_name=bank_name, language=language)
+
+
+# Lời nhắn của tenant mặc định (BANK_NAME, ANSWER_LANGUAGE trong cấu hình)
+SYSTEM_PROMPT = build_system_prompt(settings.BANK_NAME, settings.ANSWER_LANGUAGE)
+
+
+def tenant_system_prompt(tenant: Optional[TenantConfig]) -> str:
+    """Lời nhắn hệ thống của một tenant (None = tenant mặc định)."""
+    if tenant is None:
+        return SYSTEM_PROMPT
+    return build_system_prompt(tenant.bank_name, tenant.language, tenant.system_prompt)
+
+# Lời nhắn cho bước tóm tắt dần lịch sử hội thoại: chỉ gửi bản tóm tắt cũ + các lượt vừa bị đẩy ra.
+# Bản tóm tắt được đưa lại vào lời nhắn của tenant nên viết bằng ngôn ngữ trả lời của tenant ({language})
+SUMMARY_PROMPT = (
+    "Bạn đang tóm tắt dần một cuộc trò chuyện giữa khách hàng và trợ lý ngân hàng. "
+    "Hãy cập nhật bản tóm tắt hiện có bằng các lượt trò chuyện mới, giữ lại nhu cầu của khách hàng, "
+    "các sản phẩm/dịch vụ, con số và thông tin khách đã cung cấp. "
+    "Viết ngắn gọn bằng {language}, không quá {max_words} từ, chỉ trả về bản tóm tắt.\n\n"
+    "Bản tóm tắt hiện có:\n{summary}\n\n"
+    "Các lượt trò chuyện mới:\n{turns}"
+)
+
+# Lời nhắn viết lại câu hỏi nối tiếp thành câu hỏi độc lập, chỉ dùng cho bước truy xuất
+CONDENSE_PROMPT = (
+    "Dựa vào đoạn hội thoại giữa khách hàng và trợ lý ngân hàng, hãy viết lại câu hỏi tiếp theo của khách hàng "
+    "thành một câu hỏi độc lập, đầy đủ chủ ngữ và sản phẩm/dịch vụ được nhắc tới, để có thể hiểu mà không cần "
+    "đọc hội thoại. Nếu câu hỏi đã độc lập, giữ nguyên. Chỉ trả về câu hỏi đã viết lại.\n\n"
+    "{summary}Hội thoại gần nhất:\n{turns}\n\n"
+    "Câu hỏi tiếp theo: {question}\n"
+    "Câu hỏi độc lập:"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (~4 ký tự/token), đủ tốt cho việc giới hạn tốc độ và ngân sách prompt."""
+    return max(1, len(text) // 4)
+
+
+def format_turns(messages: list) -> str:
+    """Ghi các lượt hội thoại (ChatMessage) thành văn bản cho các prompt tóm tắt/viết lại câu hỏi."""
+    return "\n".join(
+        f"{'Khách hàng' if message.role == 'user' else 'Trợ lý'}: {message.content}" for message in messages
+    )
+
+
+def format_summary(summary: str) -> str:
+    """Khối tóm tắt các lượt trò chuyện cũ, đặt sau ngữ cảnh trong lời nhắn hệ thống."""
+    if not summary:
+        return ""
+    return f"Tóm tắt cuộc trò chuyện trước đó:\n{summary}\n\n"
+
+
+def format_context(context_chunks: List[Dict[str, Any]]) -> str:
+    """
+    Ghép các đoạn ngữ cảnh thành một khối văn bản để đưa vào prompt.
+    Mỗi chunk là một dictionary với các khóa 'source' và 'text'.
+    """
+    if not context_chunks:
+        return ""
+
+    context_text = "Ngữ cảnh:\n"
+    for chunk in context_chunks:
+        context_text += f"- Nguồn: {chunk.get('source', 'Unknown')}\n"
+        context_text += f"  Nội dung: {chunk.get('text', '')}\n"
+    return context_text + "\n"
@@ -0,0 +1,325 @@
+# app/core/telemetry.py
+"""
+Đo đạc cho đường xử lý chính: span thời gian theo từng request (kèm request id), histogram/counter
+xuất ra định dạng văn bản của Prometheus tại /metrics, và log có cấu trúc (JSON) được lấy mẫu theo request.
+Không phụ thuộc thư viện ngoài. Khi METRICS_ENABLED=false, mọi lời gọi ghi số liệu chỉ còn một phép kiểm tra cờ.
+"""
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+ENABLED = settings.METRICS_ENABLED
+
+# Mốc histogram (giây): từ vài mili giây (BM25, FAISS) tới hàng chục giây (cả câu trả lời)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # key -> [số đếm theo từng mốc (không cộng dồn)..., tổng, số quan sát]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            labels = _format_labels(self.labelnames, key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{labels} {state[-2]}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+STAGE_SECONDS = Histogram(
+    "bank_stage_duration_seconds",
+    "Thời gian từng giai đoạn: embedding, bm25_search, faiss_search, routing, retrieval, condense, context_packing, first_token, generation.",
+    ("stage",),
+)
+REQUEST_SECONDS = Histogram(
+    "bank_http_request_duration_seconds", "Thời gian xử lý request HTTP (tới khi gửi xong byte cuối).",
+    ("path", "status"),
+)
+REQUESTS = Counter("bank_http_requests_total", "Số request HTTP theo đường dẫn và mã trạng thái.", ("path", "status"))
+TOKENS = Counter("bank_llm_tokens_total", "Số token (ước lượng) gửi vào và nhận ra từ chat model.", ("direction",))
+CACHE_EVENTS = Counter("bank_cache_events_total", "Kết quả tra cache (answer, embedding), đường tắt BM25 (lexical_fastpath) "
+                       "và request được gộp vào luồng đang chạy (in_flight).",
+                       ("cache", "result"))
+ROUTER_DECISIONS = Counter("bank_router_decisions_total",
+                           "Quyết định của bộ định tuyến danh mục: routed (tìm trong chỉ mục con) hoặc global.", ("result",))
+RETRIEVAL_BATCH_SIZE = Histogram("bank_retrieval_batch_size",
+                                 "Số câu hỏi trong mỗi lô embedding/tìm kiếm FAISS của bộ gom lô truy xuất.", ("stage",),
+                                 buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+GENERATION_ATTEMPTS = Counter("bank_generation_attempts_total",
+                              "Kết quả từng request tới provider chat: won, error, timeout, cancelled (thua hedge).",
+                              ("provider", "result"))
+ERRORS = Counter("bank_errors_total", "Số lỗi theo giai đoạn.", ("stage",))
+ADMISSION_REJECTED = Counter("bank_admission_rejected_total", "Request chat bị từ chối khi quá tải.", ("reason",))
+ADMISSION_IN_FLIGHT = Gauge("bank_admission_in_flight", "Số request chat đang được xử lý.")
+ADMISSION_QUEUE_DEPTH = Gauge("bank_admission_queue_depth", "Số request chat đang chờ trong hàng đợi.")
+
+
+def render_metrics() -> str:
+    """Toàn bộ số liệu theo định dạng văn bản của Prometheus (text/plain; version=0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Span theo request ---
+
+class Trace:
+    """Các span của một request; `sampled` quyết định log của cả request được ghi hay bỏ cùng nhau."""
+
+    __slots__ = ("request_id", "started", "spans", "sampled")
+
+    def __init__(self, request_id: str, sampled: bool):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+        self.sampled = sampled
+
+    def summary(self) -> dict:
+        """Tổng thời gian (ms) theo giai đoạn; một giai đoạn có thể lặp lại (vd. truy xuất suy đoán + chính thức)."""
+        totals = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration * 1000
+        return {name: round(value, 1) for name, value in totals.items()}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def start_trace(request_id: Optional[str] = None) -> Trace:
+    trace = Trace(request_id or uuid.uuid4().hex[:16], random.random() < settings.LOG_SAMPLE_RATE)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+def record_stage(stage: str, seconds: float, started: Optional[float] = None) -> None:
+    """Ghi thời gian một giai đoạn đã đo sẵn vào histogram và vào span của request hiện tại."""
+    if not ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append((stage, (started or time.perf_counter() - seconds) - trace.started, seconds))
+
+
+class span:
+    """Đo một đoạn mã đồng bộ hoặc có await: `with span("faiss_search"): ...`."""
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "span":
+        if ENABLED:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not ENABLED:
+            return
+        record_stage(self.stage, time.perf_counter() - self.started, self.started)
+        # Hủy (client ngắt kết nối) không tính là lỗi: CancelledError/GeneratorExit không phải Exception
+        if exc_type is not None and issubclass(exc_type, Exception):
+            ERRORS.inc(stage=self.stage)
+
+
+# --- Log có cấu trúc ---
+
+logger = logging.getLogger("bank")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging() -> None:
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, force: bool = False, **fields) -> None:
+    """
+    Ghi một dòng log JSON kèm request id. Log mức INFO chỉ được ghi cho các request được lấy mẫu
+    (LOG_SAMPLE_RATE); cảnh báo, lỗi và `force=True` luôn được ghi.
+    """
+    trace = _current_trace.get()
+    if level < logging.WARNING and not force and not (trace is not None and trace.sampled):
+        return
+    if not logger.isEnabledFor(level):
+        return
+    if trace is not None:
+        fields.setdefault("request_id", trace.request_id)
+    logger.log(level, event, extra={"fields": fields})
+
+
+# --- Middleware ---
+
+# Các đường dẫn được gọi định kỳ (Prometheus, health check): không ghi log request trừ khi lỗi
+_QUIET_PATHS = ("/metrics", "/api/v1/health")
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware (không dùng BaseHTTPMiddleware để không ảnh hưởng stream và việc phát hiện client ngắt kết nối):
+    tạo trace kèm request id (nhận từ header X-Request-ID hoặc sinh mới) trước khi chạy endpoint, trả lại header
+    X-Request-ID, và khi byte cuối đã được gửi thì ghi histogram, counter và một dòng log tóm tắt các span.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        trace = start_trace(request_id or None)
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", trace.request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration = time.perf_counter() - trace.started
+            # Gom các đường dẫn không tồn tại để số nhãn không tăng vô hạn
+            path = scope["path"] if status != 404 else "other"
+            REQUEST_SECONDS.observe(duration, path=path, status=status)
+            REQUESTS.inc(path=path, status=status)
+            if status >= 500 or not scope["path"].startswith(_QUIET_PATHS):
+                log_event(
+                    "request", level=logging.ERROR if status >= 500 else logging.INFO,
+                    force=duration * 1000 >= settings.LOG_SLOW_REQUEST_MS,
+                    method=scope["method"], path=scope["path"], status=status,
+                    duration_ms=round(duration * 1000, 1), spans_ms=trace.summary(),
+                )
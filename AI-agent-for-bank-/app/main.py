@@ -1,13 +1,25 @@
 # app/main.py
 from fastapi import FastAPI
 from app.api.v1.api_router import api_router
+from app.api.v1.endpoints import metrics
+from app.core.lifespan import lifespan
+from app.core.telemetry import TelemetryMiddleware, setup_logging
 
+setup_logging()
+
+# Các service (chỉ mục FAISS, Gemini client) được nạp trong lifespan, không phải lúc import
 app = FastAPI(
     title="Banking AI Agent API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Mỗi request có request id (header X-Request-ID), span theo giai đoạn và số liệu cho /metrics
+app.add_middleware(TelemetryMiddleware)
+
 app.include_router(api_router, prefix="/api/v1")
+# Prometheus mặc định thu thập tại /metrics (ngoài tiền tố /api/v1)
+app.include_router(metrics.router, tags=["Metrics"])
 
 @app.get("/", tags=["Root"])
 def read_root():
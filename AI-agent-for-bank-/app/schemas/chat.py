@@ -1,6 +1,6 @@
 # app/schemas/chat.py
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 # ✅ THAY ĐỔI: Thêm một schema để định nghĩa cấu trúc của một tin nhắn trong lịch sử
 class ChatMessage(BaseModel):
@@ -12,6 +12,9 @@ class ChatRequest(BaseModel):
     # ✅ THAY ĐỔI: Thêm trường 'history'
     # Nó là một danh sách các tin nhắn (ChatMessage) và có thể rỗng
     history: List[ChatMessage] = []
+    # ✅ THAY ĐỔI: Client mới chỉ gửi câu hỏi kèm session_id, lịch sử được giữ phía server.
+    # Nếu bỏ trống, server tạo phiên mới và trả ID trong header X-Session-ID.
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     """
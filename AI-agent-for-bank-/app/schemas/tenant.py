@@ -0,0 +1,19 @@
+# app/schemas/tenant.py
+from typing import Optional
+from pydantic import BaseModel
+
+
+class TenantConfig(BaseModel):
+    """
+    Cấu hình của một tenant (ngân hàng/thương hiệu/ngôn ngữ) đọc từ TENANTS_FILE.
+    Trường bỏ trống dùng giá trị chung trong Settings.
+    """
+    tenant_id: str
+    bank_name: str
+    vector_db_path: str
+    # Ngôn ngữ trả lời, ghi đúng như sẽ chèn vào lời nhắn ("tiếng Việt", "English", ...)
+    language: str = "tiếng Việt"
+    # Mẫu lời nhắn hệ thống riêng, có thể dùng {bank_name} và {language}
+    system_prompt: Optional[str] = None
+    chat_model_name: Optional[str] = None
+    temperature: float = 0.3
@@ -0,0 +1,186 @@
+# app/services/admission_service.py
+import asyncio
+import math
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Callable, Deque, Optional
+from app.core.config import settings
+
+
+class AdmissionRejected(Exception):
+    """Request bị từ chối ngay: 429 khi một client gửi quá nhiều, 503 khi hệ thống đã bão hòa."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Một suất xử lý đã được cấp; `release()` gọi nhiều lần cũng chỉ trả suất một lần."""
+
+    def __init__(self, controller: "AdmissionController", client_id: str):
+        self._controller = controller
+        self.client_id = client_id
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+    def hand_off(self) -> Callable[[], None]:
+        """
+        Chuyển suất sang nơi khác giữ (luồng sinh câu trả lời dùng chung, xem RequestCoalescer):
+        từ đây `release()` của ticket này không làm gì, suất được trả khi gọi hàm trả về.
+        """
+        if self._released:
+            return lambda: None
+        self._released = True
+        successor = Ticket(self._controller, self.client_id)
+        successor.admitted_at = self.admitted_at
+        return successor.release
+
+
+class AdmissionController:
+    """
+    Giới hạn số request chat chạy đồng thời (tức số lời gọi Gemini song song).
+    Request vượt giới hạn chờ trong hàng đợi có độ sâu và thời hạn tối đa; hàng đợi chia theo client
+    và được phục vụ xoay vòng, để một kiosk gửi dồn dập không chiếm hết lượt của các kiosk khác.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue_depth: int = 32,
+                 queue_timeout: float = 15.0, max_per_client: int = 2):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self.max_per_client = max_per_client
+
+        self._active = 0
+        # client -> các future đang chờ; thứ tự của OrderedDict là thứ tự xoay vòng
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queue_depth = 0
+        self._per_client: Counter = Counter()
+        # Thời gian xử lý trung bình (trung bình trượt mũ), dùng để ước lượng Retry-After
+        self._avg_service_seconds = 2.0
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Counter = Counter()
+        self.disconnects = 0
+        self.max_queue_depth_seen = 0
+        self._total_wait_seconds = 0.0
+
+    # --- API chính ---
+
+    async def acquire(self, client_id: str) -> Ticket:
+        """Cấp một suất xử lý, chờ trong hàng đợi nếu cần; ném AdmissionRejected nếu bị từ chối."""
+        if self._per_client[client_id] >= self.max_per_client:
+            self._reject("client_limit", 429)
+        if self._active < self.max_concurrency and not self._queue_depth:
+            return self._admit(client_id, waited=0.0)
+        if self._queue_depth >= self.max_queue_depth:
+            self._reject("queue_full", 503)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client_id, deque()).append(future)
+        self._per_client[client_id] += 1
+        self._queue_depth += 1
+        self.queued += 1
+        self.max_queue_depth_seen = max(self.max_queue_depth_seen, self._queue_depth)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # Suất đã được cấp đúng lúc hết hạn/bị hủy: trả lại cho người kế tiếp
+                ticket = self._admit(client_id, time.monotonic() - started, granted=True)
+                ticket.release()
+            else:
+                future.cancel()
+                self._remove_waiter(client_id, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("queue_timeout", 503)
+            self.disconnects += 1
+            raise
+        return self._admit(client_id, time.monotonic() - started, granted=True)
+
+    def record_disconnect(self) -> None:
+        """Client ngắt kết nối khi câu trả lời đang được sinh (việc sinh đã bị hủy)."""
+        self.disconnects += 1
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._active,
+            "queue_depth": self._queue_depth,
+            "max_queue_depth_seen": self.max_queue_depth_seen,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "client_disconnects": self.disconnects,
+            "avg_queue_wait_ms": round(self._total_wait_seconds / self.queued * 1000, 1) if self.queued else 0.0,
+            "avg_service_ms": round(self._avg_service_seconds * 1000, 1),
+        }
+
+    # --- Hàm nội bộ ---
+
+    def _admit(self, client_id: str, waited: float, granted: bool = False) -> Ticket:
+        if granted:
+            # Suất được chuyển thẳng từ request vừa xong: số request đang chạy không đổi
+            self._total_wait_seconds += waited
+        else:
+            self._active += 1
+            self._per_client[client_id] += 1
+        self.admitted += 1
+        return Ticket(self, client_id)
+
+    def _reject(self, reason: str, status_code: int) -> None:
+        self.rejected[reason] += 1
+        retry_after = math.ceil(self._avg_service_seconds * (self._queue_depth + 1) / self.max_concurrency)
+        raise AdmissionRejected(status_code, reason, max(1, min(60, retry_after)))
+
+    def _release(self, ticket: Ticket) -> None:
+        elapsed = time.monotonic() - ticket.admitted_at
+        self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * elapsed
+        self._per_client[ticket.client_id] -= 1
+        if self._per_client[ticket.client_id] <= 0:
+            del self._per_client[ticket.client_id]
+        if not self._grant_next():
+            self._active -= 1
+
+    def _grant_next(self) -> bool:
+        """Chuyển suất vừa trống cho client kế tiếp theo vòng xoay; trả về False nếu không ai chờ."""
+        while self._waiters:
+            client_id, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            self._queue_depth -= 1
+            if queue:
+                self._waiters.move_to_end(client_id)
+            else:
+                del self._waiters[client_id]
+            if not future.done():
+                future.set_result(None)
+                return True
+        return False
+
+    def _remove_waiter(self, client_id: str, future: asyncio.Future) -> None:
+        queue: Optional[Deque[asyncio.Future]] = self._waiters.get(client_id)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self._queue_depth -= 1
+            if not queue:
+                del self._waiters[client_id]
+        self._per_client[client_id] -= 1
+        if self._per_client[client_id] <= 0:
+            del self._per_client[client_id]
+
+
+def create_admission_controller() -> AdmissionController:
+    return AdmissionController(
+        max_concurrency=settings.CHAT_MAX_CONCURRENCY,
+        max_queue_depth=settings.CHAT_MAX_QUEUE_DEPTH,
+        queue_timeout=settings.CHAT_QUEUE_TIMEOUT_SECONDS,
+        max_per_client=settings.CHAT_MAX_REQUESTS_PER_CLIENT,
+    )
@@ -0,0 +1,231 @@
+# app/services/answer_cache_service.py
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.core.telemetry import log_event
+
+# Chi phí cố định ước lượng cho mỗi mục (đối tượng Python, khóa của OrderedDict, ...)
+ENTRY_OVERHEAD_BYTES = 256
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    # None: câu trả lời chỉ tra được theo đúng câu hỏi (câu hỏi đi đường tắt BM25, không có embedding)
+    embedding: Optional[np.ndarray]
+    answer: str
+    created_at: float
+    size_bytes: int
+    # Tên file nguồn của ngữ cảnh đã dùng để sinh câu trả lời (sự kiện "sources" khi trúng cache)
+    sources: List[str] = field(default_factory=list)
+
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời theo ngữ nghĩa: một câu hỏi mới được coi là trùng với câu hỏi cũ
+    khi độ tương đồng cosine giữa hai embedding vượt ngưỡng cấu hình.
+
+    - Câu hỏi lặp lại nguyên văn (sau khi chuẩn hóa chữ hoa/khoảng trắng) tra được bằng `lookup_text`,
+      không cần embedding.
+    - Loại bỏ theo LRU, theo TTL và theo giới hạn bộ nhớ.
+    - Toàn bộ cache bị xóa khi `version_provider` trả về phiên bản khác
+      (tức là vector store đã được dựng lại), để không bao giờ trả về thông tin sản phẩm cũ.
+    """
+
+    def __init__(
+        self,
+        version_provider: Callable[[], Hashable],
+        similarity_threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+        max_bytes: int = 16 * 1024 * 1024,
+        version_check_interval: float = 5.0,
+    ):
+        self.version_provider = version_provider
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_check_interval = version_check_interval
+
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._by_text: Dict[str, int] = {}
+        self._next_id = 0
+        self._bytes = 0
+        # Ma trận embedding (đã chuẩn hóa) được dựng lại lười mỗi khi cache thay đổi
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+        self._version = self._safe_version()
+        self._last_version_check = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_stores = 0
+
+    # --- Kiểm tra phiên bản vector store ---
+
+    def _safe_version(self) -> Hashable:
+        try:
+            return self.version_provider()
+        except OSError:
+            return None
+
+    def _check_version(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_version_check < self.version_check_interval:
+            return
+        self._last_version_check = now
+        version = self._safe_version()
+        if version != self._version:
+            log_event("answer_cache_invalidated", level=logging.INFO, force=True, entries=len(self._entries))
+            self._version = version
+            self.invalidations += 1
+            self.clear()
+
+    # --- API chính ---
+
+    def lookup(self, embedding) -> Optional[CacheEntry]:
+        """Trả về mục đã cache (câu trả lời, nguồn) cho câu hỏi gần nhất, hoặc None nếu không có."""
+        self._check_version()
+        self._expire()
+        matrix = self._get_matrix() if self._entries else None
+        if matrix is None:
+            self.misses += 1
+            return None
+
+        query = self._normalize(embedding)
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        entry_id = self._matrix_ids[best]
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return self._entries[entry_id]
+
+    def lookup_text(self, question: str) -> Optional[CacheEntry]:
+        """Mục đã cache cho đúng câu hỏi này (không cần embedding), hoặc None; không tính là miss."""
+        self._check_version()
+        self._expire()
+        entry_id = self._by_text.get(self._text_key(question))
+        if entry_id is None:
+            return None
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return self._entries[entry_id]
+
+    def store(self, question: str, embedding, answer: str, version: Hashable = None,
+              sources: Optional[List[str]] = None) -> None:
+        """
+        Lưu câu trả lời mới vào cache; `embedding` None thì chỉ tra được bằng `lookup_text`.
+        `version` là phiên bản vector store lúc truy xuất ngữ cảnh cho câu trả lời: nếu vector store đã đổi
+        trong lúc sinh (hot swap), câu trả lời dựa trên dữ liệu cũ và không được lưu.
+        `sources` là tên file nguồn đã gửi kèm câu trả lời, gửi lại nguyên vẹn khi trúng cache.
+        """
+        if not answer:
+            return
+        self._check_version(force=version is not None)
+        if version is not None and version != self._version:
+            self.stale_stores += 1
+            return
+        vector = self._normalize(embedding) if embedding is not None else None
+        sources = list(sources or [])
+        size = ((vector.nbytes if vector is not None else 0) + len(answer.encode("utf-8"))
+                + len(question.encode("utf-8")) + sum(len(source.encode("utf-8")) for source in sources)
+                + ENTRY_OVERHEAD_BYTES)
+        if size > self.max_bytes:
+            return
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = CacheEntry(question, vector, answer, time.monotonic(), size, sources)
+        self._by_text[self._text_key(question)] = entry_id
+        self._bytes += size
+        if vector is not None:
+            self._matrix = None
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._pop_oldest()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_text.clear()
+        self._bytes = 0
+        self._matrix = None
+        self._matrix_ids = []
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_stores": self.stale_stores,
+        }
+
+    # --- Hàm nội bộ ---
+
+    @staticmethod
+    def _text_key(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _get_matrix(self) -> Optional[np.ndarray]:
+        if self._matrix is None:
+            self._matrix_ids = [i for i, entry in self._entries.items() if entry.embedding is not None]
+            self._matrix = (np.stack([self._entries[i].embedding for i in self._matrix_ids]) if self._matrix_ids
+                            else None)
+        return self._matrix
+
+    def _forget(self, entry_id: int, entry: CacheEntry) -> None:
+        self._bytes -= entry.size_bytes
+        key = self._text_key(entry.question)
+        if self._by_text.get(key) == entry_id:
+            del self._by_text[key]
+        if entry.embedding is not None:
+            self._matrix = None
+
+    def _pop_oldest(self) -> None:
+        entry_id, entry = self._entries.popitem(last=False)
+        self._forget(entry_id, entry)
+        self.evictions += 1
+
+    def _expire(self) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [i for i, entry in self._entries.items() if entry.created_at < deadline]
+        for entry_id in expired:
+            self._forget(entry_id, self._entries.pop(entry_id))
+            self.evictions += 1
+
+
+def create_answer_cache(version_provider: Callable[[], Hashable]) -> Optional[SemanticAnswerCache]:
+    """Tạo cache câu trả lời theo cấu hình, hoặc None nếu tính năng bị tắt."""
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    return SemanticAnswerCache(
+        version_provider=version_provider,
+        similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+        max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+    )
@@ -0,0 +1,154 @@
+# app/services/category_router.py
+"""
+Chỉ mục con theo danh mục và bộ định tuyến câu hỏi.
+
+Khi nạp dữ liệu, mỗi danh mục (thư mục con trong data/, hoặc tên file nếu file nằm trực tiếp trong data/) có một
+chỉ mục FAISS riêng trong thư mục `categories/<số thứ tự>/` của snapshot, kèm bảng ánh xạ dòng con -> dòng toàn cục,
+và một vector trọng tâm (trung bình các vector của danh mục). Khi truy vấn, câu hỏi được so với các trọng tâm:
+chỉ tìm trong 1-2 danh mục gần nhất; nếu bộ định tuyến không chắc chắn (điểm thấp hoặc quá nhiều danh mục sát nhau)
+thì quay về chỉ mục toàn cục.
+
+Định dạng trong snapshot:
+- `categories.json`          : tên và số chunk của từng danh mục (theo số thứ tự).
+- `categories/centroids.npy` : trọng tâm đã chuẩn hóa, mỗi dòng một danh mục.
+- `categories/rows.npy`      : số thứ tự danh mục của từng dòng toàn cục (int16).
+- `categories/<i>/index.faiss`, `categories/<i>/rows.npy` : chỉ mục con và dòng toàn cục tương ứng.
+"""
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from app.services.index_store import build_faiss_index, index_factory_string, load_faiss_index, write_faiss_index
+
+CATEGORIES_FILENAME = "categories.json"
+CATEGORIES_DIRNAME = "categories"
+CENTROIDS_FILENAME = "centroids.npy"
+ROWS_FILENAME = "rows.npy"
+
+
+def document_category(metadata: dict) -> str:
+    """Danh mục của một chunk; chỉ mục cũ không có trường `category` thì dùng tên file nguồn."""
+    category = metadata.get("category")
+    if category:
+        return category
+    return os.path.splitext(os.path.basename(metadata.get("source", "")))[0] or "khac"
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def write_category_indexes(db_path: str, docs: List[Tuple[str, dict]], vectors: np.ndarray,
+                           index_type: str, hnsw_m: int = 32) -> Dict[str, int]:
+    """Dựng và ghi chỉ mục con cho từng danh mục; trả về {danh mục: số chunk}."""
+    categories = [document_category(metadata) for _, metadata in docs]
+    names = sorted(set(categories))
+    position = {name: i for i, name in enumerate(names)}
+    row_categories = np.asarray([position[name] for name in categories], dtype=np.int16)
+
+    base = os.path.join(db_path, CATEGORIES_DIRNAME)
+    os.makedirs(base, exist_ok=True)
+    centroids, counts = [], []
+    for i, _ in enumerate(names):
+        rows = np.flatnonzero(row_categories == i).astype(np.int64)
+        subset = np.ascontiguousarray(vectors[rows], dtype=np.float32)
+        centroids.append(subset.mean(axis=0))
+        counts.append(len(rows))
+
+        path = os.path.join(base, str(i))
+        os.makedirs(path, exist_ok=True)
+        factory = index_factory_string(index_type, len(rows), subset.shape[1], hnsw_m)
+        write_faiss_index(path, build_faiss_index(subset, factory))
+        _save_array(os.path.join(path, ROWS_FILENAME), rows)
+
+    _save_array(os.path.join(base, CENTROIDS_FILENAME), _normalize_rows(np.asarray(centroids, dtype=np.float32)))
+    _save_array(os.path.join(base, ROWS_FILENAME), row_categories)
+    path = os.path.join(db_path, CATEGORIES_FILENAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"names": names, "counts": counts}, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    return dict(zip(names, counts))
+
+
+class CategoryRouter:
+    """Chỉ mục con đã tải của một snapshot và quy tắc định tuyến theo trọng tâm gần nhất."""
+
+    def __init__(self, db_path: str, max_categories: int, min_score: float, margin: float,
+                 nprobe: int = 8, ef_search: int = 64):
+        with open(os.path.join(db_path, CATEGORIES_FILENAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        base = os.path.join(db_path, CATEGORIES_DIRNAME)
+        self.names: List[str] = meta["names"]
+        self.counts: List[int] = meta["counts"]
+        self.centroids = np.load(os.path.join(base, CENTROIDS_FILENAME))
+        self.row_categories = np.load(os.path.join(base, ROWS_FILENAME), mmap_mode="r")
+        self.indexes = [load_faiss_index(os.path.join(base, str(i)), nprobe=nprobe, ef_search=ef_search)
+                        for i in range(len(self.names))]
+        self.rows = [np.load(os.path.join(base, str(i), ROWS_FILENAME), mmap_mode="r") for i in range(len(self.names))]
+        self.max_categories = max_categories
+        self.min_score = min_score
+        self.margin = margin
+
+    @classmethod
+    def load(cls, db_path: str, **kwargs) -> Optional["CategoryRouter"]:
+        """None nếu snapshot được dựng trước khi có chỉ mục con."""
+        if not os.path.exists(os.path.join(db_path, CATEGORIES_FILENAME)):
+            return None
+        return cls(db_path, **kwargs)
+
+    def route(self, embedding: List[float]) -> List[int]:
+        """
+        Các danh mục nên tìm (theo thứ tự điểm giảm dần), hoặc [] nếu không chắc chắn:
+        điểm cao nhất dưới `min_score`, hoặc số danh mục nằm trong khoảng `margin` so với danh mục đứng đầu
+        nhiều hơn `max_categories`.
+        """
+        if len(self.names) < 2:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.centroids @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        order = np.argsort(-scores)
+        top = float(scores[order[0]])
+        if top < self.min_score:
+            return []
+        close = [int(i) for i in order if scores[i] >= top - self.margin]
+        if len(close) > self.max_categories:
+            return []
+        return close
+
+    def search(self, embedding: List[float], categories: List[int], k: int) -> List[int]:
+        """Tìm trong các chỉ mục con đã chọn, trả về dòng toàn cục theo khoảng cách tăng dần."""
+        return self.search_many([embedding], [categories], k)[0]
+
+    def search_many(self, embeddings: List[List[float]], categories: List[List[int]], k: int) -> List[List[int]]:
+        """
+        Như `search` cho nhiều câu hỏi (mỗi câu một danh sách danh mục): mỗi chỉ mục con được tìm một lần
+        với ma trận các câu hỏi được định tuyến tới nó.
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        found = [[] for _ in embeddings]
+        for i in sorted({c for chosen in categories for c in chosen}):
+            queries = [q for q, chosen in enumerate(categories) if i in chosen]
+            distances, indices = self.indexes[i].search(vectors[queries], min(k, self.counts[i]))
+            for q, row_distances, row_indices in zip(queries, distances, indices):
+                found[q] += [(float(d), int(self.rows[i][j])) for d, j in zip(row_distances, row_indices) if j != -1]
+        results = []
+        for chosen, hits in zip(categories, found):
+            # Các chỉ mục con cùng loại và cùng metric nên khoảng cách so sánh được với nhau
+            metric_is_similarity = self.indexes[chosen[0]].metric_type == faiss.METRIC_INNER_PRODUCT
+            hits.sort(key=lambda item: -item[0] if metric_is_similarity else item[0])
+            results.append([row for _, row in hits[:k]])
+        return results
+
+    def in_categories(self, rows: List[int], categories: List[int]) -> List[int]:
+        """Lọc các dòng toàn cục (vd. kết quả BM25) chỉ giữ những dòng thuộc các danh mục đã chọn."""
+        allowed = set(categories)
+        return [row for row in rows if int(self.row_categories[row]) in allowed]
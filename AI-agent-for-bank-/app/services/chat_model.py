@@ -0,0 +1,123 @@
+# app/services/chat_model.py
+import asyncio
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from app.core.config import settings
+from app.core.prompts import estimate_tokens
+
+# Một "token" của model giả lập: một từ kèm khoảng trắng phía sau
+_TOKEN_RE = re.compile(r"\S+\s*")
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+    Chat model giả lập, không cần mạng: trả lời bằng đoạn ngữ cảnh đầu tiên trong prompt và
+    stream từng từ với độ trễ cấu hình được (độ trễ token đầu + độ trễ mỗi token).
+    Dùng để đo độ trễ và chạy thử toàn bộ pipeline mà không gọi Gemini.
+    """
+
+    first_token_delay: float = 0.3
+    token_delay: float = 0.02
+    # Thời gian xử lý prompt (giây cho mỗi 1000 token đầu vào ước lượng), cộng vào độ trễ token đầu
+    prefill_delay_per_1k: float = 0.0
+    max_answer_chars: int = 400
+    # Bơm lỗi/độ trễ để thử hedging và circuit breaker: tỷ lệ request lỗi ngay, tỷ lệ request chậm thêm slow_delay giây
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_delay: float = 5.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if prompt.rstrip().endswith("Câu hỏi độc lập:"):
+            # Prompt viết lại câu hỏi (CONDENSE_PROMPT): ghép câu hỏi nối tiếp với câu hỏi trước đó của khách
+            follow_up = prompt.rpartition("Câu hỏi tiếp theo: ")[2].split("\n")[0].strip()
+            previous = [line[len("Khách hàng: "):] for line in prompt.split("\n") if line.startswith("Khách hàng: ")]
+            return f"{follow_up} ({previous[-1]})" if previous else follow_up
+        question = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        _, found, context = prompt.partition("Nội dung: ")
+        if not found:
+            return f"Tôi không có đủ thông tin để trả lời câu hỏi: {question}"
+        snippet = context.split("\n- Nguồn:")[0].strip()[:self.max_answer_chars]
+        return f"Dựa trên thông tin của ngân hàng: {snippet}"
+
+    def _first_token_delay(self, messages: List[BaseMessage]) -> float:
+        """Độ trễ token đầu của một request; ném lỗi giả lập với xác suất `error_rate`."""
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("Lỗi giả lập từ provider (503 Service Unavailable)")
+        delay = self.first_token_delay
+        if self.slow_rate and random.random() < self.slow_rate:
+            delay += self.slow_delay
+        if self.prefill_delay_per_1k:
+            prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+            delay += self.prefill_delay_per_1k * prompt_tokens / 1000
+        return delay
+
+    def _delay(self, messages: List[BaseMessage], answer: str) -> float:
+        """Thời gian sinh trọn câu trả lời (dùng cho lời gọi không stream)."""
+        return self._first_token_delay(messages) + self.token_delay * max(0, len(_TOKEN_RE.findall(answer)) - 1)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        answer = self._answer(messages)
+        time.sleep(self._delay(messages, answer))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        answer = self._answer(messages)
+        await asyncio.sleep(self._delay(messages, answer))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._first_token_delay(messages))
+        for i, token in enumerate(_TOKEN_RE.findall(self._answer(messages))):
+            if i:
+                time.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._first_token_delay(messages))
+        for i, token in enumerate(_TOKEN_RE.findall(self._answer(messages))):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def create_chat_model(model_name: str, temperature: float = 0.3, provider: Optional[str] = None) -> BaseChatModel:
+    """Tạo chat model theo `settings.CHAT_PROVIDER`: "google" (Gemini), "ollama" (tại chỗ) hoặc "fake" (giả lập, không cần mạng)."""
+    provider = provider or settings.CHAT_PROVIDER
+    if provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(
+            model=model_name,
+            google_api_key=settings.GOOGLE_API_KEY,
+            temperature=temperature,
+            convert_system_message_to_human=True
+        )
+    if provider == "fake":
+        return FakeStreamingChatModel(
+            first_token_delay=settings.FAKE_LLM_FIRST_TOKEN_MS / 1000,
+            token_delay=settings.FAKE_LLM_TOKEN_DELAY_MS / 1000,
+            prefill_delay_per_1k=settings.FAKE_LLM_PREFILL_MS_PER_1K_TOKENS / 1000,
+            error_rate=settings.FAKE_LLM_ERROR_RATE,
+            slow_rate=settings.FAKE_LLM_SLOW_RATE,
+            slow_delay=settings.FAKE_LLM_SLOW_MS / 1000,
+        )
+    if provider == "ollama":
+        try:
+            from langchain_ollama import ChatOllama
+        except ImportError as e:
+            raise RuntimeError("Provider 'ollama' cần cài thêm gói langchain-ollama.") from e
+        return ChatOllama(model=model_name, base_url=settings.OLLAMA_BASE_URL, temperature=temperature)
+    raise ValueError(f"CHAT_PROVIDER không hợp lệ: '{provider}'")
@@ -0,0 +1,174 @@
+# app/services/chunking_service.py
+"""
+Bước chia nhỏ tài liệu dùng chung cho scripts/chunk_data.py và scripts/ingest_data.py.
+
+Tài liệu của ngân hàng có cấu trúc Markdown (`#`/`##`/`###`, dòng `---` ngăn cách), nên văn bản được cắt theo ranh giới
+mục trước, chỉ mục nào dài hơn CHUNK_SIZE mới bị chia tiếp bằng RecursiveCharacterTextSplitter. Mỗi chunk mở đầu bằng
+đường dẫn tiêu đề ("SẢN PHẨM TIẾT KIỆM > 3. CÁC QUY ĐỊNH > Cách tính lãi") và mang nó trong metadata (`section`, `headings`),
+cùng vị trí của chunk trong file (`chunk_index`) để bước đóng gói ngữ cảnh nhận ra các chunk kề nhau, và danh mục
+(`category`: thư mục con trong thư mục dữ liệu, hoặc tên file) để dựng chỉ mục con theo danh mục.
+
+Các file được đọc và chia trong một process pool; kết quả trả về dạng generator theo từng file (đúng thứ tự file,
+số file đang xử lý đồng thời có giới hạn) và có thể ghi/đọc dạng JSONL từng dòng, không giữ cả kho dữ liệu trong bộ nhớ.
+"""
+import io
+import os
+import re
+import glob
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.core.config import settings
+
+# Đổi khi thay đổi cách chia để manifest của ingest_data.py biết phải dựng lại toàn bộ
+CHUNKER_VERSION = "sections-v3"
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_SEPARATOR_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+# Phần thân tối thiểu của một chunk khi đường dẫn tiêu đề quá dài
+_MIN_BODY_SIZE = 200
+
+
+def discover_files(data_dir: str) -> List[str]:
+    """Các file .txt và .pdf trong thư mục dữ liệu (đệ quy), theo thứ tự ổn định."""
+    paths = []
+    for extension in SUPPORTED_EXTENSIONS:
+        paths += glob.glob(os.path.join(data_dir, "**", f"*{extension}"), recursive=True)
+    return sorted(paths)
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def source_category(path: str, data_dir: Optional[str] = None) -> str:
+    """Danh mục của file: thư mục con cấp một trong `data_dir`, hoặc tên file (bỏ phần mở rộng) nếu nằm trực tiếp."""
+    relative = os.path.relpath(path, data_dir) if data_dir else os.path.basename(path)
+    parts = relative.split(os.sep)
+    return parts[0] if len(parts) > 1 else os.path.splitext(parts[0])[0]
+
+
+def _read_pages(path: str, data: bytes) -> List[str]:
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+        return [page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages]
+    return [data.decode("utf-8")]
+
+
+def split_sections(pages: Iterable[str]) -> Iterator[Tuple[List[str], str, int]]:
+    """
+    Duyệt văn bản (theo trang) và trả về (đường dẫn tiêu đề, nội dung mục, trang bắt đầu) cho từng mục có nội dung.
+    Tiêu đề cấp thấp hơn hoặc bằng đóng các mục con trước đó; dòng `---` chỉ là ranh giới trình bày nên bị bỏ.
+    """
+    stack: List[Tuple[int, str]] = []
+    body: List[str] = []
+    start_page = 1
+    for page_number, page in enumerate(pages, 1):
+        for line in page.splitlines():
+            heading = _HEADING_RE.match(line)
+            if heading:
+                text = "\n".join(body).strip()
+                if text:
+                    yield [title for _, title in stack], text, start_page
+                body = []
+                level = len(heading.group(1))
+                while stack and stack[-1][0] >= level:
+                    stack.pop()
+                stack.append((level, heading.group(2)))
+                start_page = page_number
+            elif not _SEPARATOR_RE.match(line):
+                if not body:
+                    start_page = page_number
+                body.append(line)
+    text = "\n".join(body).strip()
+    if text:
+        yield [title for _, title in stack], text, start_page
+
+
+@lru_cache(maxsize=64)
+def _splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def chunk_file(path: str, chunk_size: int, chunk_overlap: int, data_dir: Optional[str] = None) -> dict:
+    """
+    Đọc và chia một file. Trả về {'source', 'sha256', 'chunks': [{'text', 'metadata'}]}.
+    Là hàm cấp module để chạy được trong process pool.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    source = os.path.relpath(path, ".")
+    category = source_category(path, data_dir)
+    is_pdf = path.lower().endswith(".pdf")
+    chunks = []
+    for headings, body, page in split_sections(_read_pages(path, data)):
+        prefix = " > ".join(headings)
+        budget = max(_MIN_BODY_SIZE, chunk_size - len(prefix) - 1) if prefix else chunk_size
+        for piece in _splitter(budget, min(chunk_overlap, budget // 2)).split_text(body):
+            metadata = {"source": source, "category": category, "section": prefix, "headings": headings,
+                        "chunk_index": len(chunks)}
+            if is_pdf:
+                metadata["page"] = page
+            chunks.append({"text": f"{prefix}\n{piece}" if prefix else piece, "metadata": metadata})
+    return {"source": source, "sha256": hashlib.sha256(data).hexdigest(), "chunks": chunks}
+
+
+def iter_chunked_files(paths: List[str], chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                       workers: Optional[int] = None, data_dir: Optional[str] = None) -> Iterator[dict]:
+    """
+    Chia các file song song trong process pool, trả kết quả theo đúng thứ tự `paths`.
+    Mỗi lúc chỉ có tối đa 2 × số worker file đang chờ, nên bộ nhớ không tăng theo kích thước kho dữ liệu.
+    """
+    chunk_size = chunk_size or settings.CHUNK_SIZE
+    chunk_overlap = settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    workers = workers or settings.CHUNK_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield chunk_file(path, chunk_size, chunk_overlap, data_dir)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(chunk_file, path, chunk_size, chunk_overlap, data_dir))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_jsonl(files: Iterable[dict], output_path: str) -> int:
+    """Ghi từng chunk thành một dòng JSON {'source', 'sha256', 'text', 'metadata'}; trả về số chunk."""
+    count = 0
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for file in files:
+            for chunk in file["chunks"]:
+                record = {"source": file["source"], "sha256": file["sha256"], **chunk}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def read_jsonl(path: str) -> Iterator[dict]:
+    """Đọc lại file JSONL theo từng dòng, gom các chunk liên tiếp của cùng một file thành dạng của chunk_file()."""
+    current = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if current is None or record["source"] != current["source"]:
+                if current is not None:
+                    yield current
+                current = {"source": record["source"], "sha256": record["sha256"], "chunks": []}
+            current["chunks"].append({"text": record["text"], "metadata": record["metadata"]})
+    if current is not None:
+        yield current
@@ -0,0 +1,161 @@
+# app/services/context_packer.py
+"""
+Đóng gói ngữ cảnh giữa bước truy xuất và bước sinh câu trả lời:
+1. bỏ các chunk trùng hoặc nằm trọn trong một chunk liên quan hơn;
+2. nối các chunk kề nhau của cùng một file (phần chồng lấn CHUNK_OVERLAP chỉ giữ một lần);
+3. (tùy chọn) sắp lại theo MMR để ưu tiên các đoạn khác nhau;
+4. lấy lần lượt theo độ liên quan cho tới khi đầy ngân sách CONTEXT_TOKEN_BUDGET.
+Không gọi model hay embedding: độ tương đồng trong MMR tính bằng Jaccard trên tập từ.
+"""
+import re
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.prompts import estimate_tokens
+
+_WORD_RE = re.compile(r"\w+")
+# Phần chồng lấn ngắn hơn mức này coi là trùng hợp ngẫu nhiên, không phải hai chunk kề nhau
+MIN_OVERLAP_CHARS = 20
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _body(chunk: Dict[str, Any]) -> str:
+    """Nội dung chunk không kèm dòng đường dẫn tiêu đề ở đầu (do chunking_service thêm vào)."""
+    section, text = chunk.get("section"), chunk["text"]
+    if section and text.startswith(section + "\n"):
+        return text[len(section) + 1:]
+    return text
+
+
+def _overlap(left: str, right: str, limit: int) -> int:
+    """Độ dài phần cuối của `left` trùng với phần đầu của `right` (0 nếu ngắn hơn MIN_OVERLAP_CHARS)."""
+    for size in range(min(len(left), len(right), limit), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def deduplicate(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Giữ thứ hạng; chunk nằm trọn trong chunk đã giữ bị bỏ, chunk chứa trọn chunk đã giữ thì thay vào chỗ đó."""
+    kept, normalized = [], []
+    for chunk in chunks:
+        text = _normalize(_body(chunk))
+        if any(text in other for other in normalized):
+            continue
+        for i, other in enumerate(normalized):
+            if other in text:
+                kept[i], normalized[i] = chunk, text
+                break
+        else:
+            kept.append(chunk)
+            normalized.append(text)
+    # Một chunk lớn có thể đã thay vào nhiều chỗ
+    unique, seen = [], set()
+    for chunk, text in zip(kept, normalized):
+        if text not in seen:
+            seen.add(text)
+            unique.append(chunk)
+    return unique
+
+
+def _adjacent(left: Dict[str, Any], right: Dict[str, Any]) -> bool:
+    """`right` nằm ngay sau `left` trong file (theo chunk_index; chỉ mục cũ không có thông tin này)."""
+    return left["last"] is not None and right["first"] is not None and right["first"] == left["last"] + 1
+
+
+def _merge_pass(items: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    merged: List[Dict[str, Any]] = []
+    for item in items:
+        for target in merged:
+            if target["source"] != item["source"] or target.get("section") != item.get("section"):
+                continue
+            size = _overlap(target["body"], item["body"], limit)
+            if size or _adjacent(target, item):
+                target["body"] += item["body"][size:] if size else "\n" + item["body"]
+                target["last"] = item["last"]
+                break
+            size = _overlap(item["body"], target["body"], limit)
+            if size or _adjacent(item, target):
+                target["body"] = item["body"] + (target["body"][size:] if size else "\n" + target["body"])
+                target["first"] = item["first"]
+                break
+        else:
+            merged.append(dict(item))
+    return merged
+
+
+def merge_adjacent(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Nối các chunk liên tiếp của cùng một mục (theo chunk_index, hoặc nhận ra nhờ phần chồng lấn với chỉ mục cũ)
+    vào vị trí của chunk liên quan hơn; phần chồng lấn chỉ giữ một lần.
+    """
+    limit = max(settings.CHUNK_OVERLAP, MIN_OVERLAP_CHARS)
+    items = [{**chunk, "body": _body(chunk), "first": chunk.get("index"), "last": chunk.get("index")}
+             for chunk in chunks]
+    # Lặp tới khi không nối thêm được: một đoạn vừa nối có thể trở nên kề với đoạn đứng trước nó
+    while True:
+        merged = _merge_pass(items, limit)
+        if len(merged) == len(items):
+            break
+        items = merged
+
+    packed = []
+    for item in items:
+        body, first = item.pop("body"), item.pop("first")
+        item.pop("last")
+        section = item.get("section")
+        packed.append({**item, "index": first, "text": f"{section}\n{body}" if section else body})
+    return packed
+
+
+def _jaccard(left: set, right: set) -> float:
+    return len(left & right) / len(left | right) if left and right else 0.0
+
+
+def mmr_order(chunks: List[Dict[str, Any]], lambda_: float) -> List[Dict[str, Any]]:
+    """Maximal Marginal Relevance: độ liên quan lấy theo thứ hạng truy xuất, phạt đoạn giống đoạn đã chọn."""
+    if lambda_ >= 1.0 or len(chunks) < 3:
+        return chunks
+    words = [set(_WORD_RE.findall(chunk["text"].lower())) for chunk in chunks]
+    count = len(chunks)
+    remaining, selected = list(range(count)), []
+    while remaining:
+        best = max(remaining, key=lambda i: lambda_ * (1 - i / count) - (1 - lambda_) * max(
+            (_jaccard(words[i], words[j]) for j in selected), default=0.0))
+        remaining.remove(best)
+        selected.append(best)
+    return [chunks[i] for i in selected]
+
+
+def _entry_tokens(chunk: Dict[str, Any]) -> int:
+    """Số token một chunk chiếm trong khối ngữ cảnh (cùng định dạng với format_context)."""
+    return estimate_tokens(f"- Nguồn: {chunk.get('source', 'Unknown')}\n  Nội dung: {chunk['text']}\n")
+
+
+def fill_budget(chunks: List[Dict[str, Any]], budget_tokens: int) -> List[Dict[str, Any]]:
+    """Lấy các chunk theo thứ tự cho tới khi hết ngân sách; chunk không vừa bị bỏ qua để thử chunk sau (nhỏ hơn)."""
+    packed, used = [], 0
+    for chunk in chunks:
+        cost = _entry_tokens(chunk)
+        if used + cost > budget_tokens:
+            if packed:
+                continue
+            # Chunk liên quan nhất luôn được giữ, cắt bớt nếu một mình nó đã vượt ngân sách
+            chunk = {**chunk, "text": chunk["text"][:budget_tokens * 4]}
+            cost = _entry_tokens(chunk)
+        packed.append(chunk)
+        used += cost
+    return packed
+
+
+def pack_context(chunks: List[Dict[str, Any]], budget_tokens: Optional[int] = None,
+                 mmr_lambda: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Các chunk (theo thứ tự liên quan giảm dần) sau khi bỏ trùng, nối, sắp MMR và cắt theo ngân sách token."""
+    if not chunks:
+        return chunks
+    budget_tokens = budget_tokens or settings.CONTEXT_TOKEN_BUDGET
+    mmr_lambda = settings.CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    packed = merge_adjacent(deduplicate(chunks))
+    return fill_budget(mmr_order(packed, mmr_lambda), budget_tokens)
@@ -0,0 +1,333 @@
+# app/services/embedding_cache.py
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.core.telemetry import CACHE_EVENTS, log_event
+
+try:  # Khóa file chỉ có trên POSIX; trên Windows ghi tuần tự trong một tiến trình là đủ
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Chuẩn hóa câu hỏi làm khóa cache: dấu tiếng Việt dạng NFC, chữ thường, gộp khoảng trắng."""
+    text = unicodedata.normalize("NFC", text)
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+async def aembed_queries(model: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embedding của nhiều CÂU HỎI bằng một lời gọi `aembed_documents` (dùng cho truy xuất theo lô).
+    Gemini phân biệt loại task nên phải yêu cầu RETRIEVAL_QUERY để vector giống hệt `aembed_query`.
+    """
+    if isinstance(model, CachedEmbeddings):
+        return await model.aembed_queries(texts)
+    if type(model).__name__ == "GoogleGenerativeAIEmbeddings":
+        return await model.aembed_documents(texts, task_type="RETRIEVAL_QUERY")
+    return await model.aembed_documents(texts)
+
+
+def _safe_dirname(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_") or "default"
+
+
+class DiskEmbeddingStore:
+    """
+    Kho embedding gọn nhẹ trên đĩa:
+    - `vectors.f32`: mảng float32 liên tiếp, mỗi dòng là một vector (đọc bằng memmap).
+    - `keys.jsonl`: mỗi dòng {"k": khóa, "i": số dòng trong vectors.f32}.
+    - `meta.json`: tên model và số chiều.
+    Chỉ ghi nối thêm (append-only) nên an toàn khi tiến trình bị dừng giữa chừng.
+
+    Nhiều worker dùng chung một thư mục: trước khi ghi (dưới khóa file) và khi tra trượt, kho đọc tiếp
+    `keys.jsonl` từ vị trí đã đọc lần trước để thấy các khóa worker khác vừa thêm và không ghi trùng.
+    Kho không tự dọn: khi đủ `max_entries` khóa, các embedding mới chỉ còn nằm trong cache bộ nhớ
+    (`full` trong stats); xóa thư mục hoặc tăng EMBEDDING_CACHE_MAX_DISK_ENTRIES để ghi tiếp.
+    """
+
+    def __init__(self, directory: str, model_name: str, max_entries: int = 100_000):
+        self.directory = directory
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.keys_path = os.path.join(directory, "keys.jsonl")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.lock_path = os.path.join(directory, ".lock")
+
+        self.dimension: Optional[int] = None
+        self.index: Dict[str, int] = {}
+        self._mmap: Optional[np.memmap] = None
+        # Vị trí (byte) đã đọc tới trong keys.jsonl
+        self._keys_offset = 0
+        # Bảo vệ index/mmap: `get` chạy trong thread tra cứu (asyncio.to_thread), `put` chạy trong thread ghi
+        self._lock = threading.Lock()
+        self.full = False
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != self.model_name:
+            print(f"⚠️ Bỏ qua cache embedding tại '{self.directory}' vì được tạo bởi model khác.")
+            return
+        self.dimension = int(meta["dimension"])
+        self._catch_up()
+        self._remap()
+
+    def _load_meta(self) -> bool:
+        """Đọc số chiều từ meta.json do worker khác tạo (khi kho này chưa từng ghi)."""
+        if self.dimension is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("model") == self.model_name:
+                self.dimension = int(meta["dimension"])
+        return self.dimension is not None
+
+    def _catch_up(self) -> None:
+        """Đọc các khóa được ghi thêm vào keys.jsonl kể từ lần đọc trước (kể cả của worker khác)."""
+        if not os.path.exists(self.keys_path) or os.path.getsize(self.keys_path) == self._keys_offset:
+            return
+        if not self._load_meta():
+            return
+        rows = self._row_count()
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Dòng đang được ghi dở: đọc lại ở lần sau
+                self._keys_offset += len(line)
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Dòng hỏng khi tiến trình bị dừng giữa chừng
+                if item["i"] < rows:
+                    self.index[item["k"]] = item["i"]
+        self._update_full()
+
+    def _update_full(self) -> None:
+        if not self.full and len(self.index) >= self.max_entries:
+            self.full = True
+            # Embedding mới chỉ còn được cache trong bộ nhớ
+            log_event("embedding_disk_cache_full", level=logging.WARNING, directory=self.directory,
+                      max_entries=self.max_entries)
+
+    def _row_count(self) -> int:
+        if self.dimension is None or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (self.dimension * 4)
+
+    def _remap(self) -> None:
+        rows = self._row_count()
+        self._mmap = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+            if rows else None
+        )
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self.index.get(key)
+            if row is None:
+                # Có thể một worker khác vừa embed câu này
+                self._catch_up()
+                row = self.index.get(key)
+                if row is None:
+                    return None
+            if self._mmap is None or row >= self._mmap.shape[0]:
+                self._remap()
+            return np.array(self._mmap[row])
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        """Ghi nối thêm một embedding (I/O đồng bộ: gọi từ thread ghi, không gọi trên event loop)."""
+        if self.full or key in self.index:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    self._catch_up()
+                    if key in self.index or self.full:
+                        return
+                if self.dimension is None:
+                    self.dimension = int(vector.shape[0])
+                    with open(self.meta_path, "w", encoding="utf-8") as f:
+                        json.dump({"model": self.model_name, "dimension": self.dimension}, f)
+                elif vector.shape[0] != self.dimension:
+                    return
+                # Số dòng được tính lại dưới khóa vì các worker khác cũng có thể ghi nối thêm
+                row = self._row_count()
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vector.tobytes())
+                line = (json.dumps({"k": key, "i": row}, ensure_ascii=False) + "\n").encode("utf-8")
+                with open(self.keys_path, "ab") as f:
+                    offset = f.tell()
+                    f.write(line)
+                with self._lock:
+                    self.index[key] = row
+                    # Dòng vừa ghi nằm ngay sau phần đã đọc (mọi ghi đều dưới khóa file và đã đọc hết ở trên)
+                    if offset == self._keys_offset:
+                        self._keys_offset += len(line)
+                    self._update_full()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Lớp bọc quanh một model embedding, cache embedding của CÂU HỎI:
+    LRU trong bộ nhớ -> kho trên đĩa -> gọi model thật.
+
+    `embed_documents` không được cache vì tài liệu dùng loại task khác với câu hỏi
+    và chỉ được gọi khi nạp dữ liệu.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model_name: str,
+        cache_dir: Optional[str] = None,
+        max_memory_entries: int = 10_000,
+        max_disk_entries: int = 100_000,
+    ):
+        self.underlying = underlying
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = (
+            DiskEmbeddingStore(os.path.join(cache_dir, _safe_dirname(model_name)), model_name, max_disk_entries)
+            if cache_dir else None
+        )
+        # Ghi xuống đĩa (append + khóa file) chạy tuần tự trong một thread riêng, không chặn event loop
+        self._writer = (ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache-writer")
+                        if self.disk is not None else None)
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _memory_lookup(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                CACHE_EVENTS.inc(cache="embedding", result="memory_hit")
+            return vector
+
+    def _disk_lookup(self, key: str) -> Optional[np.ndarray]:
+        """
+        Tra kho trên đĩa sau khi trượt bộ nhớ. Đọc keys.jsonl/memmap là I/O đồng bộ: các hàm async gọi qua thread.
+        Khóa của cache bộ nhớ không bị giữ trong lúc đọc đĩa.
+        """
+        vector = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                CACHE_EVENTS.inc(cache="embedding", result="disk_hit")
+            else:
+                self.misses += 1
+                CACHE_EVENTS.inc(cache="embedding", result="miss")
+        return vector
+
+    def _disk_lookup_many(self, keys: List[str]) -> Dict[str, Optional[np.ndarray]]:
+        return {key: self._disk_lookup(key) for key in keys}
+
+    def _lookup(self, key: str) -> Optional[np.ndarray]:
+        vector = self._memory_lookup(key)
+        return vector if vector is not None else self._disk_lookup(key)
+
+    async def _alookup_many(self, keys: List[str]) -> Dict[str, Optional[np.ndarray]]:
+        """Như `_lookup` cho nhiều khóa; phần tra đĩa (nếu có) chạy trong MỘT lần chuyển sang thread."""
+        found = {key: self._memory_lookup(key) for key in keys}
+        missing = [key for key, vector in found.items() if vector is None]
+        if missing:
+            if self.disk is not None:
+                found.update(await asyncio.to_thread(self._disk_lookup_many, missing))
+            else:
+                found.update(self._disk_lookup_many(missing))
+        return found
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _store(self, key: str, embedding: List[float]) -> None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+        if self._writer is not None:
+            self._writer.submit(self._persist, key, vector)
+
+    def _persist(self, key: str, vector: np.ndarray) -> None:
+        try:
+            self.disk.put(key, vector)
+        except OSError as e:
+            log_event("embedding_disk_cache_write_failed", level=logging.WARNING, error=repr(e))
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self._lookup(key)
+        if vector is not None:
+            return vector.tolist()
+        embedding = self.underlying.embed_query(text)
+        self._store(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = (await self._alookup_many([key]))[key]
+        if vector is not None:
+            return vector.tolist()
+        embedding = await self.underlying.aembed_query(text)
+        self._store(key, embedding)
+        return embedding
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Như `aembed_query` cho cả lô: các câu chưa có trong cache (bỏ trùng) được embed trong một lời gọi."""
+        keys = [normalize_query(text) for text in texts]
+        found = await self._alookup_many(list(dict.fromkeys(keys)))
+        missing = {key: text for key, text in zip(keys, texts) if found[key] is None}
+        if missing:
+            embeddings = await aembed_queries(self.underlying, list(missing.values()))
+            for key, embedding in zip(missing, embeddings):
+                self._store(key, embedding)
+                found[key] = np.asarray(embedding, dtype=np.float32)
+        return [found[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.underlying.aembed_documents(texts)
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self.disk.index) if self.disk is not None else 0,
+            "disk_full": self.disk.full if self.disk is not None else False,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": ((self.memory_hits + self.disk_hits) / total) if total else 0.0,
+        }
@@ -0,0 +1,222 @@
+# app/services/embedding_service.py
+import asyncio
+import json
+import math
+import os
+import time
+import zlib
+from collections import Counter
+from typing import List, Optional
+import numpy as np
+import requests
+from langchain_core.embeddings import Embeddings
+from app.core.config import settings
+from app.services.embedding_cache import normalize_query
+
+# File ghi lại provider/model/số chiều đã dựng chỉ mục, nằm cùng thư mục với index.faiss
+INDEX_META_FILENAME = "embedding_meta.json"
+
+
+class IndexMismatchError(RuntimeError):
+    """Chỉ mục được dựng bởi một embedding provider/model/số chiều khác với cấu hình hiện tại."""
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embedding chạy hoàn toàn trên CPU, không cần mạng: chiếu các từ và n-gram ký tự
+    (sau khi chuẩn hóa NFC, chữ thường) vào `dimension` chiều bằng hàm băm có dấu,
+    trọng số tf dạng log, rồi chuẩn hóa L2.
+    """
+
+    def __init__(self, dimension: int = 512, ngram_range: tuple = (3, 5)):
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> Counter:
+        features = Counter()
+        for word in normalize_query(text).split():
+            features["w:" + word] += 1
+            padded = f" {word} "
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                for i in range(len(padded) - n + 1):
+                    features[padded[i:i + n]] += 1
+        return features
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature, count in self._features(text).items():
+            h = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            vector[h % self.dimension] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return np.stack([self._embed(t) for t in texts]).tolist() if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+
+class FakeEmbeddings(HashingEmbeddings):
+    """
+    Embedding giả lập cho benchmark offline: vector giống hệt HashingEmbeddings (tất định, dùng chung chỉ mục),
+    cộng thêm độ trễ mỗi lời gọi và mỗi văn bản để mô phỏng một API embedding từ xa.
+    """
+
+    def __init__(self, dimension: int = 512, latency_ms: float = 50.0, per_text_ms: float = 0.5):
+        super().__init__(dimension=dimension)
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+
+    def _delay(self, count: int) -> float:
+        return (self.latency_ms + self.per_text_ms * count) / 1000
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay(len(texts)))
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self._delay(1))
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return await asyncio.to_thread(HashingEmbeddings.embed_documents, self, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self._delay(1))
+        return HashingEmbeddings.embed_query(self, text)
+
+
+class HttpEmbeddings(Embeddings):
+    """
+    Client cho một dịch vụ embedding HTTP đơn giản: POST {"texts": [...]} -> {"embeddings": [...]}.
+    Dùng với máy chủ nội bộ hoặc `scripts/fake_embedding_server.py`.
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 30.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        response = self.session.post(self.endpoint, json={"texts": texts}, timeout=self.timeout)
+        if response.status_code == 429:
+            raise RuntimeError(f"429 quota exceeded: {response.text}")
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def embedding_model_name(provider: Optional[str] = None) -> str:
+    """Định danh đầy đủ của model embedding, dùng để đánh dấu chỉ mục và cache."""
+    provider = provider or settings.EMBEDDING_PROVIDER
+    if provider == "google":
+        return f"google:{settings.GEMINI_EMBEDDING_MODEL}"
+    if provider in ("hashing", "fake"):
+        # "fake" sinh đúng vector của "hashing" nên hai provider dùng chung chỉ mục
+        return f"hashing:ngram-v1-d{settings.HASHING_EMBEDDING_DIMENSION}"
+    if provider == "local":
+        return f"local:{os.path.basename(os.path.normpath(settings.LOCAL_EMBEDDING_MODEL_PATH))}"
+    if provider == "http":
+        return f"http:{settings.EMBEDDING_HTTP_ENDPOINT}"
+    raise ValueError(f"EMBEDDING_PROVIDER không hợp lệ: '{provider}'")
+
+
+def create_embeddings(provider: Optional[str] = None) -> Embeddings:
+    """Tạo model embedding theo `settings.EMBEDDING_PROVIDER`."""
+    provider = provider or settings.EMBEDDING_PROVIDER
+    if provider == "google":
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        return GoogleGenerativeAIEmbeddings(
+            model=settings.GEMINI_EMBEDDING_MODEL,
+            google_api_key=settings.GOOGLE_API_KEY
+        )
+    if provider == "hashing":
+        return HashingEmbeddings(dimension=settings.HASHING_EMBEDDING_DIMENSION)
+    if provider == "fake":
+        return FakeEmbeddings(dimension=settings.HASHING_EMBEDDING_DIMENSION,
+                              latency_ms=settings.FAKE_EMBEDDING_LATENCY_MS,
+                              per_text_ms=settings.FAKE_EMBEDDING_PER_TEXT_MS)
+    if provider == "local":
+        try:
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+        except ImportError as e:
+            raise RuntimeError("Provider 'local' cần cài thêm gói sentence-transformers.") from e
+        return HuggingFaceEmbeddings(
+            model_name=settings.LOCAL_EMBEDDING_MODEL_PATH,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"batch_size": settings.LOCAL_EMBEDDING_BATCH_SIZE, "normalize_embeddings": True},
+        )
+    if provider == "http":
+        return HttpEmbeddings(settings.EMBEDDING_HTTP_ENDPOINT)
+    raise ValueError(f"EMBEDDING_PROVIDER không hợp lệ: '{provider}'")
+
+
+def write_index_metadata(db_path: str, model_name: str, dimension: int, **extra) -> None:
+    """Ghi lại model embedding, số chiều (và các thông tin khác như loại chỉ mục) đã dùng để dựng chỉ mục."""
+    meta = {"embedding_model": model_name, "dimension": int(dimension), **extra}
+    with open(os.path.join(db_path, INDEX_META_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def read_index_metadata(db_path: str) -> dict:
+    """Đọc metadata của chỉ mục; trả về dictionary rỗng nếu chưa có."""
+    path = os.path.join(db_path, INDEX_META_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify_index_metadata(db_path: str, model_name: str, index_dimension: int) -> dict:
+    """Từ chối chỉ mục không được dựng bởi đúng model embedding hiện tại."""
+    meta = read_index_metadata(db_path)
+    if not meta:
+        raise IndexMismatchError(
+            f"Không tìm thấy '{INDEX_META_FILENAME}' trong '{db_path}'. "
+            "Hãy chạy lại `python scripts/ingest_data.py --full`."
+        )
+    if meta.get("embedding_model") != model_name:
+        raise IndexMismatchError(
+            f"Chỉ mục được dựng bằng '{meta.get('embedding_model')}' nhưng cấu hình hiện tại là '{model_name}'."
+        )
+    if meta.get("dimension") != index_dimension:
+        raise IndexMismatchError(
+            f"Số chiều của chỉ mục ({index_dimension}) không khớp với metadata ({meta.get('dimension')})."
+        )
+    return meta
+
+
+class EmbeddingService:
+    """Dịch vụ embedding bất đồng bộ dùng chung cho ứng dụng."""
+
+    def __init__(self, provider: Optional[str] = None):
+        self.provider = provider or settings.EMBEDDING_PROVIDER
+        self.model_name = embedding_model_name(self.provider)
+        self.model = create_embeddings(self.provider)
+
+    @property
+    def embedding_dimension(self) -> Optional[int]:
+        """Số chiều nếu biết trước mà không cần gọi model (chỉ với provider 'hashing'/'fake')."""
+        return getattr(self.model, "dimension", None)
+
+    async def get_embedding(self, text: str) -> List[float]:
+        return await self.model.aembed_query(text)
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self.model.aembed_documents(texts)
+
+    async def close(self):
+        session = getattr(self.model, "session", None)
+        if session is not None:
+            session.close()
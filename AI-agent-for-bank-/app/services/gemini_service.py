@@ -1,48 +1,313 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+import re
+import time
+import asyncio
+import logging
+from collections import Counter
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from app.core.config import settings
-from app.services.vector_db_service import vector_db_service
+from app.core import telemetry
+from app.core.prompts import (
+    CONDENSE_PROMPT, SUMMARY_PROMPT, estimate_tokens, format_context, format_summary, format_turns,
+    tenant_system_prompt
+)
+from app.core.telemetry import CACHE_EVENTS, ERRORS, TOKENS, log_event, record_stage, span
+from app.schemas.tenant import TenantConfig
+from app.services.vector_db_service import VectorDBService, docs_to_chunks
+from app.services.answer_cache_service import create_answer_cache
+from app.services.context_packer import pack_context
+from app.services.request_coalescer import RequestCoalescer
+from app.services.chat_model import create_chat_model
+from app.services.resilient_generation import (
+    GENERATION_FALLBACK_MESSAGE, GenerationUnavailable, create_resilient_generator
+)
+
+
+def history_to_messages(history: list) -> list:
+    """Chuyển lịch sử chat của client thành danh sách message cho prompt (không lưu trạng thái)."""
+    messages = []
+    for message in history:
+        if message.role == 'user':
+            messages.append(HumanMessage(content=message.content))
+        elif message.role == 'ai':
+            messages.append(AIMessage(content=message.content))
+    return messages
+
+
+# Dấu hiệu câu hỏi nối tiếp phụ thuộc lượt trước: đại từ/chỉ từ tham chiếu, hoặc mở đầu kiểu "Còn ... thì sao?"
+_FOLLOWUP_RE = re.compile(
+    r"\b(nó|đó|kia|ấy|này|họ|như vậy|như thế|cái đó|thì sao)\b"
+    r"|^(còn|vậy|thế|và|nhưng|nếu vậy|nếu thế)\b"
+)
+# Câu hỏi quá ngắn (vd. "Phí bao nhiêu?") thường thiếu chủ ngữ
+FOLLOWUP_MIN_WORDS = 4
+
+
+def needs_condensing(question: str) -> bool:
+    """Heuristic rẻ (không gọi model): câu hỏi ngắn hoặc có từ tham chiếu lượt trước thì cần viết lại."""
+    text = question.strip().lower()
+    return len(text.split()) < FOLLOWUP_MIN_WORDS or _FOLLOWUP_RE.search(text) is not None
+
+
+def _normalize_query(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def coalescing_key(question: str, history: list, summary: str = "") -> tuple:
+    """Khóa gộp request: câu hỏi và lịch sử đã chuẩn hóa (chữ thường, bỏ dấu câu, gộp khoảng trắng)."""
+    return (_normalize_query(question),
+            tuple((message.role, _normalize_query(message.content)) for message in history),
+            summary)
+
+
+def _round_timings(timings: dict) -> dict:
+    return {name: round(value, 1) for name, value in timings.items()}
+
 
 class GeminiService:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model=settings.CHAT_MODEL_NAME,
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=0.3,
-            convert_system_message_to_human=True
-        )
-        self.retriever = vector_db_service.get_retriever()
-
-    async def stream_response(self, question: str, history: list):
+    def __init__(self, vector_db_service: VectorDBService, tenant: Optional[TenantConfig] = None):
+        """`tenant` (nếu có) đặt ngân hàng, ngôn ngữ, mẫu lời nhắn và model chat riêng; mặc định dùng cấu hình chung."""
+        started = time.perf_counter()
+        self.vector_db_service = vector_db_service
+        self.tenant = tenant
+        model_name = (tenant.chat_model_name if tenant else None) or settings.CHAT_MODEL_NAME
+        temperature = tenant.temperature if tenant else 0.3
+        self.llm = create_chat_model(model_name, temperature=temperature)
+        self.system_prompt = tenant_system_prompt(tenant)
+        self.language = tenant.language if tenant else settings.ANSWER_LANGUAGE
+
+        # Pipeline RAG được dựng MỘT LẦN và dùng chung cho mọi request:
+        # retrieve -> prompt -> generate. Lịch sử chat được truyền vào như input thuần,
+        # nên không cần tạo memory hay chain mới cho từng lượt hỏi.
+        self.prompt = ChatPromptTemplate.from_messages([
+            # Dấu ngoặc nhọn trong lời nhắn của tenant là chữ thường, không phải biến của template
+            ("system", self.system_prompt.replace("{", "{{").replace("}", "}}") + "{context}{summary}"),
+            MessagesPlaceholder(variable_name="history"),
+            ("human", "Câu hỏi của khách hàng: {question}"),
+        ])
+        # Chain prompt | model của từng provider; khi sinh có hạn chót token đầu, hedge sang provider dự phòng
+        # và circuit breaker (xem resilient_generation)
+        self.generator = create_resilient_generator(self.prompt, self.llm, model_name, temperature)
+
+        # Chain tóm tắt dần lịch sử hội thoại (có thể dùng model nhỏ hơn qua SUMMARY_MODEL_NAME)
+        summary_llm = self.llm
+        if settings.SUMMARY_MODEL_NAME and settings.SUMMARY_MODEL_NAME != model_name:
+            summary_llm = create_chat_model(settings.SUMMARY_MODEL_NAME, temperature=0.0)
+        self.summary_chain = ChatPromptTemplate.from_template(SUMMARY_PROMPT) | summary_llm | StrOutputParser()
+
+        # Chain viết lại câu hỏi nối tiếp thành câu hỏi độc lập (chỉ phục vụ truy xuất, nên dùng model nhỏ)
+        condense_llm = self.llm
+        if settings.CONDENSE_MODEL_NAME and settings.CONDENSE_MODEL_NAME != model_name:
+            condense_llm = create_chat_model(settings.CONDENSE_MODEL_NAME, temperature=0.0)
+        self.condense_chain = ChatPromptTemplate.from_template(CONDENSE_PROMPT) | condense_llm | StrOutputParser()
+        self.condense_mode = settings.CONDENSE_MODE
+        self.speculative_retrieval = settings.SPECULATIVE_RETRIEVAL_ENABLED
+        self.condense_stats = Counter()
+
+        # Cache câu trả lời đặt phía trước pipeline, tự xóa khi vector store được dựng lại
+        self.answer_cache = create_answer_cache(vector_db_service.index_version)
+        # Các request giống hệt nhau đang chạy cùng lúc dùng chung một lần truy xuất + sinh câu trả lời
+        self.coalescer = RequestCoalescer() if settings.COALESCE_REQUESTS_ENABLED else None
+        print(f"✅ Pipeline RAG đã sẵn sàng sau {(time.perf_counter() - started) * 1000:.1f} ms.")
+
+    async def retrieve(self, question: str, query_embedding=None) -> List[Dict[str, Any]]:
+        """Truy xuất các đoạn ngữ cảnh liên quan tới câu hỏi (BM25 + FAISS)."""
+        docs = await self.vector_db_service.search(question, query_embedding=query_embedding)
+        return docs_to_chunks(docs)
+
+    async def summarize(self, summary: str, messages: list) -> str:
+        """Cập nhật bản tóm tắt hội thoại với các lượt vừa bị đẩy ra khỏi cửa sổ lịch sử."""
+        return await self.summary_chain.ainvoke({
+            "summary": summary or "(chưa có)",
+            "turns": format_turns(messages),
+            "max_words": settings.SUMMARY_MAX_TOKENS // 2,
+            "language": self.language,
+        })
+
+    async def condense_question(self, question: str, history: list, summary: str = "") -> str:
+        """Viết lại câu hỏi nối tiếp thành câu hỏi độc lập dựa trên vài lượt gần nhất và bản tóm tắt."""
+        recent = history[-settings.CONDENSE_HISTORY_MESSAGES:] if settings.CONDENSE_HISTORY_MESSAGES else []
+        rewritten = await asyncio.wait_for(self.condense_chain.ainvoke({
+            "summary": format_summary(summary),
+            "turns": format_turns(recent) or "(chưa có)",
+            "question": question,
+        }), settings.CONDENSE_TIMEOUT_SECONDS)
+        return rewritten.strip() or question
+
+    async def retrieve_for_turn(self, question: str, history: list, summary: str,
+                                timings: dict) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Truy xuất cho một lượt hỏi có lịch sử. Câu hỏi độc lập (theo heuristic) được truy xuất ngay;
+        câu hỏi nối tiếp được viết lại trước, trong lúc đó truy xuất theo câu hỏi gốc chạy song song
+        và được giữ lại nếu câu hỏi viết lại trùng câu gốc hoặc truy xuất ra đúng các đoạn đó.
+        Trả về (các đoạn ngữ cảnh, câu truy vấn đã dùng).
+        """
+        if self.condense_mode == "off" or (self.condense_mode == "auto" and not needs_condensing(question)):
+            self.condense_stats["standalone"] += 1
+            return await self.retrieve(question), question
+
+        speculative = asyncio.create_task(self.retrieve(question)) if self.speculative_retrieval else None
+        try:
+            condense_started = time.perf_counter()
+            try:
+                with span("condense"):
+                    rewritten = await self.condense_question(question, history, summary)
+                self.condense_stats["rewritten"] += 1
+            except Exception as e:
+                # Viết lại thất bại/quá hạn không được làm hỏng lượt hỏi: truy xuất theo câu hỏi gốc
+                log_event("condense_failed", level=logging.WARNING, error=repr(e))
+                self.condense_stats["condense_failed"] += 1
+                rewritten = question
+            timings["condense_ms"] = (time.perf_counter() - condense_started) * 1000
+
+            if _normalize_query(rewritten) == _normalize_query(question):
+                if speculative is None:
+                    return await self.retrieve(question), question
+                self.condense_stats["speculative_kept"] += 1
+                return await speculative, question
+
+            chunks = await self.retrieve(rewritten)
+            if speculative is not None:
+                speculative_chunks = await speculative
+                if {c["text"] for c in speculative_chunks} == {c["text"] for c in chunks}:
+                    self.condense_stats["speculative_kept"] += 1
+                    return speculative_chunks, rewritten
+                self.condense_stats["speculative_discarded"] += 1
+            return chunks, rewritten
+        finally:
+            if speculative is not None and not speculative.done():
+                speculative.cancel()
+
+    async def stream_events(self, question: str, history: list, summary: str = "",
+                            on_coalesced: Optional[Callable[[], None]] = None,
+                            hand_off: Optional[Callable[[], Callable[[], None]]] = None):
+        """
+        Các sự kiện của `_pipeline_events` cho một request. Khi một request giống hệt (cùng `coalescing_key`)
+        đang chạy, request này nhận lại các sự kiện nó đã phát rồi phần còn lại, thay vì truy xuất và gọi model
+        lần nữa; khi đó `on_coalesced()` được gọi ngay và sự kiện "done" có thêm `"coalesced": True`.
+        Ngắt stream chỉ rời khỏi luồng chung; pipeline bị hủy khi không còn request nào nghe.
+        Request mở luồng chung chuyển suất xử lý của mình cho luồng qua `hand_off()` (xem RequestCoalescer.stream).
+        """
+        if self.coalescer is None:
+            events, joined = self._pipeline_events(question, history, summary), False
+        else:
+            events, joined = self.coalescer.stream(coalescing_key(question, history, summary),
+                                                   lambda: self._pipeline_events(question, history, summary),
+                                                   hand_off)
+            CACHE_EVENTS.inc(cache="in_flight", result="hit" if joined else "miss")
+        if joined and on_coalesced is not None:
+            on_coalesced()
+        try:
+            async for event, data in events:
+                if joined and event == "done":
+                    data = {**data, "coalesced": True}
+                yield event, data
+        finally:
+            await events.aclose()
+
+    async def _pipeline_events(self, question: str, history: list, summary: str = ""):
         """
-        Tạo và thực thi chuỗi RAG để stream câu trả lời.
+        Thực thi pipeline RAG dùng chung, phát ra các sự kiện theo thứ tự:
+        ("sources", [tên file]) ngay sau bước truy xuất, ("token", text) cho từng phần câu trả lời
+        ngay khi model sinh ra, và ("done", {...}) kèm thời gian từng giai đoạn.
+        `history` là các lượt gần nhất (đã giới hạn theo ngân sách token), `summary` tóm tắt các lượt cũ hơn.
+        Câu hỏi không kèm lịch sử được tra trong cache câu trả lời trước khi gọi Gemini;
+        câu hỏi nối tiếp được viết lại thành câu độc lập cho bước truy xuất (xem `retrieve_for_turn`).
         """
-        memory = ConversationBufferMemory(
-            memory_key='chat_history',
-            return_messages=True
-        )
-        
-        # Nạp lịch sử chat vào memory
-        for message in history:
-            # ✅ THAY ĐỔI: Sử dụng dấu chấm (.) để truy cập thuộc tính của đối tượng
-            if message.role == 'user':
-                memory.chat_memory.add_user_message(message.content)
-            elif message.role == 'ai':
-                memory.chat_memory.add_ai_message(message.content)
-
-        chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.retriever,
-            memory=memory,
-        )
-        
-        # Sử dụng astream để nhận các chunk một cách bất đồng bộ
-        async for chunk in chain.astream({"question": question}):
-            # Chuỗi này trả về một dictionary, ta cần lấy ra phần 'answer'
-            if "answer" in chunk:
-                yield chunk["answer"]
-
-# Tạo một instance duy nhất
-gemini_service = GeminiService()
+        started = time.perf_counter()
+        timings = {}
+        query_embedding = None
+        use_answer_cache = self.answer_cache is not None and not history and not summary
+        if use_answer_cache:
+            # Phiên bản vector store trước khi truy xuất: câu trả lời chỉ được lưu nếu vẫn đúng phiên bản này
+            index_version = self.vector_db_service.index_version()
+            # Thứ tự từ rẻ tới đắt: câu hỏi lặp nguyên văn, đường tắt BM25 (không embed), rồi mới embed
+            # để tra cache theo ngữ nghĩa và truy xuất lai
+            lexical_docs = None
+            cached = self.answer_cache.lookup_text(question)
+            if cached is None:
+                lexical_docs = self.vector_db_service.lexical_fastpath(question)
+                if lexical_docs is None:
+                    with span("embedding"):
+                        query_embedding = await self.vector_db_service.embed_query(question)
+                    cached = self.answer_cache.lookup(query_embedding)
+            CACHE_EVENTS.inc(cache="answer", result="miss" if cached is None else "hit")
+            if cached is not None:
+                timings["total_ms"] = (time.perf_counter() - started) * 1000
+                yield "sources", cached.sources
+                yield "token", cached.answer
+                yield "done", {"cached": True, "timings_ms": _round_timings(timings)}
+                return
+            if lexical_docs is not None:
+                context_chunks = docs_to_chunks(lexical_docs)
+            else:
+                context_chunks = await self.retrieve(question, query_embedding)
+        elif history or summary:
+            context_chunks, _ = await self.retrieve_for_turn(question, history, summary, timings)
+        else:
+            context_chunks = await self.retrieve(question)
+        timings["retrieval_ms"] = (time.perf_counter() - started) * 1000
+        record_stage("retrieval", timings["retrieval_ms"] / 1000, started)
+        if settings.CONTEXT_PACKING_ENABLED:
+            with span("context_packing"):
+                context_chunks = pack_context(context_chunks)
+        sources = sorted({chunk["source"] for chunk in context_chunks})
+        yield "sources", sources
+
+        inputs = {
+            "context": format_context(context_chunks),
+            "summary": format_summary(summary),
+            "history": history_to_messages(history),
+            "question": question,
+        }
+        if telemetry.ENABLED:
+            TOKENS.inc(estimate_tokens(self.system_prompt + inputs["context"] + inputs["summary"] + question)
+                       + sum(estimate_tokens(message.content) for message in history), direction="in")
+
+        answer_parts = []
+        generation = {}
+        generation_started = time.perf_counter()
+        try:
+            # Sử dụng astream để nhận các chunk một cách bất đồng bộ và chuyển tiếp ngay, không gom lại
+            async for chunk in self.generator.astream(inputs, generation):
+                if chunk:
+                    if not answer_parts:
+                        timings["first_token_ms"] = (time.perf_counter() - started) * 1000
+                        # Thời gian chờ token đầu tiên của model (không tính truy xuất)
+                        record_stage("first_token", time.perf_counter() - generation_started, generation_started)
+                    answer_parts.append(chunk)
+                    yield "token", chunk
+        except GenerationUnavailable as e:
+            # Không provider nào kịp trả lời: báo khách thay vì để trống (và không lưu vào cache)
+            ERRORS.inc(stage="generation")
+            log_event("generation_unavailable", level=logging.WARNING, error=str(e))
+            timings["total_ms"] = (time.perf_counter() - started) * 1000
+            yield "token", GENERATION_FALLBACK_MESSAGE
+            yield "done", {"cached": False, "degraded": True, "timings_ms": _round_timings(timings)}
+            return
+        except Exception:
+            ERRORS.inc(stage="generation")
+            raise
+        timings["generation_ms"] = (time.perf_counter() - generation_started) * 1000
+        timings["total_ms"] = (time.perf_counter() - started) * 1000
+        record_stage("generation", timings["generation_ms"] / 1000, generation_started)
+        answer = "".join(answer_parts)
+        if telemetry.ENABLED:
+            TOKENS.inc(estimate_tokens(answer), direction="out")
+
+        # Chỉ lưu vào cache khi câu trả lời đã được sinh trọn vẹn
+        if use_answer_cache:
+            # Câu hỏi đi đường tắt BM25 không có embedding: chỉ tra lại được khi hỏi nguyên văn
+            self.answer_cache.store(question, query_embedding, answer, version=index_version, sources=sources)
+        yield "done", {"cached": False, "provider": generation.get("provider"),
+                       "hedged": generation.get("hedged", False), "timings_ms": _round_timings(timings)}
 
+    async def stream_response(self, question: str, history: list, summary: str = "",
+                              on_coalesced: Optional[Callable[[], None]] = None,
+                              hand_off: Optional[Callable[[], Callable[[], None]]] = None):
+        """Chỉ stream phần văn bản của câu trả lời (chế độ text/plain)."""
+        async for event, data in self.stream_events(question, history, summary, on_coalesced, hand_off):
+            if event == "token":
+                yield data
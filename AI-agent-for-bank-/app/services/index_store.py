@@ -0,0 +1,174 @@
+# app/services/index_store.py
+"""
+Định dạng lưu trữ chỉ mục không dùng pickle:
+- `index.faiss`        : chỉ mục FAISS (flat, flat_fp16, ivf, hnsw, ivfpq), được memory-map khi phục vụ.
+- `docs.bin`           : nội dung + metadata của từng chunk (mỗi bản ghi là JSON UTF-8, nối liền nhau).
+- `docs.offsets.npy`   : vị trí byte bắt đầu của từng bản ghi (n + 1 phần tử, int64).
+- `ids.npy`            : ID ổn định của từng chunk (dùng khi nạp dữ liệu tăng dần).
+- `vectors.npy`        : vector float32 gốc, chỉ dùng khi nạp lại để dựng chỉ mục mà không phải embed lại.
+Dòng thứ i trong FAISS ứng với bản ghi thứ i trong docstore.
+"""
+import json
+import math
+import mmap
+import os
+from typing import Iterable, List, Tuple
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+FAISS_FILENAME = "index.faiss"
+DOCS_FILENAME = "docs.bin"
+OFFSETS_FILENAME = "docs.offsets.npy"
+IDS_FILENAME = "ids.npy"
+VECTORS_FILENAME = "vectors.npy"
+
+INDEX_TYPES = ("flat", "flat_fp16", "ivf", "hnsw", "ivfpq")
+# FAISS khuyến nghị tối thiểu ~39 điểm huấn luyện cho mỗi centroid
+MIN_POINTS_PER_CENTROID = 39
+# Giới hạn số vector dùng để huấn luyện IVF/PQ (lấy mẫu ngẫu nhiên) để thời gian dựng chỉ mục không tăng vô hạn
+MAX_TRAINING_POINTS = 65536
+
+
+class MmapDocstore:
+    """Docstore chỉ đọc, memory-map `docs.bin` và chỉ giải mã bản ghi khi được truy cập."""
+
+    def __init__(self, db_path: str):
+        self._offsets = np.load(os.path.join(db_path, OFFSETS_FILENAME), mmap_mode="r")
+        self._file = open(os.path.join(db_path, DOCS_FILENAME), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def get(self, row: int) -> Document:
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        record = json.loads(self._blob[start:end])
+        return Document(page_content=record["t"], metadata=record["m"])
+
+    def close(self) -> None:
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+
+def _replace_atomic(path: str, write) -> None:
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _save_npy(array: np.ndarray):
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+    return write
+
+
+def write_docstore(db_path: str, docs: Iterable[Tuple[str, dict]]) -> int:
+    """Ghi docstore; trả về số bản ghi."""
+    offsets = [0]
+
+    def write_blob(tmp_path):
+        with open(tmp_path, "wb") as f:
+            for text, metadata in docs:
+                data = json.dumps({"t": text, "m": metadata}, ensure_ascii=False).encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+
+    _replace_atomic(os.path.join(db_path, DOCS_FILENAME), write_blob)
+    _replace_atomic(os.path.join(db_path, OFFSETS_FILENAME), _save_npy(np.asarray(offsets, dtype=np.int64)))
+    return len(offsets) - 1
+
+
+def read_docs(db_path: str) -> List[Tuple[str, dict]]:
+    """Đọc toàn bộ docstore (chỉ dùng khi nạp dữ liệu)."""
+    store = MmapDocstore(db_path)
+    try:
+        return [(doc.page_content, doc.metadata) for doc in (store.get(i) for i in range(len(store)))]
+    finally:
+        store.close()
+
+
+def write_arrays(db_path: str, ids: List[str], vectors: np.ndarray) -> None:
+    _replace_atomic(os.path.join(db_path, IDS_FILENAME), _save_npy(np.asarray(ids, dtype="S32")))
+    _replace_atomic(os.path.join(db_path, VECTORS_FILENAME),
+                    _save_npy(np.ascontiguousarray(vectors, dtype=np.float32)))
+
+
+def read_arrays(db_path: str) -> Tuple[List[str], np.ndarray]:
+    ids = np.load(os.path.join(db_path, IDS_FILENAME))
+    vectors = np.load(os.path.join(db_path, VECTORS_FILENAME), mmap_mode="r")
+    return [i.decode("ascii") for i in ids], vectors
+
+
+def store_exists(db_path: str) -> bool:
+    return all(os.path.exists(os.path.join(db_path, name))
+               for name in (FAISS_FILENAME, DOCS_FILENAME, OFFSETS_FILENAME, IDS_FILENAME, VECTORS_FILENAME))
+
+
+def index_factory_string(index_type: str, count: int, dimension: int,
+                         hnsw_m: int = 32, pq_bits: int = 8) -> str:
+    """
+    Chọn chuỗi index_factory của FAISS theo loại chỉ mục và kích thước corpus.
+    Corpus quá nhỏ để huấn luyện IVF/PQ sẽ được hạ xuống loại phẳng tương ứng.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"FAISS_INDEX_TYPE không hợp lệ: '{index_type}' (hỗ trợ: {', '.join(INDEX_TYPES)})")
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "flat_fp16":
+        return "SQfp16"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+
+    nlist = min(int(4 * math.sqrt(count)), count // MIN_POINTS_PER_CENTROID)
+    if nlist < 4:
+        print(f"ℹ️ Corpus chỉ có {count} đoạn, chưa đủ để huấn luyện '{index_type}', dùng chỉ mục phẳng.")
+        return "Flat" if index_type == "ivf" else "SQfp16"
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+
+    if count < MIN_POINTS_PER_CENTROID * (2 ** pq_bits):
+        print(f"ℹ️ Corpus chỉ có {count} đoạn, chưa đủ để huấn luyện PQ, dùng IVF với vector float16.")
+        return f"IVF{nlist},SQfp16"
+    # Số sub-quantizer: mỗi phần ~8 chiều (ước của số chiều gần nhất)
+    m = min((d for d in range(1, dimension + 1) if dimension % d == 0), key=lambda d: abs(dimension // d - 8))
+    return f"IVF{nlist},PQ{m}x{pq_bits}"
+
+
+def build_faiss_index(vectors: np.ndarray, factory: str) -> faiss.Index:
+    """Huấn luyện (nếu cần) và thêm toàn bộ vector vào một chỉ mục mới."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if not index.is_trained:
+        training = vectors
+        if len(vectors) > MAX_TRAINING_POINTS:
+            sample = np.random.default_rng(0).choice(len(vectors), MAX_TRAINING_POINTS, replace=False)
+            training = vectors[np.sort(sample)]
+        index.train(training)
+    index.add(vectors)
+    return index
+
+
+def write_faiss_index(db_path: str, index: faiss.Index) -> None:
+    _replace_atomic(os.path.join(db_path, FAISS_FILENAME), lambda tmp: faiss.write_index(index, tmp))
+
+
+def load_faiss_index(db_path: str, nprobe: int = 8, ef_search: int = 64) -> faiss.Index:
+    """Đọc chỉ mục ở chế độ memory-map chỉ đọc (nếu FAISS hỗ trợ), rồi cấu hình tham số tìm kiếm."""
+    path = os.path.join(db_path, FAISS_FILENAME)
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None) or getattr(faiss, "IO_FLAG_MMAP", 0)
+    try:
+        index = faiss.read_index(path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(path)
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+    return index
+
@@ -0,0 +1,129 @@
+# app/services/lexical_index.py
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BM25_FILENAME = "bm25.json"
+
+# Tách theo âm tiết: tiếng Việt viết cách nhau từng âm tiết nên \w+ là đủ; ghép thêm
+# bigram âm tiết để giữ được các từ ghép như "thường_niên", "tín_dụng".
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Một số hư từ rất phổ biến, chỉ loại khỏi unigram (vẫn giữ trong bigram)
+VIETNAMESE_STOPWORDS = {
+    "là", "của", "và", "có", "không", "được", "cho", "các", "những", "một", "này", "với",
+    "thì", "gì", "nào", "tôi", "bạn", "em", "anh", "chị", "ạ", "à", "ơi", "nhé", "vậy",
+    "thế", "để", "khi", "bao", "nhiêu", "làm", "sao", "ở", "đâu", "hay", "hoặc", "muốn",
+}
+
+
+def _syllables(text: str) -> List[str]:
+    return _TOKEN_RE.findall(unicodedata.normalize("NFC", text).casefold())
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenizer cho tiếng Việt: chuẩn hóa NFC, chữ thường, unigram âm tiết (bỏ hư từ) + bigram âm tiết."""
+    syllables = _syllables(text)
+    tokens = [s for s in syllables if s not in VIETNAMESE_STOPWORDS]
+    tokens.extend(f"{a}_{b}" for a, b in zip(syllables, syllables[1:]))
+    return tokens
+
+
+class BM25Index:
+    """
+    Chỉ mục đảo BM25 trên cùng các chunk với FAISS.
+    `doc_ids` là số dòng của từng chunk trong docstore (trùng với số dòng trong FAISS).
+    """
+
+    def __init__(self, doc_ids: List[int], doc_lengths: List[int], postings: Dict[str, List[List[int]]],
+                 k1: float = 1.5, b: float = 0.75):
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avgdl = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+        n = len(doc_ids)
+        self.idf = {
+            term: math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in postings.items()
+        }
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[int, str]]) -> "BM25Index":
+        """Dựng chỉ mục từ danh sách (số dòng trong docstore, nội dung)."""
+        doc_ids, doc_lengths = [], []
+        postings = defaultdict(list)
+        for doc_idx, (doc_id, text) in enumerate(documents):
+            counts = Counter(tokenize(text))
+            doc_ids.append(doc_id)
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append([doc_idx, tf])
+        return cls(doc_ids, doc_lengths, dict(postings))
+
+    def search(self, query: str, k: int = 20) -> Tuple[List[Tuple[int, float]], float]:
+        """
+        Trả về ([(số dòng, điểm BM25)], độ phủ) — độ phủ là tỷ lệ âm tiết có nghĩa
+        (không phải hư từ) của câu hỏi xuất hiện trong chunk đứng đầu.
+        """
+        keywords = {s for s in _syllables(query) if s not in VIETNAMESE_STOPWORDS}
+        terms = [t for t in set(tokenize(query)) if t in self.postings]
+        if not terms:
+            return [], 0.0
+        scores = defaultdict(float)
+        matched = defaultdict(int)
+        for term in terms:
+            idf = self.idf[term]
+            is_keyword = term in keywords
+            for doc_idx, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_idx] / self.avgdl)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+                if is_keyword:
+                    matched[doc_idx] += 1
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        coverage = matched[ranked[0][0]] / len(keywords) if keywords else 0.0
+        return [(self.doc_ids[i], score) for i, score in ranked], coverage
+
+    def save(self, db_path: str) -> None:
+        path = os.path.join(db_path, BM25_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"doc_ids": self.doc_ids, "doc_lengths": self.doc_lengths,
+                       "postings": self.postings, "k1": self.k1, "b": self.b}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, db_path: str) -> Optional["BM25Index"]:
+        path = os.path.join(db_path, BM25_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["doc_ids"], data["doc_lengths"], data["postings"], data["k1"], data["b"])
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[int]:
+    """Gộp nhiều bảng xếp hạng theo Reciprocal Rank Fusion: điểm = tổng 1 / (k + hạng)."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def is_confident(results: List[Tuple[int, float]], coverage: float,
+                 min_coverage: float, min_margin: float) -> bool:
+    """
+    Kết quả từ khóa đủ chắc chắn để bỏ qua embedding khi chunk đứng đầu chứa gần như
+    mọi thuật ngữ của câu hỏi và vượt trội rõ rệt so với chunk thứ hai.
+    """
+    if not results or coverage < min_coverage:
+        return False
+    if len(results) == 1:
+        return True
+    return results[0][1] >= min_margin * results[1][1]
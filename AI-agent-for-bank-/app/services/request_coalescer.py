@@ -0,0 +1,123 @@
+# app/services/request_coalescer.py
+"""
+Gộp các request chat giống hệt nhau đang chạy cùng lúc (single-flight).
+
+Request đầu tiên với một khóa (câu hỏi + lịch sử đã chuẩn hóa) chạy pipeline RAG trong một task riêng;
+các request trùng khóa tới khi pipeline còn đang chạy đăng ký vào CÙNG luồng sự kiện đó thay vì tự truy xuất
+và gọi Gemini lần nữa. Mỗi người đăng ký nhận lại các sự kiện đã phát (sources, các token đã sinh) rồi tiếp tục
+nhận phần còn lại ngay khi có.
+
+- Một người đăng ký ngắt kết nối chỉ rời khỏi luồng, không làm hủy luồng của những người khác;
+  khi người đăng ký cuối cùng rời đi, pipeline mới bị hủy.
+- Luồng chung giữ MỘT suất xử lý (và lease tenant) do request mở luồng chuyển giao (`hand_off`), trả khi pipeline
+  kết thúc, kể cả khi chính request đó đã ngắt kết nối; các request tham gia sau trả suất của mình ngay.
+- Khi pipeline kết thúc (xong hoặc lỗi), khóa được gỡ ngay: request tới sau chạy lại từ đầu
+  (hoặc trúng cache câu trả lời). Lỗi được trả cho mọi người đăng ký.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple
+
+Event = Tuple[str, Any]
+
+
+class InFlightStream:
+    """Một lần chạy pipeline và các sự kiện nó đã phát, phát lại cho mọi người đăng ký."""
+
+    def __init__(self, key: Hashable, source: AsyncIterator[Event], on_finish: Callable[["InFlightStream"], None],
+                 release: Optional[Callable[[], None]] = None):
+        self.key = key
+        self.events: List[Event] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self._on_finish = on_finish
+        self._task = asyncio.get_running_loop().create_task(self._pump(source))
+        if release is not None:
+            # Callback của task thay vì finally trong _pump: task bị hủy trước khi kịp chạy không vào finally
+            self._task.add_done_callback(lambda _: release())
+
+    async def _pump(self, source: AsyncIterator[Event]) -> None:
+        try:
+            try:
+                async for event in source:
+                    self.events.append(event)
+                    self._notify()
+            finally:
+                await source.aclose()
+        except asyncio.CancelledError as e:
+            self.error = e
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._on_finish(self)
+            self._notify()
+
+    def _notify(self) -> None:
+        # Đánh thức mọi người đăng ký đang chờ rồi tạo Event mới cho lần chờ sau
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Event]:
+        """
+        Các sự kiện từ đầu luồng rồi phần tiếp theo khi có.
+        Người đăng ký đã được đếm từ lúc gọi `RequestCoalescer.stream`, trước khi bắt đầu đọc.
+        """
+        position = 0
+        try:
+            while True:
+                if position < len(self.events):
+                    event = self.events[position]
+                    position += 1
+                    yield event
+                elif self.finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished:
+                # Không còn ai nghe: dừng truy xuất/sinh câu trả lời; request trùng tới sau mở luồng mới
+                self._on_finish(self)
+                self._task.cancel()
+
+
+class RequestCoalescer:
+    """Bảng các luồng đang chạy theo khóa; `stream(key, factory)` tham gia luồng có sẵn hoặc mở luồng mới."""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, InFlightStream] = {}
+        self.started = 0
+        self.joined = 0
+
+    def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[Event]],
+               hand_off: Optional[Callable[[], Callable[[], None]]] = None) -> Tuple[AsyncIterator[Event], bool]:
+        """
+        Đăng ký vào luồng đang chạy với `key`, hoặc mở luồng mới từ `factory()` (pipeline RAG).
+        Khi mở luồng mới, `hand_off()` chuyển tài nguyên của request (suất xử lý, lease) cho luồng;
+        hàm nó trả về được gọi khi pipeline kết thúc.
+        Trả về (các sự kiện, True nếu đã tham gia một luồng có sẵn).
+        """
+        flight = self._in_flight.get(key)
+        joined = flight is not None
+        if joined:
+            self.joined += 1
+        else:
+            flight = self._in_flight[key] = InFlightStream(key, factory(), self._finish,
+                                                           hand_off() if hand_off is not None else None)
+            self.started += 1
+        flight.subscribers += 1
+        return flight.subscribe(), joined
+
+    def _finish(self, flight: InFlightStream) -> None:
+        if self._in_flight.get(flight.key) is flight:
+            del self._in_flight[flight.key]
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._in_flight), "started": self.started, "joined": self.joined}
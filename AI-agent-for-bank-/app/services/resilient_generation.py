@@ -0,0 +1,288 @@
+# app/services/resilient_generation.py
+"""
+Sinh câu trả lời bền vững trước provider chậm hoặc lỗi.
+
+- Hạn chót cho token đầu (FIRST_TOKEN_TIMEOUT_SECONDS): quá hạn mà chưa provider nào trả token thì dừng,
+  GeminiService trả lời khách bằng thông báo dự phòng thay vì để bubble trống.
+- Hedging: nếu provider chính chưa trả token đầu sau phân vị HEDGE_PERCENTILE độ trễ token đầu của chính nó,
+  gửi thêm một request tới provider dự phòng (FALLBACK_CHAT_PROVIDER, vd. Ollama chạy tại chỗ);
+  stream nào ra token đầu trước thắng, stream còn lại bị hủy.
+- Failover: provider lỗi trước token đầu thì chuyển ngay sang provider kế tiếp.
+- Circuit breaker cho từng provider: CIRCUIT_FAILURE_THRESHOLD lỗi liên tiếp thì ngắt, bỏ qua provider đó
+  trong CIRCUIT_RESET_SECONDS, sau đó cho một request thử để quyết định đóng lại hay ngắt tiếp.
+Lỗi xảy ra sau token đầu không thể chuyển provider (khách đã nhận một phần câu trả lời) nên được ném ra như cũ.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from app.core.config import settings
+from app.core.telemetry import GENERATION_ATTEMPTS, log_event
+from app.services.chat_model import create_chat_model
+
+# Trả cho khách khi không provider nào trả được token đầu trước hạn chót
+GENERATION_FALLBACK_MESSAGE = (
+    "Xin lỗi, hệ thống đang bận nên chưa thể trả lời ngay. "
+    "Quý khách vui lòng thử lại sau ít phút hoặc liên hệ hotline của ngân hàng để được hỗ trợ."
+)
+
+
+class GenerationUnavailable(RuntimeError):
+    """Không provider nào trả được token đầu (lỗi, quá hạn hoặc đang bị ngắt mạch)."""
+
+
+class CircuitBreaker:
+    """
+    closed --(failure_threshold lỗi liên tiếp)--> open --(sau reset_seconds)--> half_open:
+    cho đúng một request thử; thành công thì closed, lỗi thì open lại.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Có được gửi request tới provider không (ở half_open, lời gọi này giữ suất thử duy nhất)."""
+        if self.state == "open":
+            if self.clock() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = "half_open"
+            self._probe_in_flight = False
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                log_event("circuit_opened", level=logging.WARNING, provider=self.name,
+                          failures=self.failures, reset_seconds=self.reset_seconds)
+            self.state = "open"
+            self.opened_at = self.clock()
+
+    def record_cancelled(self) -> None:
+        """Request bị hủy (thua hedge) không nói gì về sức khỏe provider: chỉ trả lại suất thử."""
+        self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """Cửa sổ trượt các độ trễ token đầu gần nhất của một provider."""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class ChatProvider:
+    """Một chain prompt | model | parser kèm circuit breaker và thống kê độ trễ riêng."""
+
+    def __init__(self, name: str, chain, breaker: CircuitBreaker, latency: Optional[LatencyTracker] = None):
+        self.name = name
+        self.chain = chain
+        self.breaker = breaker
+        self.latency = latency or LatencyTracker()
+
+
+async def _first_chunk(iterator: AsyncIterator[str]) -> str:
+    """Chunk có nội dung đầu tiên ("" nếu model trả lời rỗng)."""
+    async for chunk in iterator:
+        if chunk:
+            return chunk
+    return ""
+
+
+class ResilientGenerator:
+    """Stream câu trả lời từ provider nhanh nhất còn khỏe trong danh sách (provider chính đứng đầu)."""
+
+    def __init__(self, providers: List[ChatProvider], first_token_timeout: float, hedge_enabled: bool = True,
+                 hedge_percentile: float = 95, hedge_default_delay: float = 2.0, hedge_min_delay: float = 0.2,
+                 hedge_min_samples: int = 20):
+        self.providers = providers
+        self.first_token_timeout = first_token_timeout
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+
+    @property
+    def primary(self) -> ChatProvider:
+        return self.providers[0]
+
+    def hedge_delay(self, provider: ChatProvider) -> float:
+        """Chờ bao lâu trước khi gửi request hedge: phân vị độ trễ token đầu của provider (khi đủ mẫu)."""
+        if len(provider.latency.samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, provider.latency.percentile(self.hedge_percentile))
+
+    def _next_provider(self, tried: list) -> Optional[ChatProvider]:
+        for provider in self.providers:
+            if provider not in tried and provider.breaker.allow():
+                return provider
+        return None
+
+    async def astream(self, inputs: dict, info: Optional[dict] = None) -> AsyncIterator[str]:
+        """
+        Như `chain.astream(inputs)`. `info` (nếu có) nhận tên provider thắng và có hedge hay không.
+        Ném GenerationUnavailable nếu không có token đầu trước hạn chót.
+        """
+        info = info if info is not None else {}
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.first_token_timeout
+        attempts = {}  # task lấy token đầu -> (provider, iterator, thời điểm bắt đầu)
+        tried: List[ChatProvider] = []
+        last_error: Optional[BaseException] = None
+
+        def start(provider: ChatProvider) -> None:
+            tried.append(provider)
+            iterator = provider.chain.astream(inputs)
+            attempts[asyncio.ensure_future(_first_chunk(iterator))] = (provider, iterator, loop.time())
+
+        first = self._next_provider(tried)
+        if first is None:
+            raise GenerationUnavailable("Mọi provider chat đang bị ngắt mạch.")
+        start(first)
+        hedge_at = started + self.hedge_delay(first) if self.hedge_enabled else None
+        winner = None
+        try:
+            while winner is None:
+                wake_at = min(deadline, hedge_at) if hedge_at is not None else deadline
+                done, _ = await asyncio.wait(list(attempts), timeout=max(wake_at - loop.time(), 0),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider, iterator, attempt_started = attempts.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        provider.breaker.record_success()
+                        provider.latency.observe(loop.time() - attempt_started)
+                        GENERATION_ATTEMPTS.inc(provider=provider.name, result="won")
+                        winner = (provider, iterator, task.result())
+                        break
+                    last_error = error
+                    provider.breaker.record_failure()
+                    GENERATION_ATTEMPTS.inc(provider=provider.name, result="error")
+                    log_event("provider_failed", level=logging.WARNING, provider=provider.name, error=repr(error))
+                if winner is not None:
+                    break
+
+                if not attempts:
+                    # Failover: không còn request nào đang chạy, chuyển ngay sang provider kế tiếp
+                    following = self._next_provider(tried)
+                    if following is None:
+                        raise GenerationUnavailable(f"Không provider nào trả lời được: {last_error!r}")
+                    start(following)
+                    continue
+                if loop.time() >= deadline:
+                    for provider, _, _ in attempts.values():
+                        provider.breaker.record_failure()
+                        GENERATION_ATTEMPTS.inc(provider=provider.name, result="timeout")
+                    raise GenerationUnavailable(
+                        f"Quá hạn {self.first_token_timeout:.1f}s mà chưa có token đầu "
+                        f"({', '.join(provider.name for provider, _, _ in attempts.values())}).")
+                if hedge_at is not None and loop.time() >= hedge_at:
+                    hedge_at = None
+                    hedge = self._next_provider(tried)
+                    if hedge is not None:
+                        info["hedged"] = True
+                        start(hedge)
+        finally:
+            # Hủy các request thua (hoặc tất cả nếu thất bại/khách ngắt kết nối) và đóng stream của chúng
+            for task, (provider, _, _) in attempts.items():
+                task.cancel()
+                provider.breaker.record_cancelled()
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+                for task, (provider, iterator, attempt_started) in attempts.items():
+                    if winner is not None and task.cancelled():
+                        GENERATION_ATTEMPTS.inc(provider=provider.name, result="cancelled")
+                        # Độ trễ thật của request thua ít nhất bằng thời gian đã chờ: ghi lại để phân vị không bị
+                        # kéo xuống (nếu chỉ ghi request thắng, đuôi chậm sẽ biến mất khỏi thống kê)
+                        provider.latency.observe(loop.time() - attempt_started)
+                    try:
+                        await iterator.aclose()
+                    except Exception:
+                        pass
+
+        provider, iterator, chunk = winner
+        info["provider"] = provider.name
+        try:
+            if chunk:
+                yield chunk
+            async for chunk in iterator:
+                yield chunk
+        except Exception:
+            # Lỗi giữa chừng: không đổi provider được nữa nhưng vẫn tính vào circuit breaker
+            provider.breaker.record_failure()
+            GENERATION_ATTEMPTS.inc(provider=provider.name, result="error")
+            raise
+        finally:
+            await iterator.aclose()
+
+
+def provider_name(provider: str, model_name: str) -> str:
+    return f"{provider}:{model_name}"
+
+
+# Circuit breaker và thống kê độ trễ theo provider, dùng chung giữa các GeminiService (mỗi tenant một service)
+_PROVIDER_HEALTH: Dict[str, Tuple[CircuitBreaker, LatencyTracker]] = {}
+
+
+def _provider(name: str, llm: BaseChatModel, prompt: ChatPromptTemplate) -> ChatProvider:
+    if name not in _PROVIDER_HEALTH:
+        _PROVIDER_HEALTH[name] = (
+            CircuitBreaker(name, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RESET_SECONDS), LatencyTracker()
+        )
+    breaker, latency = _PROVIDER_HEALTH[name]
+    return ChatProvider(name, prompt | llm | StrOutputParser(), breaker, latency)
+
+
+def create_resilient_generator(prompt: ChatPromptTemplate, primary_llm: BaseChatModel,
+                               model_name: Optional[str] = None, temperature: float = 0.3) -> ResilientGenerator:
+    """
+    Provider chính (CHAT_PROVIDER, `model_name` hoặc CHAT_MODEL_NAME) và provider dự phòng nếu có
+    FALLBACK_CHAT_PROVIDER.
+    """
+    model_name = model_name or settings.CHAT_MODEL_NAME
+    providers = [_provider(provider_name(settings.CHAT_PROVIDER, model_name), primary_llm, prompt)]
+    if settings.FALLBACK_CHAT_PROVIDER:
+        fallback_model = settings.FALLBACK_CHAT_MODEL_NAME or model_name
+        llm = create_chat_model(fallback_model, temperature=temperature, provider=settings.FALLBACK_CHAT_PROVIDER)
+        providers.append(_provider(provider_name(settings.FALLBACK_CHAT_PROVIDER, fallback_model), llm, prompt))
+    return ResilientGenerator(
+        providers,
+        first_token_timeout=settings.FIRST_TOKEN_TIMEOUT_SECONDS,
+        hedge_enabled=settings.HEDGE_ENABLED,
+        hedge_percentile=settings.HEDGE_PERCENTILE,
+        hedge_default_delay=settings.HEDGE_DEFAULT_DELAY_MS / 1000,
+        hedge_min_delay=settings.HEDGE_MIN_DELAY_MS / 1000,
+        hedge_min_samples=settings.HEDGE_MIN_SAMPLES,
+    )
@@ -0,0 +1,197 @@
+# app/services/retrieval_batcher.py
+"""
+Gom lô truy xuất cho các request đồng thời (micro-batching).
+
+Các câu hỏi tới trong cùng một cửa sổ ngắn (RETRIEVAL_BATCH_WINDOW_MS, hoặc khi đủ RETRIEVAL_MAX_BATCH) được:
+1. embed bằng MỘT lời gọi `aembed_documents` (câu đã có trong cache embedding không gọi lại model);
+2. tìm bằng MỘT lần `index.search` trên ma trận câu hỏi, chạy trong thread pool riêng ngoài event loop
+   (câu được định tuyến thì mỗi chỉ mục con cũng chỉ được tìm một lần cho cả lô);
+rồi kết quả được trả lại cho từng request đang chờ qua Future của nó.
+
+Khi một lô đang chạy và đã hết suất chạy song song, các câu mới tiếp tục dồn vào hàng đợi và đi chung lô sau,
+nên dưới tải cao lô tự lớn lên mà không cần cửa sổ dài; khi chỉ có một request, độ trễ thêm vào chỉ là cửa sổ.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.core.config import settings
+from app.core.telemetry import RETRIEVAL_BATCH_SIZE
+from app.services.embedding_cache import aembed_queries
+
+
+class MicroBatcher:
+    """
+    Hàng đợi gom lô tổng quát: `submit(item)` chờ kết quả của riêng item đó,
+    `handler(items)` xử lý cả lô và trả về danh sách kết quả cùng thứ tự.
+    Tối đa `max_concurrency` lô chạy cùng lúc; lỗi của một lô được trả cho mọi request trong lô.
+    """
+
+    def __init__(self, name: str, handler: Callable[[List[Any]], Awaitable[List[Any]]],
+                 window_ms: float, max_batch: int, max_concurrency: int = 1):
+        self.name = name
+        self.handler = handler
+        self.window = max(window_ms, 0.0) / 1000
+        self.max_batch = max(max_batch, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running: set = set()
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self) -> None:
+        # Hàng đợi và task gắn với event loop đang chạy; script gọi asyncio.run nhiều lần sẽ được tạo lại
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._collector = loop.create_task(self._collect())
+
+    async def submit(self, item: Any) -> Any:
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def _collect(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            # Trong lúc chờ suất chạy, các câu mới đã dồn vào hàng đợi: cho đi chung lô này
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            task = self._loop.create_task(self._dispatch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            # Request đã bị hủy (client ngắt kết nối) không cần xử lý nữa
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                return
+            self.batches += 1
+            self.items += len(batch)
+            RETRIEVAL_BATCH_SIZE.observe(len(batch), stage=self.name)
+            try:
+                results = await self.handler([item for item, _ in batch])
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def close(self) -> None:
+        tasks = [task for task in (self._collector, *self._running) if task is not None]
+        for task in tasks:
+            task.cancel()
+        # Task thuộc event loop khác (đã đóng) thì không chờ được
+        if self._loop is asyncio.get_running_loop():
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._collector = None
+        self._running.clear()
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait()[1].cancel()
+
+    def stats(self) -> Dict[str, float]:
+        return {"batches": self.batches, "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0}
+
+
+class RetrievalBatcher:
+    """Gom lô bước embedding câu hỏi và bước tìm kiếm FAISS của VectorDBService."""
+
+    def __init__(self, embeddings: Embeddings, window_ms: float, max_batch: int,
+                 embed_concurrency: int = 4, search_threads: int = 2):
+        self.embeddings = embeddings
+        self.executor = ThreadPoolExecutor(max_workers=max(search_threads, 1), thread_name_prefix="faiss-search")
+        self.embedder = MicroBatcher("embedding", self._embed_batch, window_ms, max_batch, embed_concurrency)
+        # Các câu của cùng một lô embedding tới bước tìm kiếm gần như cùng lúc, nên bước này không chờ thêm cửa sổ:
+        # chỉ gom những câu đã có sẵn trong hàng đợi (và những câu dồn lại trong lúc mọi thread tìm kiếm đang bận)
+        self.searcher = MicroBatcher("faiss_search", self._search_batch, 0, max_batch, search_threads)
+
+    async def embed_query(self, question: str) -> List[float]:
+        return await self.embedder.submit(question)
+
+    async def search(self, snapshot, embedding: List[float], k: int,
+                     categories: Sequence[int] = ()) -> List[int]:
+        """Số dòng của `k` chunk gần nhất trong `snapshot` (chỉ trong các chỉ mục con `categories` nếu có)."""
+        return await self.searcher.submit((snapshot, embedding, tuple(categories), k))
+
+    async def _embed_batch(self, questions: List[str]) -> List[List[float]]:
+        return await aembed_queries(self.embeddings, questions)
+
+    async def _search_batch(self, requests: List[tuple]) -> List[List[int]]:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, search_many, requests)
+
+    async def close(self) -> None:
+        await self.embedder.close()
+        await self.searcher.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {"embedding": self.embedder.stats(), "faiss_search": self.searcher.stats()}
+
+
+def search_many(requests: List[tuple]) -> List[List[int]]:
+    """
+    Tìm cho cả lô các request (snapshot, embedding, danh mục, k): mỗi snapshot một lần `index.search`
+    cho các câu tìm toàn cục, và một lần cho mỗi chỉ mục con được định tuyến tới.
+    """
+    results: List[Optional[List[int]]] = [None] * len(requests)
+    groups: Dict[int, List[int]] = {}
+    for position, (snapshot, *_) in enumerate(requests):
+        # Request trong một lô có thể thuộc hai snapshot khác nhau nếu vừa hot swap
+        groups.setdefault(id(snapshot), []).append(position)
+    for positions in groups.values():
+        snapshot = requests[positions[0]][0]
+        k = max(requests[p][3] for p in positions)
+        dense = [p for p in positions if not requests[p][2]]
+        routed = [p for p in positions if requests[p][2]]
+        if dense:
+            vectors = np.asarray([requests[p][1] for p in dense], dtype=np.float32)
+            _, indices = snapshot.index.search(vectors, k)
+            for p, row in zip(dense, indices):
+                results[p] = [int(i) for i in row[:requests[p][3]] if i != -1]
+        if routed:
+            rows = snapshot.router.search_many([requests[p][1] for p in routed],
+                                               [list(requests[p][2]) for p in routed], k)
+            for p, found in zip(routed, rows):
+                results[p] = found[:requests[p][3]]
+    return results
+
+
+def create_retrieval_batcher(embeddings: Embeddings) -> Optional[RetrievalBatcher]:
+    """Bộ gom lô theo cấu hình, hoặc None nếu tắt (mỗi request tự embed và tự tìm như trước)."""
+    if not settings.RETRIEVAL_BATCHING_ENABLED:
+        return None
+    return RetrievalBatcher(
+        embeddings,
+        window_ms=settings.RETRIEVAL_BATCH_WINDOW_MS,
+        max_batch=settings.RETRIEVAL_MAX_BATCH,
+        embed_concurrency=settings.RETRIEVAL_EMBED_CONCURRENCY,
+        search_threads=settings.RETRIEVAL_SEARCH_THREADS,
+    )
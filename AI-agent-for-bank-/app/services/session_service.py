@@ -0,0 +1,225 @@
+# app/services/session_service.py
+import asyncio
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+from app.core.config import settings
+from app.core.prompts import estimate_tokens
+from app.core.telemetry import log_event
+from app.schemas.chat import ChatMessage
+
+# ID phiên do client tự sinh được chấp nhận nếu đúng định dạng (ví dụ uuid4)
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+# (tenant của phiên, bản tóm tắt hiện có, các lượt vừa bị đẩy ra khỏi cửa sổ) -> bản tóm tắt mới
+Summarizer = Callable[[str, str, List[ChatMessage]], Awaitable[str]]
+
+
+@dataclass
+class Session:
+    session_id: str
+    # Tenant đã tạo phiên; phiên không được dùng lại cho tenant khác
+    tenant_id: str = ""
+    # Các lượt gần nhất, giữ nguyên văn; các lượt cũ hơn đã được gộp vào `summary`
+    messages: List[ChatMessage] = field(default_factory=list)
+    summary: str = ""
+    summarized_messages: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+    updated_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.messages and not self.summary
+
+
+class SessionBackend:
+    """Kho lưu phiên hội thoại. Có thể thay bằng kho dùng chung giữa các worker (Redis, ...)."""
+
+    def get(self, session_id: str) -> Optional[Session]:
+        raise NotImplementedError
+
+    def save(self, session: Session) -> None:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InMemorySessionBackend(SessionBackend):
+    """Kho phiên trong tiến trình: giới hạn số phiên (LRU) và tự hết hạn sau `ttl_seconds` không hoạt động."""
+
+    def __init__(self, max_sessions: int = 10_000, ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> Optional[Session]:
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def save(self, session: Session) -> None:
+        session.updated_at = time.monotonic()
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        self._expire()
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "evictions": self.evictions, "expirations": self.expirations}
+
+    def _expire(self) -> None:
+        # Phiên ít được dùng gần đây nhất nằm ở đầu OrderedDict
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.updated_at >= deadline:
+                break
+            self._sessions.popitem(last=False)
+            self.expirations += 1
+
+
+def create_session_backend() -> SessionBackend:
+    """Tạo kho phiên theo `settings.SESSION_BACKEND`."""
+    if settings.SESSION_BACKEND == "memory":
+        return InMemorySessionBackend(settings.SESSION_MAX_SESSIONS, settings.SESSION_TTL_SECONDS)
+    raise ValueError(f"SESSION_BACKEND không hợp lệ: '{settings.SESSION_BACKEND}'")
+
+
+def count_tokens(messages: List[ChatMessage]) -> int:
+    return sum(estimate_tokens(message.content) for message in messages)
+
+
+def window_messages(messages: List[ChatMessage], token_budget: int) -> List[ChatMessage]:
+    """Giữ các tin nhắn mới nhất (nguyên văn) vừa trong ngân sách token."""
+    kept, used = [], 0
+    for message in reversed(messages):
+        used += estimate_tokens(message.content)
+        if used > token_budget and kept:
+            break
+        kept.append(message)
+    return kept[::-1]
+
+
+def extractive_summary(summary: str, messages: List[ChatMessage], max_tokens: int) -> str:
+    """
+    Tóm tắt dự phòng không cần LLM: nối câu hỏi/câu trả lời (rút gọn) vào bản tóm tắt cũ
+    và chỉ giữ phần mới nhất vừa `max_tokens`.
+    """
+    lines = [summary] if summary else []
+    for message in messages:
+        speaker = "Khách hàng" if message.role == "user" else "Trợ lý"
+        lines.append(f"{speaker}: {message.content[:200]}")
+    text = "\n".join(lines)
+    max_chars = max_tokens * 4
+    return text[-max_chars:] if len(text) > max_chars else text
+
+
+class SessionService:
+    """
+    Quản lý lịch sử hội thoại phía server. Lịch sử gửi cho model bị giới hạn bởi `history_token_budget`:
+    các lượt mới nhất giữ nguyên văn, các lượt cũ hơn được gộp dần vào một bản tóm tắt
+    (mỗi lần chỉ tóm tắt phần vừa bị đẩy ra, không tóm tắt lại toàn bộ cuộc trò chuyện).
+    """
+
+    def __init__(self, backend: SessionBackend, summarizer: Optional[Summarizer] = None,
+                 history_token_budget: int = 800, summary_max_tokens: int = 200):
+        self.backend = backend
+        self.summarizer = summarizer
+        self.history_token_budget = history_token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self._compacting = set()
+        self._tasks = set()
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def get_or_create(self, session_id: Optional[str] = None, tenant_id: str = "") -> Session:
+        """
+        Trả về phiên có sẵn của `tenant_id`; tạo phiên mới nếu ID chưa có, đã hết hạn hoặc không hợp lệ.
+        ID thuộc phiên của tenant khác được coi như không hợp lệ (phiên mới mang ID mới), để lịch sử hội thoại
+        của một ngân hàng không lọt vào prompt của ngân hàng khác.
+        """
+        if session_id and _SESSION_ID_RE.match(session_id):
+            session = self.backend.get(session_id)
+            if session is not None:
+                if session.tenant_id == tenant_id:
+                    return session
+                session_id = uuid.uuid4().hex
+        else:
+            session_id = uuid.uuid4().hex
+        session = Session(session_id=session_id, tenant_id=tenant_id)
+        self.backend.save(session)
+        return session
+
+    def history(self, session: Session) -> List[ChatMessage]:
+        """Các lượt nguyên văn đưa vào prompt (luôn nằm trong ngân sách, kể cả khi việc tóm tắt chưa xong)."""
+        return window_messages(session.messages, self.history_token_budget)
+
+    def record_turn(self, session: Session, question: str, answer: str) -> None:
+        """Lưu một lượt hỏi-đáp; việc tóm tắt (nếu cần) chạy nền, không làm chậm câu trả lời."""
+        session.messages.append(ChatMessage(role="user", content=question))
+        session.messages.append(ChatMessage(role="ai", content=answer))
+        self.backend.save(session)
+        if count_tokens(session.messages) > self.history_token_budget and session.session_id not in self._compacting:
+            task = asyncio.create_task(self.compact(session))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def compact(self, session: Session) -> None:
+        """Đẩy các lượt cũ nhất ra khỏi cửa sổ cho tới khi vừa ngân sách, rồi cập nhật bản tóm tắt."""
+        self._compacting.add(session.session_id)
+        try:
+            # Luôn giữ nguyên văn ít nhất lượt hỏi-đáp cuối cùng. Các lượt chỉ bị xóa khỏi phiên sau khi
+            # đã có bản tóm tắt mới, để lượt hỏi tiếp theo (nếu tới sớm) không bị mất ngữ cảnh.
+            count = 0
+            while (len(session.messages) - count > 2
+                   and count_tokens(session.messages[count:]) > self.history_token_budget):
+                count += 2
+            if not count:
+                return
+            evicted = session.messages[:count]
+
+            summary = None
+            if self.summarizer is not None:
+                try:
+                    summary = await self.summarizer(session.tenant_id, session.summary, evicted)
+                except Exception as e:
+                    self.summary_failures += 1
+                    log_event("summary_failed", level=logging.WARNING, tenant=session.tenant_id, error=repr(e))
+            if not summary:
+                summary = extractive_summary(session.summary, evicted, self.summary_max_tokens)
+            del session.messages[:count]
+            session.summary = summary.strip()
+            session.summarized_messages += len(evicted)
+            self.summaries += 1
+            self.backend.save(session)
+        finally:
+            self._compacting.discard(session.session_id)
+
+    def stats(self) -> dict:
+        return {**self.backend.stats(), "summaries": self.summaries, "summary_failures": self.summary_failures}
+
+
+def create_session_service(summarizer: Optional[Summarizer] = None) -> SessionService:
+    return SessionService(
+        create_session_backend(),
+        summarizer=summarizer,
+        history_token_budget=settings.HISTORY_TOKEN_BUDGET,
+        summary_max_tokens=settings.SUMMARY_MAX_TOKENS,
+    )
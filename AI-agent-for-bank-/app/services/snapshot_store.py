@@ -0,0 +1,138 @@
+# app/services/snapshot_store.py
+"""
+Các phiên bản chỉ mục được xuất bản dưới dạng snapshot bất biến:
+
+    VECTOR_DB_PATH/
+        CURRENT                          # tên snapshot đang được phục vụ (thay thế nguyên tử)
+        snapshots/20261018T101500-3fa2c1/ # index.faiss, docs.bin, bm25.json, ... (xem index_store.py)
+        snapshots/20261018T093000-9be0d4.retired  # thời điểm snapshot bị thay thế (mtime)
+
+Mọi worker memory-map cùng các file chỉ đọc, nên bộ nhớ được chia sẻ qua page cache của hệ điều hành.
+Snapshot không bao giờ bị sửa sau khi xuất bản; nạp dữ liệu luôn ghi ra một snapshot mới rồi đổi CURRENT.
+Thư mục VECTOR_DB_PATH chưa có CURRENT (định dạng cũ, các file nằm thẳng trong thư mục) vẫn đọc được.
+"""
+import os
+import shutil
+import time
+import uuid
+from typing import List, Optional
+
+CURRENT_FILENAME = "CURRENT"
+SNAPSHOTS_DIRNAME = "snapshots"
+RETIRED_SUFFIX = ".retired"
+PARTIAL_SUFFIX = ".partial"
+# Thư mục tạm không có file nào được ghi trong khoảng này coi như của một lần nạp đã chết, có thể xóa
+PARTIAL_STALE_SECONDS = 6 * 3600
+
+
+def snapshots_dir(root: str) -> str:
+    return os.path.join(root, SNAPSHOTS_DIRNAME)
+
+
+def current_snapshot_name(root: str) -> Optional[str]:
+    """Tên snapshot đang được xuất bản; None nếu thư mục còn ở định dạng cũ (chưa có CURRENT)."""
+    try:
+        with open(os.path.join(root, CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_path(root: str, name: Optional[str]) -> str:
+    """Đường dẫn của snapshot; với định dạng cũ chính là thư mục gốc."""
+    return os.path.join(snapshots_dir(root), name) if name else root
+
+
+def resolve_current(root: str) -> str:
+    """Thư mục chứa các file của chỉ mục đang được phục vụ."""
+    return snapshot_path(root, current_snapshot_name(root))
+
+
+def create_snapshot_dir(root: str) -> tuple:
+    """
+    Tạo thư mục tạm cho một snapshot mới; trả về (tên, đường dẫn tạm).
+    Tên sắp xếp được theo thời gian để dễ theo dõi.
+    """
+    name = time.strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    staging = os.path.join(snapshots_dir(root), name + PARTIAL_SUFFIX)
+    os.makedirs(staging)
+    return name, staging
+
+
+def publish_snapshot(root: str, name: str, staging: str) -> None:
+    """
+    Hoàn tất snapshot (đổi tên thư mục tạm) rồi trỏ CURRENT tới nó bằng một thao tác thay thế nguyên tử.
+    Snapshot cũ được đánh dấu đã thay thế để `collect_garbage` xóa sau thời gian ân hạn.
+    """
+    os.rename(staging, snapshot_path(root, name))
+    previous = current_snapshot_name(root)
+    tmp_path = os.path.join(root, CURRENT_FILENAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILENAME))
+    if previous and previous != name:
+        _mark_retired(root, previous)
+
+
+def _mark_retired(root: str, name: str) -> None:
+    with open(os.path.join(snapshots_dir(root), name + RETIRED_SUFFIX), "w", encoding="utf-8"):
+        pass
+
+
+def _list_dirs(root: str) -> List[str]:
+    directory = snapshots_dir(root)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+
+
+def list_snapshots(root: str) -> List[str]:
+    """Các snapshot đã xuất bản (không tính thư mục tạm của lần nạp đang chạy)."""
+    return [name for name in _list_dirs(root) if not name.endswith(PARTIAL_SUFFIX)]
+
+
+def _last_write(path: str) -> float:
+    """Thời điểm ghi gần nhất vào thư mục hoặc bất kỳ file nào bên trong."""
+    latest = os.path.getmtime(path)
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                latest = max(latest, os.path.getmtime(os.path.join(directory, name)))
+            except OSError:
+                continue
+    return latest
+
+
+def collect_garbage(root: str, grace_seconds: float) -> List[str]:
+    """
+    Xóa các snapshot đã bị thay thế lâu hơn `grace_seconds`.
+    Worker vẫn đang phục vụ một snapshot cũ sẽ chuyển sang snapshot mới trong thời gian ân hạn;
+    trên Linux, file đã memory-map vẫn đọc được kể cả khi bị xóa.
+    Thư mục tạm (.partial) có thể đang được một lần nạp khác ghi, nên chỉ bị xóa khi đã không được ghi
+    trong PARTIAL_STALE_SECONDS. Trả về danh sách đã xóa.
+    """
+    current = current_snapshot_name(root)
+    now = time.time()
+    removed = []
+    for name in _list_dirs(root):
+        if name.endswith(PARTIAL_SUFFIX):
+            path = os.path.join(snapshots_dir(root), name)
+            if now - _last_write(path) >= PARTIAL_STALE_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(name)
+            continue
+        if name == current:
+            continue
+        marker = os.path.join(snapshots_dir(root), name + RETIRED_SUFFIX)
+        if not os.path.exists(marker):
+            # Snapshot không rõ thời điểm bị thay thế (ví dụ lần nạp bị dừng giữa chừng): bắt đầu tính từ bây giờ
+            _mark_retired(root, name)
+            continue
+        if now - os.path.getmtime(marker) < grace_seconds:
+            continue
+        shutil.rmtree(snapshot_path(root, name), ignore_errors=True)
+        os.remove(marker)
+        removed.append(name)
+    return removed
@@ -0,0 +1,231 @@
+# app/services/tenant_registry.py
+"""
+Sổ đăng ký tenant: mỗi ngân hàng/thương hiệu/ngôn ngữ có chỉ mục, lời nhắn và cấu hình model riêng
+(TenantConfig, đọc từ TENANTS_FILE), phục vụ trong cùng một deployment.
+
+- Tenant được nạp khi có request đầu tiên (VectorDBService + GeminiService, trong thread); các request đồng thời
+  tới cùng một tenant chưa nạp chờ chung MỘT lần nạp.
+- Tổng dung lượng các chỉ mục đã nạp giữ dưới TENANT_MEMORY_BUDGET_MB: tenant ít dùng gần đây nhất bị giải phóng
+  trước. Tenant đang có request (đang giữ lease) không bao giờ bị giải phóng, nên ngân sách có thể vượt tạm thời.
+- Tenant mặc định (service dựng trong lifespan) được ghim, không bị giải phóng.
+Mọi tenant dùng chung model embedding, cache embedding và bộ gom lô truy xuất của tenant mặc định.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.telemetry import log_event
+from app.schemas.tenant import TenantConfig
+from app.services.gemini_service import GeminiService
+from app.services.vector_db_service import VectorDBService
+
+MB = 1024 * 1024
+
+
+class UnknownTenant(KeyError):
+    """Không có tenant này trong TENANTS_FILE."""
+
+
+class TenantEntry:
+    """Một tenant đã nạp: các service của nó, dung lượng chỉ mục và số request đang dùng."""
+
+    def __init__(self, tenant_id: str, vector_db_service: VectorDBService, gemini_service: GeminiService,
+                 pinned: bool = False, load_seconds: float = 0.0):
+        self.tenant_id = tenant_id
+        self.vector_db_service = vector_db_service
+        self.gemini_service = gemini_service
+        self.pinned = pinned
+        self.load_seconds = load_seconds
+        self.in_use = 0
+        self.closed = False
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.vector_db_service.memory_bytes
+
+
+class TenantLease:
+    """Quyền dùng một tenant trong suốt một request; `release()` gọi nhiều lần cũng chỉ trả một lần."""
+
+    def __init__(self, registry: "TenantRegistry", entry: TenantEntry):
+        self._registry = registry
+        self.entry = entry
+        self._released = False
+
+    @property
+    def gemini_service(self) -> GeminiService:
+        return self.entry.gemini_service
+
+    @property
+    def vector_db_service(self) -> VectorDBService:
+        return self.entry.vector_db_service
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._registry._release(self.entry)
+
+    def hand_off(self) -> Callable[[], None]:
+        """Như Ticket.hand_off: tenant vẫn được giữ (không bị giải phóng) cho tới khi gọi hàm trả về."""
+        if self._released:
+            return lambda: None
+        self._released = True
+        return TenantLease(self._registry, self.entry).release
+
+    async def __aenter__(self) -> "TenantLease":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+def load_tenant_configs(path: str) -> Dict[str, TenantConfig]:
+    """Đọc TENANTS_FILE: {"<tenant_id>": {cấu hình}, ...}."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    return {tenant_id: TenantConfig(tenant_id=tenant_id, **config) for tenant_id, config in raw.items()}
+
+
+class TenantRegistry:
+    def __init__(self, configs: Dict[str, TenantConfig],
+                 builder: Callable[[TenantConfig], Tuple[VectorDBService, GeminiService]],
+                 memory_budget_bytes: int):
+        self.configs = configs
+        self.builder = builder
+        self.memory_budget_bytes = memory_budget_bytes
+        # Thứ tự LRU: tenant vừa dùng ở cuối
+        self._entries: "OrderedDict[str, TenantEntry]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+        self._closing: set = set()
+        self.loads = 0
+        self.evictions = 0
+        self.hits = 0
+
+    def pin(self, tenant_id: str, vector_db_service: VectorDBService, gemini_service: GeminiService) -> None:
+        """Đăng ký một tenant đã nạp sẵn (tenant mặc định), không bao giờ bị giải phóng."""
+        self._entries[tenant_id] = TenantEntry(tenant_id, vector_db_service, gemini_service, pinned=True)
+
+    def known(self, tenant_id: str) -> bool:
+        return tenant_id in self._entries or tenant_id in self.configs
+
+    async def acquire(self, tenant_id: str) -> TenantLease:
+        """Lease của tenant, nạp nếu chưa có. Ném UnknownTenant nếu tenant không được cấu hình."""
+        while True:
+            entry = self._entries.get(tenant_id)
+            if entry is not None:
+                self._entries.move_to_end(tenant_id)
+                self.hits += 1
+            else:
+                task = self._loading.get(tenant_id)
+                if task is None:
+                    config = self.configs.get(tenant_id)
+                    if config is None:
+                        raise UnknownTenant(tenant_id)
+                    task = self._loading[tenant_id] = asyncio.create_task(self._load(config))
+                # shield: request đầu tiên bị hủy (client ngắt kết nối) không làm hỏng lần nạp của các request khác
+                entry = await asyncio.shield(task)
+            # Tenant có thể vừa bị lần nạp của tenant khác giải phóng trước khi request này kịp giữ lease
+            if not entry.closed:
+                entry.in_use += 1
+                return TenantLease(self, entry)
+
+    async def _load(self, config: TenantConfig) -> TenantEntry:
+        try:
+            started = time.perf_counter()
+            vector_db_service, gemini_service = await asyncio.to_thread(self.builder, config)
+            entry = TenantEntry(config.tenant_id, vector_db_service, gemini_service,
+                                load_seconds=time.perf_counter() - started)
+            self.loads += 1
+            # Sự kiện hiếm và quan trọng khi vận hành: luôn ghi, không phụ thuộc lấy mẫu
+            log_event("tenant_loaded", level=logging.INFO, force=True, tenant=config.tenant_id,
+                      memory_mb=round(entry.memory_bytes / MB, 1), load_ms=round(entry.load_seconds * 1000))
+            self._entries[config.tenant_id] = entry
+            self._evict_over_budget(keep=entry)
+            return entry
+        finally:
+            self._loading.pop(config.tenant_id, None)
+
+    def _release(self, entry: TenantEntry) -> None:
+        entry.in_use -= 1
+        if entry.in_use == 0:
+            # Tenant vừa trả lease có thể là ứng viên giải phóng đang bị giữ lại
+            self._evict_over_budget()
+
+    def memory_bytes(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values())
+
+    def _evict_over_budget(self, keep: Optional[TenantEntry] = None) -> None:
+        total = self.memory_bytes()
+        for tenant_id, entry in list(self._entries.items()):
+            if total <= self.memory_budget_bytes:
+                break
+            if entry.pinned or entry.in_use or entry is keep:
+                continue
+            # Đóng chỉ mục ở nền; giữ tham chiếu tới task để nó không bị thu gom giữa chừng.
+            # Task được tạo trước khi gỡ tenant: nếu không tạo được (không có event loop) thì registry vẫn nguyên vẹn
+            task = asyncio.get_running_loop().create_task(entry.vector_db_service.close())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            del self._entries[tenant_id]
+            entry.closed = True
+            total -= entry.memory_bytes
+            self.evictions += 1
+            log_event("tenant_evicted", level=logging.INFO, force=True, tenant=tenant_id,
+                      memory_mb=round(entry.memory_bytes / MB, 1))
+
+    async def summarize(self, tenant_id: str, summary: str, messages: list) -> str:
+        """
+        Summarizer của SessionService: tóm tắt bằng GeminiService của chính tenant sở hữu phiên
+        (model và ngôn ngữ trả lời của tenant đó), vì bản tóm tắt được đưa lại vào lời nhắn của tenant.
+        """
+        async with await self.acquire(tenant_id) as lease:
+            return await lease.gemini_service.summarize(summary, messages)
+
+    async def refresh(self) -> None:
+        """Chuyển các tenant đã nạp sang snapshot chỉ mục mới (nếu có)."""
+        for entry in list(self._entries.values()):
+            if not entry.closed:
+                await entry.vector_db_service.refresh()
+        self._evict_over_budget()
+
+    def loaded(self) -> List[str]:
+        return list(self._entries)
+
+    def stats(self) -> dict:
+        return {
+            "configured": len(self.configs),
+            "loaded": len(self._entries),
+            "memory_mb": round(self.memory_bytes() / MB, 1),
+            "memory_budget_mb": round(self.memory_budget_bytes / MB, 1),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "hits": self.hits,
+        }
+
+    async def close(self) -> None:
+        """Đóng các tenant đã nạp (trừ tenant được ghim, do nơi tạo ra nó đóng)."""
+        for task in self._loading.values():
+            task.cancel()
+        await asyncio.gather(*self._loading.values(), *self._closing, return_exceptions=True)
+        for entry in self._entries.values():
+            if not entry.pinned:
+                entry.closed = True
+                await entry.vector_db_service.close()
+        self._entries.clear()
+
+
+def create_tenant_registry(default_vector_db: VectorDBService, default_gemini: GeminiService) -> TenantRegistry:
+    """Registry với tenant mặc định đã ghim và các tenant trong TENANTS_FILE (nếu có)."""
+    configs = load_tenant_configs(settings.TENANTS_FILE) if settings.TENANTS_FILE else {}
+
+    def build(config: TenantConfig) -> Tuple[VectorDBService, GeminiService]:
+        vector_db_service = VectorDBService(root=config.vector_db_path, embeddings=default_vector_db.embeddings,
+                                            batcher=default_vector_db.batcher)
+        return vector_db_service, GeminiService(vector_db_service, tenant=config)
+
+    registry = TenantRegistry(configs, build, int(settings.TENANT_MEMORY_BUDGET_MB * MB))
+    registry.pin(settings.DEFAULT_TENANT_ID, default_vector_db, default_gemini)
+    return registry
@@ -1,29 +1,291 @@
-import pickle
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import FAISS
+import os
+import asyncio
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+import time
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from app.core.config import settings
+from app.core.telemetry import CACHE_EVENTS, ROUTER_DECISIONS, span
+from app.services.category_router import CategoryRouter
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.embedding_service import create_embeddings, embedding_model_name, verify_index_metadata
+from app.services.index_store import MmapDocstore, load_faiss_index
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion, is_confident
+from app.services.retrieval_batcher import RetrievalBatcher, create_retrieval_batcher
+from app.services.snapshot_store import current_snapshot_name, snapshot_path
+
+
+def docs_to_chunks(docs) -> List[Dict[str, Any]]:
+    """Chuyển các Document của LangChain sang dạng {'source', 'section', 'index', 'text'} mà prompt sử dụng."""
+    return [
+        {
+            "source": os.path.basename(doc.metadata.get("source", "Unknown")),
+            "section": doc.metadata.get("section", ""),
+            "index": doc.metadata.get("chunk_index"),
+            "text": doc.page_content,
+        }
+        for doc in docs
+    ]
+
+
+def directory_size(path: str) -> int:
+    """Tổng dung lượng các file trong thư mục (đệ quy)."""
+    total = 0
+    for folder, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+    return total
+
+
+def get_index_version(path: str) -> tuple:
+    """
+    Trả về "dấu vân tay" của vector store trên đĩa (tên, thời gian sửa đổi, kích thước các file).
+    Giá trị này thay đổi mỗi khi chỉ mục được dựng lại.
+    """
+    entries = []
+    for name in sorted(os.listdir(path)):
+        stat = os.stat(os.path.join(path, name))
+        entries.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+class IndexSnapshot:
+    """Một phiên bản chỉ mục đã tải: FAISS + docstore (memory-map, chỉ đọc) + BM25 + metadata."""
+
+    def __init__(self, root: str, name: Optional[str], model_name: str):
+        self.name = name
+        self.path = snapshot_path(root, name)
+        # Snapshot bất biến nên tên là đủ làm phiên bản; định dạng cũ dùng dấu vân tay các file
+        self.version = name if name else get_index_version(self.path)
+
+        started = time.perf_counter()
+        self.index = load_faiss_index(self.path, nprobe=settings.FAISS_NPROBE, ef_search=settings.FAISS_HNSW_EF_SEARCH)
+        self.docstore = MmapDocstore(self.path)
+        # Từ chối phục vụ nếu chỉ mục được dựng bởi model embedding khác
+        self.dimension = self.index.d
+        self.meta = verify_index_metadata(self.path, model_name, self.dimension)
+        # Chỉ mục BM25 được dựng khi nạp dữ liệu và lưu cạnh các file FAISS
+        self.bm25 = BM25Index.load(self.path) if settings.HYBRID_SEARCH_ENABLED else None
+        # Chỉ mục con theo danh mục (None với snapshot cũ hoặc khi tắt định tuyến)
+        self.router = CategoryRouter.load(
+            self.path, max_categories=settings.ROUTER_MAX_CATEGORIES, min_score=settings.ROUTER_MIN_SCORE,
+            margin=settings.ROUTER_MARGIN, nprobe=settings.FAISS_NPROBE, ef_search=settings.FAISS_HNSW_EF_SEARCH,
+        ) if settings.CATEGORY_ROUTING_ENABLED else None
+        # Ước lượng bộ nhớ khi chỉ mục đã nóng (FAISS/docstore memory-map + BM25), dùng cho ngân sách bộ nhớ của các tenant
+        self.memory_bytes = directory_size(self.path)
+        self.load_seconds = time.perf_counter() - started
+
+    def close(self) -> None:
+        self.docstore.close()
+
 
 class VectorDBService:
-    def __init__(self):
-        # Tự tạo model embedding ngay tại đây
-        embeddings = GoogleGenerativeAIEmbeddings(
-            model=settings.GEMINI_EMBEDDING_MODEL,
-            google_api_key=settings.GOOGLE_API_KEY
-        )
-        
-        # Tải cơ sở dữ liệu vector từ đường dẫn trong file config
-        self.db = FAISS.load_local(
-            settings.VECTOR_DB_PATH, 
-            embeddings, 
-            allow_dangerous_deserialization=True
-        )
-        print(f"✅ Vector DB đã được tải thành công (sử dụng model: {settings.GEMINI_EMBEDDING_MODEL}).")
-
-    # ✅ THAY ĐỔI: Thêm lại phương thức get_retriever
-    def get_retriever(self, k=5):
-        """Tạo và trả về một retriever từ cơ sở dữ liệu vector."""
-        return self.db.as_retriever(search_kwargs={'k': k})
-
-# Tạo một instance duy nhất để tái sử dụng trong toàn bộ ứng dụng
-vector_db_service = VectorDBService()
+    def __init__(self, root: Optional[str] = None, embeddings: Optional[Embeddings] = None,
+                 batcher: Optional[RetrievalBatcher] = None):
+        """
+        `root` mặc định là VECTOR_DB_PATH. Các tenant truyền `embeddings` và `batcher` của service mặc định
+        để dùng chung model embedding, cache và bộ gom lô (service không sở hữu, nên không đóng chúng).
+        """
+        self.model_name = embedding_model_name()
+        if embeddings is None:
+            # Tạo model embedding theo provider trong cấu hình
+            embeddings = create_embeddings()
+            if settings.EMBEDDING_CACHE_ENABLED:
+                # Câu hỏi lặp lại được lấy từ cache thay vì gọi lại API embedding
+                embeddings = CachedEmbeddings(
+                    embeddings,
+                    model_name=self.model_name,
+                    cache_dir=settings.EMBEDDING_CACHE_DIR,
+                    max_memory_entries=settings.EMBEDDING_CACHE_MAX_MEMORY_ENTRIES,
+                    max_disk_entries=settings.EMBEDDING_CACHE_MAX_DISK_ENTRIES,
+                )
+            # Request đồng thời được gom lô ở bước embedding câu hỏi và tìm kiếm FAISS (None = tắt)
+            batcher = create_retrieval_batcher(embeddings)
+            self.owns_batcher = True
+        else:
+            self.owns_batcher = False
+        self.embeddings = embeddings
+        self.batcher = batcher
+
+        # Tải snapshot mà CURRENT đang trỏ tới (FAISS memory-map chỉ đọc, docstore không dùng pickle)
+        self.root = root or settings.VECTOR_DB_PATH
+        self.snapshot = self._load_snapshot(current_snapshot_name(self.root))
+        self.lexical_fastpath_hits = 0
+        self.swaps = 0
+
+    def _load_snapshot(self, name: Optional[str]) -> IndexSnapshot:
+        snapshot = IndexSnapshot(self.root, name, self.model_name)
+        print(f"✅ Vector DB đã được tải thành công (snapshot: {name or 'định dạng cũ'}, model: {self.model_name}, "
+              f"{snapshot.dimension} chiều, {snapshot.index.ntotal} đoạn, chỉ mục {snapshot.meta.get('factory', 'Flat')}, "
+              f"{snapshot.load_seconds * 1000:.1f} ms).")
+        if settings.HYBRID_SEARCH_ENABLED and snapshot.bm25 is None:
+            print("⚠️ Không tìm thấy chỉ mục BM25, chỉ dùng tìm kiếm vector. Hãy chạy lại scripts/ingest_data.py.")
+        return snapshot
+
+    # Các thuộc tính của snapshot đang phục vụ (dùng cho health check và script đánh giá)
+    @property
+    def index(self):
+        return self.snapshot.index
+
+    @property
+    def docstore(self) -> MmapDocstore:
+        return self.snapshot.docstore
+
+    @property
+    def bm25(self) -> Optional[BM25Index]:
+        return self.snapshot.bm25
+
+    @property
+    def meta(self) -> dict:
+        return self.snapshot.meta
+
+    @property
+    def dimension(self) -> int:
+        return self.snapshot.dimension
+
+    @property
+    def load_seconds(self) -> float:
+        return self.snapshot.load_seconds
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.snapshot.memory_bytes
+
+    async def refresh(self) -> bool:
+        """
+        Chuyển sang snapshot mới nếu CURRENT đã thay đổi; trả về True nếu đã chuyển.
+        Snapshot mới được tải trong thread rồi thay bằng một phép gán, nên request đang chạy
+        vẫn dùng trọn vẹn snapshot cũ mà nó đã lấy lúc bắt đầu, còn request sau dùng snapshot mới.
+        """
+        name = current_snapshot_name(self.root)
+        if name is None or name == self.snapshot.name:
+            return False
+        try:
+            snapshot = await asyncio.to_thread(self._load_snapshot, name)
+        except Exception as e:
+            # Snapshot lỗi hoặc không khớp model embedding: tiếp tục phục vụ snapshot hiện tại
+            print(f"⚠️ Không thể chuyển sang snapshot '{name}': {e}")
+            return False
+        # Snapshot cũ không bị đóng tường minh: vùng memory-map được giải phóng khi
+        # request cuối cùng còn giữ nó kết thúc
+        self.snapshot = snapshot
+        self.swaps += 1
+        return True
+
+    async def close(self) -> None:
+        """Dừng bộ gom lô và giải phóng vùng nhớ memory-map của docstore."""
+        if self.batcher is not None and self.owns_batcher:
+            await self.batcher.close()
+        self.snapshot.close()
+
+    def index_version(self) -> Hashable:
+        """Phiên bản của snapshot đang phục vụ (cache câu trả lời tự xóa khi phiên bản đổi)."""
+        return self.snapshot.version
+
+    async def embed_query(self, question: str) -> List[float]:
+        """Tạo embedding cho câu hỏi (dùng chung cho cache và truy vấn)."""
+        if self.batcher is not None:
+            return await self.batcher.embed_query(question)
+        return await self.embeddings.aembed_query(question)
+
+    def _dense_search(self, embedding: List[float], k: int, snapshot: Optional[IndexSnapshot] = None) -> List[int]:
+        """Tìm kiếm FAISS, trả về số dòng của các chunk theo thứ tự gần nhất."""
+        snapshot = snapshot or self.snapshot
+        vector = np.asarray([embedding], dtype=np.float32)
+        _, indices = snapshot.index.search(vector, k)
+        return [int(i) for i in indices[0] if i != -1]
+
+    async def _search_rows(self, embedding: List[float], k: int, snapshot: IndexSnapshot,
+                           categories: List[int]) -> List[int]:
+        """Tìm FAISS ngoài event loop: qua bộ gom lô nếu bật, nếu không thì một thread cho mỗi request."""
+        if self.batcher is not None:
+            return await self.batcher.search(snapshot, embedding, k, categories)
+        if categories:
+            return await asyncio.to_thread(snapshot.router.search, embedding, categories, k)
+        return await asyncio.to_thread(self._dense_search, embedding, k, snapshot)
+
+    def _route(self, embedding: List[float], snapshot: IndexSnapshot) -> List[int]:
+        """Các chỉ mục con nên tìm cho câu hỏi ([] = tìm trên toàn bộ chỉ mục)."""
+        if snapshot.router is None:
+            return []
+        with span("routing"):
+            categories = snapshot.router.route(embedding)
+        ROUTER_DECISIONS.inc(result="routed" if categories else "global")
+        return categories
+
+    def _get_documents(self, rows: List[int], snapshot: Optional[IndexSnapshot] = None) -> List[Document]:
+        """Giải mã (lười) các chunk từ docstore memory-map."""
+        snapshot = snapshot or self.snapshot
+        return [snapshot.docstore.get(row) for row in rows]
+
+    def _lexical(self, question: str, snapshot: IndexSnapshot) -> Tuple[List[int], bool]:
+        """Xếp hạng BM25 (số dòng) và cờ kết quả từ khóa đủ chắc chắn để dùng đường tắt."""
+        if snapshot.bm25 is None:
+            return [], False
+        with span("bm25_search"):
+            results, coverage = snapshot.bm25.search(question, settings.HYBRID_FETCH_K)
+        confident = settings.LEXICAL_FASTPATH_ENABLED and is_confident(
+            results, coverage, settings.LEXICAL_FASTPATH_MIN_COVERAGE, settings.LEXICAL_FASTPATH_MIN_MARGIN)
+        return [row for row, _ in results], confident
+
+    def _record_fastpath(self, hit: bool) -> None:
+        if hit:
+            self.lexical_fastpath_hits += 1
+        CACHE_EVENTS.inc(cache="lexical_fastpath", result="hit" if hit else "miss")
+
+    def lexical_fastpath(self, question: str, k: Optional[int] = None) -> Optional[List[Document]]:
+        """
+        Các chunk từ BM25 nếu kết quả từ khóa đủ chắc chắn (không cần embedding), nếu không thì None.
+        Dùng trước mọi bước cần embedding (vd. tra cache câu trả lời) để câu hỏi trúng từ khóa không phải embed.
+        """
+        snapshot = self.snapshot
+        rows, confident = self._lexical(question, snapshot)
+        if snapshot.bm25 is not None:
+            self._record_fastpath(confident)
+        if not confident:
+            return None
+        return self._get_documents(rows[:k or settings.RETRIEVAL_TOP_K], snapshot)
+
+    async def search(self, question: str, k: Optional[int] = None,
+                     query_embedding: Optional[List[float]] = None) -> List[Document]:
+        """
+        Truy xuất lai: xếp hạng BM25 và xếp hạng FAISS được gộp bằng Reciprocal Rank Fusion.
+        Nếu kết quả từ khóa đủ chắc chắn và chưa có embedding sẵn, bỏ qua hẳn bước embedding
+        (khi đã có embedding, nơi gọi đã tự thử `lexical_fastpath` trước đó).
+        Khi bộ định tuyến chọn được danh mục, FAISS chỉ tìm trong các chỉ mục con đó và kết quả BM25 được lọc theo danh mục.
+        """
+        k = k or settings.RETRIEVAL_TOP_K
+        # Giữ một tham chiếu tới snapshot trong suốt request để không bị lẫn khi hot swap
+        snapshot = self.snapshot
+        lexical_rows, confident = self._lexical(question, snapshot)
+        if query_embedding is None and snapshot.bm25 is not None:
+            self._record_fastpath(confident)
+            if confident:
+                return self._get_documents(lexical_rows[:k], snapshot)
+
+        if query_embedding is None:
+            with span("embedding"):
+                query_embedding = await self.embed_query(question)
+        fetch_k = settings.HYBRID_FETCH_K if lexical_rows else k
+        categories = self._route(query_embedding, snapshot)
+        if categories:
+            lexical_rows = snapshot.router.in_categories(lexical_rows, categories)
+        with span("faiss_search"):
+            dense_rows = await self._search_rows(query_embedding, fetch_k, snapshot, categories)
+
+        if lexical_rows:
+            rows = reciprocal_rank_fusion([dense_rows, lexical_rows], settings.RRF_K)[:k]
+        else:
+            rows = dense_rows[:k]
+        return self._get_documents(rows, snapshot)
 
+    async def search_similar(self, query_embedding: List[float], top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Chỉ tìm kiếm vector (không BM25) với embedding có sẵn, trả về các đoạn dạng dict cho prompt
+        (giao diện mà ChatUseCase sử dụng).
+        """
+        snapshot = self.snapshot
+        categories = self._route(query_embedding, snapshot)
+        with span("faiss_search"):
+            rows = await self._search_rows(query_embedding, top_k, snapshot, categories)
+        return docs_to_chunks(self._get_documents(rows, snapshot))
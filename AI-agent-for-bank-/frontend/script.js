@@ -3,9 +3,11 @@ const chatBox = document.getElementById('chat-box');
 const userInput = document.getElementById('user-input');
 const sendBtn = document.getElementById('send-btn');
 
-const API_URL = 'http://localhost:8000/api/v1/chat/query'; 
+// Chế độ NDJSON: mỗi dòng là một sự kiện (sources, token, done, error)
+const API_URL = 'http://localhost:8000/api/v1/chat/query?format=ndjson'; 
 
-let chatHistory = [];
+// Lịch sử hội thoại được giữ phía server theo session_id; client chỉ gửi câu hỏi mới
+const sessionId = crypto.randomUUID().replace(/-/g, '');
 
 // --- THÊM MỚI: Biến trạng thái và AbortController ---
 let isGenerating = false;
@@ -59,7 +61,6 @@ async function sendMessage() {
     toggleButtonState(true);
     
     addMessage(question, 'user');
-    chatHistory.push({ role: 'user', content: question });
     userInput.value = '';
 
     const { messageContainer, pElement } = addMessage("...", 'ai');
@@ -76,7 +77,7 @@ async function sendMessage() {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
                 question: question, 
-                history: chatHistory.slice(0, -1)
+                session_id: sessionId
             }),
             // --- SỬA ĐỔI: Gắn signal vào yêu cầu fetch ---
             signal: abortController.signal
@@ -86,16 +87,11 @@ async function sendMessage() {
 
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
+        let buffer = "";
 
-        while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-            
-            let chunk = decoder.decode(value, { stream: true });
-            
-            if (chunk.startsWith("SOURCES:")) {
-                const sourcesJson = chunk.substring(8);
-                const sources = JSON.parse(sourcesJson);
+        function handleEvent(event) {
+            if (event.event === "sources" && event.sources.length) {
+                const sources = event.sources;
                 const sourcesDiv = document.createElement('div');
                 sourcesDiv.classList.add('message-sources');
                 sourcesDiv.innerText = "Nguồn:";
@@ -106,11 +102,26 @@ async function sendMessage() {
                     sourcesDiv.appendChild(sourceTag);
                 });
                 messageContainer.appendChild(sourcesDiv);
-            } else {
-                fullAiResponse += chunk;
+            } else if (event.event === "token") {
+                fullAiResponse += event.text;
                 pElement.innerText = fullAiResponse;
+            } else if (event.event === "error") {
+                throw new Error(event.detail);
             }
+        }
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
             
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop();
+
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                handleEvent(JSON.parse(line));
+            }
             chatBox.scrollTop = chatBox.scrollHeight;
         }
 
@@ -123,9 +134,6 @@ async function sendMessage() {
             pElement.innerText = "Xin lỗi, đã có lỗi xảy ra. Vui lòng thử lại.";
         }
     } finally {
-        if (fullAiResponse) {
-             chatHistory.push({ role: 'ai', content: fullAiResponse });
-        }
         // --- SỬA ĐỔI: Luôn chuyển nút về trạng thái "Gửi" khi kết thúc ---
         toggleButtonState(false);
     }
@@ -1,14 +1,29 @@
 import customtkinter as ctk
 import requests
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from PIL import Image
 import os
-import speech_recognition as sr # Thêm thư viện nhận dạng giọng nói
+import time
+import uuid
+from voice_input import NoSpeechError, RecognitionError, VoiceInput, create_speech_backend
 
 # --- Cấu hình ---
 API_URL = "http://localhost:8000/api/v1/chat/query"
 APP_TITLE = "Trợ lý Ảo Ngân hàng"
 WINDOW_SIZE = "800x600"
+# Mã kiosk gửi kèm mỗi request (header X-Client-ID) để server chia lượt công bằng giữa các kiosk
+KIOSK_ID = os.getenv("KIOSK_ID", f"kiosk-{uuid.uuid4().hex[:8]}")
+# Timeout (kết nối, đọc giữa hai phần dữ liệu) cho request chat
+REQUEST_TIMEOUT = (5, 60)
+# Câu trả lời stream được gom lại và vẽ lại tối đa ~20 lần/giây thay vì mỗi chunk một lần
+FRAME_INTERVAL_MS = 50
+# Số bubble tối đa giữ trên màn hình; bubble cũ nhất được tái sử dụng cho tin nhắn mới
+MAX_BUBBLES = 40
+# Chu kỳ kiểm tra có cần hiệu chỉnh lại nhiễu nền không (chỉ làm khi kiosk rảnh)
+RECALIBRATE_CHECK_MS = 30_000
 
 # --- Màu sắc và Font chữ ---
 BG_COLOR = "#242424"
@@ -75,9 +90,39 @@ class ChatApp(ctk.CTk):
         self.mic_button.grid(row=0, column=2, padx=(0, 0))
 
         # --- Khởi tạo các biến ---
-        self.chat_history = []
+        # Lịch sử hội thoại được giữ phía server theo session_id; mỗi lần mở kiosk là một phiên mới
+        self.session_id = uuid.uuid4().hex
+        # Một session HTTP dùng chung (giữ kết nối keep-alive) và MỘT luồng làm việc cho mạng/giọng nói,
+        # thay vì tạo thread và kết nối mới cho mỗi câu hỏi
+        self.http = requests.Session()
+        self.http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.http.headers.update({"X-Client-ID": KIOSK_ID})
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kiosk-worker")
+
+        # Các bubble đang hiển thị (khung, nhãn), cũ nhất ở đầu
+        self.bubbles = deque()
+        # Bộ đệm câu trả lời: luồng làm việc chỉ ghi vào đây, luồng giao diện đọc và vẽ theo nhịp FRAME_INTERVAL_MS
+        self.stream_lock = threading.Lock()
+        self.stream_pending = []
+        self.stream_done = False
         self.ai_bubble_label = None
+        self.ai_text = ""
+        # Đang nghe micro (ô nhập chứa thông báo trạng thái, không phải câu hỏi)
+        self.listening = False
         self.add_chat_bubble("ai", "Xin chào! Tôi có thể giúp gì cho bạn hôm nay?")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Backend nhận dạng chọn qua VOICE_BACKEND (google, vosk, fake); nhiễu nền được hiệu chỉnh ngay khi mở kiosk
+        try:
+            self.voice = VoiceInput(create_speech_backend())
+        except Exception as e:
+            print(f"⚠️ Không khởi tạo được nhận dạng giọng nói: {e}")
+            self.voice = None
+            self.mic_button.configure(state="disabled")
+        else:
+            self.worker.submit(self.calibrate_voice)
+            self.after(RECALIBRATE_CHECK_MS, self.schedule_recalibration)
 
     def load_icon(self, filename, size=(20, 20)):
         if os.path.exists(filename):
@@ -95,58 +140,80 @@ class ChatApp(ctk.CTk):
         else:
             bubble_color = AI_BUBBLE_COLOR
             justify = "left"; anchor = "w"; padx = (0, 50)
-            
-        bubble_frame = ctk.CTkFrame(self.chat_frame, fg_color=bubble_color, corner_radius=15)
+
+        if len(self.bubbles) >= MAX_BUBBLES:
+            # Tái sử dụng bubble cũ nhất (đưa xuống cuối) thay vì tạo widget mới mãi mãi trong suốt cả ngày
+            bubble_frame, message_label = self.bubbles.popleft()
+            bubble_frame.pack_forget()
+            bubble_frame.configure(fg_color=bubble_color)
+            message_label.configure(text=text, justify=justify)
+        else:
+            bubble_frame = ctk.CTkFrame(self.chat_frame, fg_color=bubble_color, corner_radius=15)
+            message_label = ctk.CTkLabel(
+                bubble_frame, text=text, font=(FONT_FAMILY, 16),
+                wraplength=500, justify=justify, text_color=TEXT_COLOR
+            )
+            message_label.pack(padx=15, pady=10)
         # Khung bubble sẽ tự động co giãn theo chiều rộng nếu cần
         bubble_frame.pack(anchor=anchor, padx=padx, pady=4, fill="x")
-        
-        message_label = ctk.CTkLabel(
-            bubble_frame, text=text, font=(FONT_FAMILY, 16),
-            wraplength=500, justify=justify, text_color=TEXT_COLOR
-        )
-        message_label.pack(padx=15, pady=10)
+        self.bubbles.append((bubble_frame, message_label))
         return message_label
+
+    def on_close(self):
+        """Dừng luồng làm việc và đóng kết nối HTTP trước khi thoát."""
+        self.worker.shutdown(wait=False, cancel_futures=True)
+        self.http.close()
+        self.destroy()
     
     # --- TÍCH HỢP CHUYỂN ĐỔI GIỌNG NÓI ---
     
+    def calibrate_voice(self):
+        """Chạy trên luồng làm việc: đo nhiễu nền một lần thay vì 0.5 giây mỗi lần bấm mic."""
+        try:
+            self.voice.calibrate()
+        except Exception as e:
+            print(f"⚠️ Không hiệu chỉnh được micro: {e}")
+
+    def schedule_recalibration(self):
+        """Làm mới mức nhiễu nền định kỳ, chỉ khi không nghe và không stream câu trả lời."""
+        if not self.listening and self.ai_bubble_label is None and self.voice.needs_calibration:
+            self.worker.submit(self.calibrate_voice)
+        self.after(RECALIBRATE_CHECK_MS, self.schedule_recalibration)
+
     def on_mic_pressed(self):
         """Xử lý giao diện và bắt đầu luồng nhận dạng giọng nói."""
+        if self.voice is None or self.listening or self.ai_bubble_label is not None: return
+        self.listening = True
         self.user_input_entry.delete(0, "end")
         self.user_input_entry.insert(0, "Đang lắng nghe, mời bạn nói...")
         self.mic_button.configure(state="disabled", fg_color="#555555")
         self.send_button.configure(state="disabled")
 
-        threading.Thread(target=self.recognize_and_send, daemon=True).start()
+        self.worker.submit(self.recognize_and_send)
 
     def recognize_and_send(self):
-        """Lắng nghe từ micro, chuyển thành văn bản và tự động gửi đi."""
-        recognizer = sr.Recognizer()
-        with sr.Microphone() as source:
-            try:
-                recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                print("Listening...")
-                audio = recognizer.listen(source, timeout=5, phrase_time_limit=10)
-                
-                print("Recognizing...")
-                # Sử dụng Google Web Speech API để nhận dạng tiếng Việt
-                text = recognizer.recognize_google(audio, language="vi-VN")
-                print(f"Bạn đã nói: {text}")
-
-                self.after(0, self.process_recognized_text, text)
-            except sr.WaitTimeoutError:
-                self.after(0, self.update_input_placeholder, "Không nghe thấy gì, thử lại.")
-            except sr.UnknownValueError:
-                self.after(0, self.update_input_placeholder, "Không thể nhận dạng giọng nói.")
-            except sr.RequestError as e:
-                self.after(0, self.update_input_placeholder, f"Lỗi dịch vụ: {e}")
-            finally:
-                self.after(0, self.reset_input_state)
-
-    def process_recognized_text(self, text):
-        """Điền văn bản đã nhận dạng vào ô và tự động gửi."""
-        self.user_input_entry.delete(0, "end")
-        self.user_input_entry.insert(0, text)
-        self.on_send_pressed()
+        """
+        Nghe tới khi VAD xác định hết câu, nhận dạng và gửi câu hỏi NGAY trên luồng làm việc
+        (không vòng qua luồng giao diện); giao diện chỉ được báo để vẽ bubble.
+        """
+        try:
+            utterance = self.voice.listen()
+            self.after(0, self.update_input_placeholder, "Đang nhận dạng...")
+            text = self.voice.transcribe(utterance)
+            transcribed_at = time.perf_counter()
+            print(f"Bạn đã nói: {text}")
+        except (NoSpeechError, RecognitionError) as e:
+            self.after(0, self.update_input_placeholder, str(e))
+            self.after(0, self.reset_input_state)
+            return
+        except Exception as e:
+            self.after(0, self.update_input_placeholder, f"Lỗi micro: {e}")
+            self.after(0, self.reset_input_state)
+            return
+
+        self.reset_stream()
+        self.after(0, self.begin_answer, text)
+        self.get_ai_response(text, utterance=utterance, transcribed_at=transcribed_at)
 
     def update_input_placeholder(self, text):
         """Hiển thị thông báo trạng thái/lỗi trong ô nhập liệu."""
@@ -155,10 +222,15 @@ class ChatApp(ctk.CTk):
 
     def reset_input_state(self):
         """Kích hoạt lại các nút và xóa placeholder text nếu cần."""
-        self.mic_button.configure(state="normal", fg_color="transparent")
+        if self.ai_bubble_label is not None:
+            # Câu trả lời vẫn đang stream: flush_stream sẽ kích hoạt lại khi xong
+            return
+        self.listening = False
+        self.mic_button.configure(state="normal" if self.voice is not None else "disabled", fg_color="transparent")
         self.send_button.configure(state="normal")
         current_text = self.user_input_entry.get()
-        if "Đang lắng nghe" in current_text or "Lỗi" in current_text or "Không" in current_text:
+        if "Đang lắng nghe" in current_text or "Đang nhận dạng" in current_text \
+                or "Lỗi" in current_text or "Không" in current_text:
             self.user_input_entry.delete(0, "end")
             
     # --- CÁC HÀM XỬ LÝ CHAT CÓ SẴN ---
@@ -166,40 +238,74 @@ class ChatApp(ctk.CTk):
     def on_send_pressed(self, event=None):
         user_text = self.user_input_entry.get()
         if not user_text.strip(): return
+        # Phím Enter vẫn hoạt động khi nút Gửi bị khóa: bỏ qua nếu câu trả lời trước chưa stream xong
+        if self.ai_bubble_label is not None or self.listening: return
+        self.reset_stream()
+        self.begin_answer(user_text)
+        self.worker.submit(self.get_ai_response, user_text)
+
+    def begin_answer(self, user_text):
+        """Luồng giao diện: thêm bubble câu hỏi và bubble trả lời rỗng, bắt đầu vẽ theo nhịp."""
+        self.listening = False
         self.add_chat_bubble("user", user_text)
-        self.chat_history.append({"role": "user", "content": user_text})
         self.user_input_entry.delete(0, "end")
         self.send_button.configure(state="disabled")
         self.mic_button.configure(state="disabled")
-        threading.Thread(target=self.get_ai_response, args=(user_text,)).start()
-
-    def update_ai_bubble_text(self, chunk):
-        if self.ai_bubble_label:
-            current_text = self.ai_bubble_label.cget("text")
-            self.ai_bubble_label.configure(text=current_text + chunk)
 
-    def get_ai_response(self, question):
+        # Bubble trả lời được tạo trên luồng giao diện; luồng làm việc chỉ đẩy chunk vào bộ đệm
         self.ai_bubble_label = self.add_chat_bubble("ai", "")
-        full_ai_response = ""
+        self.ai_text = ""
+        self.after(FRAME_INTERVAL_MS, self.flush_stream)
+
+    def reset_stream(self):
+        """Xóa bộ đệm trước mỗi câu hỏi (gọi trước khi luồng làm việc bắt đầu đẩy chunk)."""
+        with self.stream_lock:
+            self.stream_pending.clear()
+            self.stream_done = False
+
+    def push_stream_text(self, text, done=False):
+        """Gọi từ luồng làm việc: thêm văn bản vào bộ đệm (không chạm vào widget)."""
+        with self.stream_lock:
+            if text:
+                self.stream_pending.append(text)
+            self.stream_done = self.stream_done or done
+
+    def flush_stream(self):
+        """Vẽ lại bubble trả lời một lần cho mọi chunk nhận được từ khung hình trước; dừng hẳn khi stream kết thúc."""
+        with self.stream_lock:
+            pending = "".join(self.stream_pending)
+            self.stream_pending.clear()
+            done = self.stream_done
+        if pending and self.ai_bubble_label is not None:
+            self.ai_text += pending
+            self.ai_bubble_label.configure(text=self.ai_text)
+        if done:
+            self.ai_bubble_label = None
+            self.reset_input_state()
+        else:
+            self.after(FRAME_INTERVAL_MS, self.flush_stream)
+
+    def get_ai_response(self, question, utterance=None, transcribed_at=None):
         try:
-            response = requests.post(
+            if utterance is not None:
+                sent_at = time.perf_counter()
+                print(f"ℹ️ Giọng nói: hết câu → gửi request {(sent_at - utterance.speech_ended) * 1000:.0f} ms "
+                      f"(chờ im lặng {(utterance.detected_at - utterance.speech_ended) * 1000:.0f} ms, "
+                      f"nhận dạng {(transcribed_at - utterance.detected_at) * 1000:.0f} ms)")
+            with self.http.post(
                 API_URL,
-                json={"question": question, "history": self.chat_history[:-1]},
-                stream=True
-            )
-            response.raise_for_status()
-            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
-                if chunk:
-                    self.after(0, self.update_ai_bubble_text, chunk)
-                    full_ai_response += chunk
+                json={"question": question, "session_id": self.session_id},
+                stream=True,
+                timeout=REQUEST_TIMEOUT,
+            ) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                    if chunk:
+                        self.push_stream_text(chunk)
         except requests.exceptions.RequestException as e:
-            error_message = f"[Lỗi kết nối: {e}]"
-            self.after(0, self.update_ai_bubble_text, error_message)
-            full_ai_response = error_message
-        
-        self.chat_history.append({"role": "ai", "content": full_ai_response.strip()})
-        self.ai_bubble_label = None
-        self.after(0, self.reset_input_state)
+            self.push_stream_text(f"[Lỗi kết nối: {e}]")
+        finally:
+            self.push_stream_text("", done=True)
 
 if __name__ == "__main__":
     app = ChatApp()
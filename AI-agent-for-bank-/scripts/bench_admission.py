@@ -0,0 +1,89 @@
+# scripts/bench_admission.py
+"""
+Kiểm tra kiểm soát tải của /api/v1/chat/query khi có một đợt request dồn dập:
+- gửi đồng thời `--requests` request từ `--clients` client (header X-Client-ID),
+  một client "ồn ào" gửi gấp nhiều lần các client khác;
+- thống kê mã trạng thái (200/429/503), Retry-After, thời gian tới token đầu tiên theo từng client;
+- hủy giữa chừng `--abandon` request để kiểm tra server dừng sinh câu trả lời (client_disconnects,
+  in_flight trở về 0) qua /api/v1/health/ready.
+
+Cách dùng (server chạy với model giả lập):
+    CHAT_PROVIDER=fake ANSWER_CACHE_ENABLED=false CHAT_MAX_CONCURRENCY=4 uvicorn app.main:app
+    python scripts/bench_admission.py --requests 60 --clients 6 --abandon 10
+"""
+import time
+import json
+import asyncio
+import argparse
+import statistics
+from collections import Counter, defaultdict
+import httpx
+
+DEFAULT_BASE_URL = "http://localhost:8000/api/v1"
+QUESTIONS = [
+    "Số hotline của ngân hàng là gì?",
+    "Phí thường niên thẻ tín dụng là bao nhiêu?",
+    "Làm sao để mở tài khoản trực tuyến?",
+]
+
+
+async def one_request(client: httpx.AsyncClient, base_url: str, client_id: str, i: int, abandon_after: float = 0):
+    started = time.perf_counter()
+    headers = {"X-Client-ID": client_id}
+    body = {"question": QUESTIONS[i % len(QUESTIONS)]}
+    try:
+        async with client.stream("POST", f"{base_url}/chat/query", params={"format": "ndjson"},
+                                 json=body, headers=headers) as response:
+            if response.status_code != 200:
+                return {"client": client_id, "status": response.status_code,
+                        "retry_after": response.headers.get("retry-after")}
+            ttft = None
+            async for line in response.aiter_lines():
+                if abandon_after and time.perf_counter() - started > abandon_after:
+                    return {"client": client_id, "status": "abandoned"}
+                if line and ttft is None and json.loads(line)["event"] == "token":
+                    ttft = time.perf_counter() - started
+            return {"client": client_id, "status": 200, "ttft": ttft, "total": time.perf_counter() - started}
+    except httpx.HTTPError as e:
+        return {"client": client_id, "status": type(e).__name__}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra hàng đợi, từ chối nhanh và hủy khi client ngắt kết nối")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--clients", type=int, default=6)
+    parser.add_argument("--abandon", type=int, default=10, help="Số request bị client bỏ ngang sau 0.5 giây")
+    args = parser.parse_args()
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        jobs = []
+        for i in range(args.requests):
+            # Client 0 gửi một nửa số request, các client còn lại chia nhau phần còn lại
+            client_id = "kiosk-0" if i % 2 == 0 else f"kiosk-{1 + i % (args.clients - 1)}"
+            abandon_after = 0.5 if i < args.abandon else 0
+            jobs.append(one_request(client, args.base_url, client_id, i, abandon_after))
+        started = time.perf_counter()
+        results = await asyncio.gather(*jobs)
+        elapsed = time.perf_counter() - started
+
+        print(f"{len(results)} request trong {elapsed:.1f}s: {dict(Counter(str(r['status']) for r in results))}")
+        retry_after = [int(r["retry_after"]) for r in results if r.get("retry_after")]
+        if retry_after:
+            print(f"Retry-After: min={min(retry_after)}s, max={max(retry_after)}s")
+        by_client = defaultdict(list)
+        for r in results:
+            if r["status"] == 200 and r["ttft"] is not None:
+                by_client[r["client"]].append(r["ttft"])
+        for client_id in sorted(by_client):
+            ttfts = by_client[client_id]
+            print(f"  {client_id}: {len(ttfts)} thành công, TTFT p50={statistics.median(ttfts) * 1000:.0f} ms, "
+                  f"max={max(ttfts) * 1000:.0f} ms")
+
+        await asyncio.sleep(1)
+        stats = (await client.get(f"{args.base_url}/health/ready")).json().get("admission")
+        print(f"Trạng thái kiểm soát tải sau đợt tải: {json.dumps(stats, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
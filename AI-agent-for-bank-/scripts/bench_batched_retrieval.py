@@ -0,0 +1,125 @@
+# scripts/bench_batched_retrieval.py
+"""
+Đo thông lượng truy xuất (VectorDBService.search) khi có N client đồng thời, tắt/bật gom lô truy xuất
+(retrieval_batcher): mỗi client gửi liên tục các câu hỏi trong --seconds giây.
+
+Chạy offline với embedding "fake" (vector của "hashing" + độ trễ giả lập FAKE_EMBEDDING_LATENCY_MS mỗi lời gọi,
+FAKE_EMBEDDING_PER_TEXT_MS mỗi câu) để mô phỏng API embedding từ xa; --api-concurrency giới hạn số lời gọi embedding
+chạy cùng lúc như connection pool/quota của API thật (0 = không giới hạn). Cache embedding và lexical fast path bị tắt
+để mọi câu hỏi đều đi qua bước embedding và FAISS. Chỉ mục lấy từ VECTOR_DB_PATH (chạy scripts/ingest_data.py trước).
+
+Cách dùng:
+    python scripts/bench_batched_retrieval.py --clients 1 16 64
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+os.environ["EMBEDDING_PROVIDER"] = "fake"
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+os.environ["LEXICAL_FASTPATH_ENABLED"] = "false"
+
+from langchain_core.embeddings import Embeddings
+from app.core.config import settings
+from app.services.vector_db_service import VectorDBService
+
+QUESTIONS = [
+    "Lãi suất tiết kiệm online kỳ hạn 12 tháng là bao nhiêu?",
+    "Điều kiện vay tiêu dùng tín chấp là gì?",
+    "Phí thường niên thẻ Visa Platinum là bao nhiêu?",
+    "Mua ngoại tệ tiền mặt cần giấy tờ gì?",
+    "Chuyển tiền đi nước ngoài cho du học cần hồ sơ gì?",
+    "Tôi chuyển tiền nhầm tài khoản thì phải làm sao?",
+    "Máy ATM nuốt thẻ thì phải làm gì?",
+    "Số hotline của ngân hàng là gì?",
+]
+
+
+class LimitedEmbeddings(Embeddings):
+    """Bọc model embedding: đếm số lời gọi API và giới hạn số lời gọi chạy đồng thời."""
+
+    def __init__(self, underlying: Embeddings, max_concurrency: int):
+        self.underlying = underlying
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self.calls = 0
+
+    async def _call(self, coroutine_fn, *args, **kwargs):
+        self.calls += 1
+        if self.semaphore is None:
+            return await coroutine_fn(*args, **kwargs)
+        async with self.semaphore:
+            return await coroutine_fn(*args, **kwargs)
+
+    def embed_documents(self, texts):
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.underlying.embed_query(text)
+
+    async def aembed_documents(self, texts, **kwargs):
+        return await self._call(self.underlying.aembed_documents, texts, **kwargs)
+
+    async def aembed_query(self, text):
+        return await self._call(self.underlying.aembed_query, text)
+
+
+async def run_clients(service: VectorDBService, clients: int, seconds: float) -> dict:
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(client_id: int):
+        i = 0
+        while time.perf_counter() < deadline:
+            question = QUESTIONS[(client_id + i) % len(QUESTIONS)]
+            started = time.perf_counter()
+            await service.search(question)
+            latencies.append((time.perf_counter() - started) * 1000)
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    elapsed = time.perf_counter() - started
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {"qps": len(latencies) / elapsed, "p50": p50, "p95": p95, "queries": len(latencies)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Đo thông lượng truy xuất khi tắt/bật gom lô")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--api-concurrency", type=int, default=8,
+                        help="Số lời gọi API embedding tối đa chạy cùng lúc (0 = không giới hạn)")
+    args = parser.parse_args()
+
+    print(f"Embedding giả lập {settings.FAKE_EMBEDDING_LATENCY_MS:.0f} ms/lời gọi + "
+          f"{settings.FAKE_EMBEDDING_PER_TEXT_MS} ms/câu, cửa sổ gom lô {settings.RETRIEVAL_BATCH_WINDOW_MS} ms, "
+          f"lô tối đa {settings.RETRIEVAL_MAX_BATCH}, API tối đa {args.api_concurrency or 'không giới hạn'} lời gọi "
+          f"đồng thời, {os.cpu_count()} CPU")
+    print(f"{'client':>7} {'chế độ':<10} {'QPS':>8} {'p50':>9} {'p95':>9} {'gọi API/câu':>12} "
+          f"{'lô embed TB':>12} {'lô FAISS TB':>12}")
+    for batching in (False, True):
+        settings.RETRIEVAL_BATCHING_ENABLED = batching
+        for clients in args.clients:
+            service = VectorDBService()
+            service.embeddings = LimitedEmbeddings(service.embeddings, args.api_concurrency)
+            if service.batcher is not None:
+                service.batcher.embeddings = service.embeddings
+            result = await run_clients(service, clients, args.seconds)
+            stats = service.batcher.stats() if service.batcher is not None else None
+            embed = f"{stats['embedding']['mean_batch_size']:.1f}" if stats else "-"
+            search = f"{stats['faiss_search']['mean_batch_size']:.1f}" if stats else "-"
+            print(f"{clients:>7} {'gom lô' if batching else 'từng câu':<10} {result['qps']:>8.1f} "
+                  f"{result['p50']:>7.1f}ms {result['p95']:>7.1f}ms {service.embeddings.calls / result['queries']:>12.2f} "
+                  f"{embed:>12} {search:>12}")
+            await service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
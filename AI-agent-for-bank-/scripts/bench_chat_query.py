@@ -0,0 +1,89 @@
+# scripts/bench_chat_query.py
+"""
+Đo thời gian tới byte đầu tiên (TTFB) và tổng thời gian của endpoint /api/v1/chat/query.
+Với --format ndjson, đo thêm thời gian tới token đầu tiên (TTFT, sự kiện `token` đầu tiên)
+và số phần (chunk) mà câu trả lời được chia ra.
+
+Cách dùng (server đang chạy bằng uvicorn):
+    python scripts/bench_chat_query.py --runs 20 --history-turns 10
+    CHAT_PROVIDER=fake ANSWER_CACHE_ENABLED=false uvicorn app.main:app   # model giả lập
+    python scripts/bench_chat_query.py --runs 20 --format ndjson
+"""
+import json
+import argparse
+import statistics
+import time
+import requests
+
+DEFAULT_URL = "http://localhost:8000/api/v1/chat/query"
+DEFAULT_QUESTION = "Số hotline của ngân hàng là gì?"
+
+
+def build_history(turns: int) -> list:
+    """Tạo lịch sử chat giả gồm `turns` cặp hỏi/đáp."""
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Câu hỏi trước đó số {i + 1} về thẻ tín dụng?"})
+        history.append({"role": "ai", "content": f"Đây là câu trả lời số {i + 1} về thẻ tín dụng."})
+    return history
+
+
+def run_once(session: requests.Session, url: str, question: str, history: list, stream_format: str = "text") -> tuple:
+    """Gửi một request, trả về (ttfb, ttft, tổng thời gian, số phần câu trả lời); thời gian tính bằng giây."""
+    started = time.perf_counter()
+    ttfb = ttft = None
+    parts = 0
+    with session.post(url, params={"format": stream_format}, json={"question": question, "history": history},
+                      stream=True, timeout=120) as response:
+        response.raise_for_status()
+        if stream_format == "ndjson":
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                ttfb = ttfb or time.perf_counter() - started
+                if json.loads(line)["event"] == "token":
+                    ttft = ttft or time.perf_counter() - started
+                    parts += 1
+        else:
+            for chunk in response.iter_content(chunk_size=None):
+                if chunk:
+                    ttfb = ttfb or time.perf_counter() - started
+                    parts += 1
+            ttft = ttfb
+    total = time.perf_counter() - started
+    return (ttfb or total), (ttft or total), total, parts
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo TTFB của /api/v1/chat/query")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--question", default=DEFAULT_QUESTION)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--history-turns", type=int, default=0)
+    parser.add_argument("--format", choices=["text", "ndjson"], default="text")
+    args = parser.parse_args()
+
+    history = build_history(args.history_turns)
+    session = requests.Session()
+    ttfbs, ttfts, totals = [], [], []
+    for i in range(args.runs):
+        ttfb, ttft, total, parts = run_once(session, args.url, args.question, history, args.format)
+        ttfbs.append(ttfb)
+        ttfts.append(ttft)
+        totals.append(total)
+        print(f"  - Lần {i + 1}: TTFB={ttfb * 1000:.1f} ms, TTFT={ttft * 1000:.1f} ms, "
+              f"tổng={total * 1000:.1f} ms, {parts} phần")
+
+    print(f"\nTTFB   : p50={statistics.median(ttfbs) * 1000:.1f} ms, p95={percentile(ttfbs, 95) * 1000:.1f} ms")
+    print(f"TTFT   : p50={statistics.median(ttfts) * 1000:.1f} ms, p95={percentile(ttfts, 95) * 1000:.1f} ms")
+    print(f"Tổng   : p50={statistics.median(totals) * 1000:.1f} ms, p95={percentile(totals, 95) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# scripts/bench_coalescing.py
+"""
+Mô phỏng giờ mở cửa chi nhánh: `--requests` kiosk gửi câu hỏi trong vòng `--spread` giây, phần lớn (--duplicate-rate)
+là cùng một câu gợi ý (khác nhau chữ hoa/thường, dấu câu), còn lại là câu hỏi khác. So sánh khi tắt/bật gộp request
+(request_coalescer):
+- số lời gọi tới chat model (upstream);
+- thời gian tới token đầu và tổng thời gian của từng request, tính từ lúc kiosk gửi;
+- số request bị từ chối bởi kiểm soát tải (AdmissionController, như endpoint chat: request được gộp trả suất ngay,
+  request mở luồng chung giao suất cho luồng).
+Cuối cùng, `--abandon` request trong một đợt trùng nhau ngắt kết nối sau token đầu: những request còn lại
+vẫn phải nhận đủ câu trả lời và chỉ có một lời gọi model; luồng chung vẫn giữ một suất khi request mở nó đã rời đi,
+và mọi suất được trả khi xong.
+
+Chạy offline với model giả lập (CHAT_PROVIDER=fake), cache câu trả lời bị tắt để mọi câu hỏi đều tới model.
+Chỉ mục lấy từ VECTOR_DB_PATH (chạy scripts/ingest_data.py trước).
+
+Cách dùng:
+    python scripts/bench_coalescing.py --requests 50 --spread 1.0
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+os.environ["CHAT_PROVIDER"] = "fake"
+os.environ["ANSWER_CACHE_ENABLED"] = "false"
+
+from app.core.config import settings
+from app.services.admission_service import AdmissionController, AdmissionRejected
+from app.services.chat_model import FakeStreamingChatModel
+from app.services.gemini_service import GeminiService
+from app.services.vector_db_service import VectorDBService
+
+SUGGESTED = ["Số hotline của ngân hàng là gì?", "số hotline của ngân hàng là gì", "Số hotline của ngân hàng là gì ?"]
+OTHERS = [
+    "Lãi suất tiết kiệm online kỳ hạn 12 tháng là bao nhiêu?",
+    "Phí thường niên thẻ Visa Platinum là bao nhiêu?",
+    "Máy ATM nuốt thẻ thì phải làm gì?",
+    "Làm sao để mở tài khoản trực tuyến?",
+]
+
+upstream_calls = 0
+_original_astream = FakeStreamingChatModel._astream
+
+
+async def _counting_astream(self, *args, **kwargs):
+    global upstream_calls
+    upstream_calls += 1
+    async for chunk in _original_astream(self, *args, **kwargs):
+        yield chunk
+
+
+FakeStreamingChatModel._astream = _counting_astream
+
+
+async def kiosk(gemini: GeminiService, admission: AdmissionController, client_id: str, question: str,
+                delay: float, abandon: bool = False) -> dict:
+    await asyncio.sleep(delay)
+    started = time.perf_counter()
+    try:
+        ticket = await admission.acquire(client_id)
+    except AdmissionRejected:
+        return {"status": "rejected"}
+    first, answer, done = None, [], {}
+    try:
+        async for event, data in gemini.stream_events(question, [], on_coalesced=ticket.release,
+                                                     hand_off=ticket.hand_off):
+            if event == "token":
+                if first is None:
+                    first = time.perf_counter() - started
+                    if abandon:
+                        # Suất còn giữ ngay sau khi rời đi (luồng chung vẫn đang sinh câu trả lời)
+                        ticket.release()
+                        return {"status": "abandoned", "held": admission.stats()["in_flight"]}
+                answer.append(data)
+            elif event == "done":
+                done = data
+    finally:
+        ticket.release()
+    return {"status": "ok", "ttft": first * 1000, "total": (time.perf_counter() - started) * 1000,
+            "answer": "".join(answer), "coalesced": done.get("coalesced", False)}
+
+
+def burst_plan(requests: int, spread: float, duplicate_rate: float, seed: int) -> list:
+    rng = random.Random(seed)
+    plan = []
+    for i in range(requests):
+        question = rng.choice(SUGGESTED) if rng.random() < duplicate_rate else rng.choice(OTHERS)
+        plan.append((f"kiosk-{i}", question, rng.uniform(0, spread)))
+    return plan
+
+
+def percentiles(values) -> str:
+    if not values:
+        return "-"
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"{p50:7.0f} {p95:7.0f}"
+
+
+async def run_burst(gemini: GeminiService, plan: list) -> dict:
+    global upstream_calls
+    upstream_calls = 0
+    admission = AdmissionController(settings.CHAT_MAX_CONCURRENCY, settings.CHAT_MAX_QUEUE_DEPTH,
+                                    settings.CHAT_QUEUE_TIMEOUT_SECONDS, settings.CHAT_MAX_REQUESTS_PER_CLIENT)
+    results = await asyncio.gather(*(kiosk(gemini, admission, client_id, question, delay)
+                                     for client_id, question, delay in plan))
+    ok = [r for r in results if r["status"] == "ok"]
+    return {"calls": upstream_calls, "ok": len(ok), "rejected": len(results) - len(ok),
+            "coalesced": sum(r["coalesced"] for r in ok),
+            "ttft": [r["ttft"] for r in ok], "total": [r["total"] for r in ok]}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Đo hiệu quả của việc gộp request giống hệt nhau")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--spread", type=float, default=1.0, help="Các kiosk gửi trong khoảng này (giây)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.8)
+    parser.add_argument("--first-token-ms", type=float, default=800)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--abandon", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    settings.FAKE_LLM_FIRST_TOKEN_MS = args.first_token_ms
+    settings.FAKE_LLM_TOKEN_DELAY_MS = args.token_ms
+
+    vector_db = VectorDBService()
+    plan = burst_plan(args.requests, args.spread, args.duplicate_rate, args.seed)
+    print(f"{args.requests} kiosk trong {args.spread:.1f} s, {args.duplicate_rate:.0%} cùng câu gợi ý; model giả lập "
+          f"{args.first_token_ms:.0f} ms token đầu + {args.token_ms:.0f} ms/token; tối đa {settings.CHAT_MAX_CONCURRENCY} "
+          f"request đồng thời, hàng đợi {settings.CHAT_MAX_QUEUE_DEPTH}")
+    print(f"{'chế độ':<10} {'gọi model':>10} {'thành công':>11} {'từ chối':>8} {'được gộp':>9} "
+          f"{'TTFT p50':>9} {'p95':>7} {'tổng p50':>9} {'p95':>7}  (ms)")
+    for enabled in (False, True):
+        settings.COALESCE_REQUESTS_ENABLED = enabled
+        gemini = GeminiService(vector_db)
+        result = await run_burst(gemini, plan)
+        print(f"{'gộp' if enabled else 'không gộp':<10} {result['calls']:>10} {result['ok']:>11} {result['rejected']:>8} "
+              f"{result['coalesced']:>9} {percentiles(result['ttft']):>17} {percentiles(result['total']):>17}")
+
+    # Một nửa số kiosk ngắt kết nối sau token đầu, kể cả kiosk đã mở luồng chung
+    global upstream_calls
+    upstream_calls = 0
+    settings.COALESCE_REQUESTS_ENABLED = True
+    gemini = GeminiService(vector_db)
+    admission = AdmissionController(max_concurrency=64, max_queue_depth=64, max_per_client=64)
+    total = args.abandon * 2
+    results = await asyncio.gather(*(kiosk(gemini, admission, f"kiosk-{i}", SUGGESTED[0], i * 0.02,
+                                           abandon=i % 2 == 0) for i in range(total)))
+    finished = [r for r in results if r["status"] == "ok"]
+    answers = {r["answer"] for r in finished}
+    leader_held = results[0].get("held")
+    await asyncio.sleep(0)
+    print(f"\n{total} request trùng nhau, {args.abandon} ngắt sau token đầu (kể cả request đầu tiên): "
+          f"{len(finished)} nhận đủ câu trả lời ({len(answers)} nội dung khác nhau), {upstream_calls} lời gọi model, "
+          f"luồng còn mở: {gemini.coalescer.in_flight()}")
+    print(f"Suất đang giữ ngay sau khi request đầu tiên rời đi: {leader_held} (phải >= 1), "
+          f"sau khi xong: {admission.stats()['in_flight']} (phải là 0)")
+    await vector_db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+# scripts/bench_cold_start.py
+"""
+Đo thời gian khởi động lạnh: khởi chạy uvicorn trong một tiến trình mới rồi ghi nhận
+thời điểm /health/live phản hồi, /health/ready báo sẵn sàng và câu hỏi đầu tiên trả về byte đầu tiên.
+Đồng thời đo riêng thời gian `import app.main` (phải nhanh vì không còn nạp chỉ mục lúc import).
+
+Cách dùng:
+    python scripts/bench_cold_start.py --runs 3
+    WARMUP_ENABLED=false python scripts/bench_cold_start.py --runs 3
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+import subprocess
+import requests
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_QUESTION = "Số hotline của ngân hàng là gì?"
+POLL_INTERVAL = 0.02
+
+
+def measure_import() -> float:
+    """Thời gian (ms) để import app.main trong một tiến trình Python mới."""
+    code = "import time; t = time.perf_counter(); import app.main; print((time.perf_counter() - t) * 1000)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=project_root, env=os.environ.copy())
+    return float(output.decode().strip().splitlines()[-1])
+
+
+def wait_for(url: str, started: float, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            response = requests.get(url, timeout=1)
+            if response.ok:
+                return time.perf_counter() - started
+            if response.status_code == 503 and response.json().get("status") == "failed":
+                raise RuntimeError(f"Khởi động thất bại: {response.json().get('error')}")
+        except requests.ConnectionError:
+            pass
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError(f"Quá thời gian chờ {url}")
+
+
+def first_query(base_url: str, question: str, started: float, timeout: float) -> tuple:
+    """Gửi câu hỏi đầu tiên; trả về (giây tới byte đầu tiên, giây tới khi xong) tính từ lúc khởi chạy."""
+    ttfb = None
+    with requests.post(f"{base_url}/api/v1/chat/query", json={"question": question, "history": []},
+                       stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=None):
+            if chunk and ttfb is None:
+                ttfb = time.perf_counter() - started
+    done = time.perf_counter() - started
+    return (ttfb if ttfb is not None else done), done
+
+
+def run_once(port: int, question: str, timeout: float) -> dict:
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=project_root, env=os.environ.copy(),
+    )
+    try:
+        deadline = started + timeout
+        live = wait_for(f"{base_url}/api/v1/health/live", started, deadline)
+        ready = wait_for(f"{base_url}/api/v1/health/ready", started, deadline)
+        report = requests.get(f"{base_url}/api/v1/health/ready", timeout=5).json()
+        result = {"live_s": round(live, 3), "ready_s": round(ready, 3), "server_timings_ms": report.get("timings_ms")}
+        try:
+            ttfb, done = first_query(base_url, question, started, timeout)
+            result.update({"first_query_ttfb_s": round(ttfb, 3), "first_query_done_s": round(done, 3)})
+        except requests.RequestException as e:
+            result["first_query_error"] = str(e)
+        return result
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động lạnh tới câu hỏi đầu tiên")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--question", default=DEFAULT_QUESTION)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    print(f"import app.main: median {statistics.median(imports):.1f} ms")
+
+    for _ in range(args.runs):
+        print(json.dumps(run_once(args.port, args.question, args.timeout), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# scripts/bench_context_packing.py
+"""
+So sánh số token ngữ cảnh trong prompt và độ trễ sinh câu trả lời khi tắt/bật đóng gói ngữ cảnh (context_packer)
+trên một bộ câu hỏi cố định: các câu hỏi trong data/cau_hoi_thuong_gap.txt và vài câu hỏi về sản phẩm.
+
+Chạy offline với model giả lập (CHAT_PROVIDER=fake); thời gian xử lý prompt tỉ lệ với số token đầu vào được giả lập
+bằng --prefill-ms-per-1k, nên độ trễ đo được chỉ phản ánh phần do kích thước prompt gây ra.
+Cột "trúng" đếm số câu FAQ mà đoạn đầu câu trả lời chuẩn vẫn còn trong ngữ cảnh sau khi đóng gói.
+
+Cách dùng:
+    CHAT_PROVIDER=fake ANSWER_CACHE_ENABLED=false python scripts/bench_context_packing.py --budgets 1500 600
+"""
+import os
+import sys
+import asyncio
+import argparse
+import statistics
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import settings
+from app.core.prompts import estimate_tokens, format_context
+from app.services.context_packer import pack_context
+from app.services.gemini_service import GeminiService
+from app.services.vector_db_service import VectorDBService
+from scripts.eval_retrieval import FAQ_FILE, load_faq
+
+EXTRA_QUESTIONS = [
+    "Lãi suất tiết kiệm online kỳ hạn 12 tháng là bao nhiêu?",
+    "Rút tiền tiết kiệm trước hạn thì được tính lãi thế nào?",
+    "Điều kiện vay mua nhà là gì?",
+    "Phí thường niên thẻ tín dụng là bao nhiêu?",
+    "Chuyển tiền quốc tế mất bao lâu?",
+]
+
+
+async def measure(gemini: GeminiService, questions: list) -> list:
+    """Thời gian tới token đầu và tổng thời gian sinh (ms) cho từng câu hỏi."""
+    results = []
+    for question in questions:
+        async for event, data in gemini.stream_events(question, []):
+            if event == "done":
+                timings = data["timings_ms"]
+                results.append((timings["first_token_ms"] - timings["retrieval_ms"], timings["generation_ms"]))
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Đo hiệu quả của bước đóng gói ngữ cảnh")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[settings.CONTEXT_TOKEN_BUDGET])
+    parser.add_argument("--top-k", type=int, default=settings.RETRIEVAL_TOP_K)
+    parser.add_argument("--mmr-lambda", type=float, default=settings.CONTEXT_MMR_LAMBDA)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=200,
+                        help="Thời gian xử lý prompt giả lập của model (ms cho mỗi 1000 token đầu vào)")
+    args = parser.parse_args()
+    if settings.CHAT_PROVIDER != "fake":
+        print("⚠️ Nên chạy với CHAT_PROVIDER=fake để kết quả ổn định và không tốn quota.")
+    settings.FAKE_LLM_PREFILL_MS_PER_1K_TOKENS = args.prefill_ms_per_1k
+    settings.RETRIEVAL_TOP_K = args.top_k
+
+    vector_db = VectorDBService()
+    gemini = GeminiService(vector_db)
+    gemini.answer_cache = None
+    faq = load_faq(FAQ_FILE)
+    questions = [question for question, _ in faq] + EXTRA_QUESTIONS
+
+    retrieved = [await gemini.retrieve(question) for question in questions]
+    raw_tokens = [estimate_tokens(format_context(chunks)) for chunks in retrieved]
+    raw_hits = sum(any(probe in c["text"] for c in chunks) for (_, probe), chunks in zip(faq, retrieved))
+
+    settings.CONTEXT_PACKING_ENABLED = False
+    baseline = await measure(gemini, questions)
+    print(f"{len(questions)} câu hỏi, top-k={args.top_k}, prefill giả lập {args.prefill_ms_per_1k:.0f} ms/1k token")
+    print(f"{'chế độ':<16} {'token ngữ cảnh (TB)':>20} {'giảm':>7} {'chunk (TB)':>11} {'trúng':>7} "
+          f"{'prefill p50':>12} {'sinh p50':>10}")
+    print(f"{'không đóng gói':<16} {statistics.mean(raw_tokens):>20.0f} {'':>7} "
+          f"{statistics.mean(len(c) for c in retrieved):>11.1f} {raw_hits:>3}/{len(faq):<3} "
+          f"{statistics.median(r[0] for r in baseline):>10.0f}ms {statistics.median(r[1] for r in baseline):>8.0f}ms")
+
+    settings.CONTEXT_PACKING_ENABLED = True
+    settings.CONTEXT_MMR_LAMBDA = args.mmr_lambda
+    for budget in args.budgets:
+        settings.CONTEXT_TOKEN_BUDGET = budget
+        packed = [pack_context(chunks) for chunks in retrieved]
+        tokens = [estimate_tokens(format_context(chunks)) for chunks in packed]
+        hits = sum(any(probe in c["text"] for c in chunks) for (_, probe), chunks in zip(faq, packed))
+        timings = await measure(gemini, questions)
+        reduction = 1 - sum(tokens) / sum(raw_tokens)
+        print(f"{'ngân sách ' + str(budget):<16} {statistics.mean(tokens):>20.0f} {reduction:>6.0%} "
+              f"{statistics.mean(len(c) for c in packed):>11.1f} {hits:>3}/{len(faq):<3} "
+              f"{statistics.median(r[0] for r in timings):>10.0f}ms {statistics.median(r[1] for r in timings):>8.0f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+# scripts/bench_followup.py
+"""
+Đo thời gian tới token đầu tiên (TTFT) ở lượt 1 so với các lượt nối tiếp, theo từng chế độ xử lý câu hỏi nối tiếp:
+- "off":       không viết lại (truy xuất theo câu hỏi gốc, nhanh nhưng câu hỏi kiểu "Còn phí thì sao?" truy xuất kém),
+- "always":    luôn viết lại bằng model chính rồi mới truy xuất (tương đương ConversationalRetrievalChain),
+- "auto":      heuristic bỏ qua câu hỏi độc lập, viết lại bằng model nhỏ, truy xuất suy đoán song song.
+
+Chạy offline với model giả lập (CHAT_PROVIDER=fake); độ trễ của model nhỏ đặt bằng --condense-first-token-ms.
+
+Cách dùng:
+    CHAT_PROVIDER=fake ANSWER_CACHE_ENABLED=false python scripts/bench_followup.py --rounds 5
+"""
+import os
+import sys
+import asyncio
+import argparse
+import statistics
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from app.core.config import settings
+from app.core.prompts import CONDENSE_PROMPT
+from app.schemas.chat import ChatMessage
+from app.services.chat_model import FakeStreamingChatModel
+from app.services.gemini_service import GeminiService
+from app.services.vector_db_service import VectorDBService
+
+# Một cuộc hội thoại: lượt 1 độc lập, sau đó xen kẽ câu hỏi nối tiếp và câu hỏi độc lập
+CONVERSATION = [
+    "Tôi phải làm gì khi bị mất thẻ ATM?",
+    "Còn thẻ Visa thì sao?",
+    "Nó có bị tính phí không?",
+    "Số tổng đài chăm sóc khách hàng của ngân hàng là gì?",
+    "Chi nhánh đó có làm việc cuối tuần không?",
+    "Giờ làm việc của các chi nhánh ngân hàng là gì?",
+]
+
+MODES = {
+    "off": {"condense_mode": "off", "speculative_retrieval": False, "small_model": False},
+    "always": {"condense_mode": "always", "speculative_retrieval": False, "small_model": False},
+    "auto": {"condense_mode": "auto", "speculative_retrieval": True, "small_model": True},
+}
+
+
+async def run_conversation(gemini: GeminiService) -> list:
+    """Chạy một cuộc hội thoại, trả về TTFT (ms) của từng lượt."""
+    history, ttfts = [], []
+    for question in CONVERSATION:
+        answer_parts, timings = [], {}
+        async for event, data in gemini.stream_events(question, history):
+            if event == "token":
+                answer_parts.append(data)
+            elif event == "done":
+                timings = data["timings_ms"]
+        ttfts.append(timings["first_token_ms"])
+        history += [ChatMessage(role="user", content=question), ChatMessage(role="ai", content="".join(answer_parts))]
+    return ttfts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="So sánh độ trễ lượt 1 và lượt nối tiếp theo chế độ viết lại câu hỏi")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--condense-first-token-ms", type=float, default=120,
+                        help="Độ trễ token đầu của model nhỏ dùng để viết lại câu hỏi (giả lập)")
+    args = parser.parse_args()
+    if settings.CHAT_PROVIDER != "fake":
+        print("⚠️ Nên chạy với CHAT_PROVIDER=fake để kết quả ổn định và không tốn quota.")
+
+    vector_db = VectorDBService()
+    gemini = GeminiService(vector_db)
+    main_condense_chain = gemini.condense_chain
+    small_condense_chain = ChatPromptTemplate.from_template(CONDENSE_PROMPT) | FakeStreamingChatModel(
+        first_token_delay=args.condense_first_token_ms / 1000,
+        token_delay=settings.FAKE_LLM_TOKEN_DELAY_MS / 1000 / 2,
+    ) | StrOutputParser()
+
+    print(f"{'chế độ':<8} {'TTFT lượt 1':>12} {'TTFT lượt N (p50)':>18} {'nối tiếp':>10} {'độc lập':>10}")
+    for mode, options in MODES.items():
+        gemini.condense_mode = options["condense_mode"]
+        gemini.speculative_retrieval = options["speculative_retrieval"]
+        gemini.condense_chain = small_condense_chain if options["small_model"] and settings.CHAT_PROVIDER == "fake" \
+            else main_condense_chain
+        gemini.condense_stats.clear()
+        first, follow_up, dependent, standalone = [], [], [], []
+        for _ in range(args.rounds):
+            ttfts = await run_conversation(gemini)
+            first.append(ttfts[0])
+            follow_up += ttfts[1:]
+            dependent += [ttfts[i] for i in (1, 2, 4)]
+            standalone += [ttfts[i] for i in (3, 5)]
+        print(f"{mode:<8} {statistics.median(first):>10.0f}ms {statistics.median(follow_up):>16.0f}ms "
+              f"{statistics.median(dependent):>8.0f}ms {statistics.median(standalone):>8.0f}ms  "
+              f"{dict(gemini.condense_stats)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
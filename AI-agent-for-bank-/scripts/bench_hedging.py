@@ -0,0 +1,143 @@
+# scripts/bench_hedging.py
+"""
+Đo hiệu quả của hedging + failover + circuit breaker (resilient_generation) với hai provider giả lập, không cần mạng:
+- provider chính: token đầu sau --primary-ms, một tỷ lệ --slow-rate request chậm thêm --slow-ms (đuôi dài),
+  một tỷ lệ --error-rate request lỗi ngay;
+- provider dự phòng (vai trò Ollama chạy tại chỗ): chậm hơn ở trung vị (--fallback-ms) nhưng ổn định.
+
+So sánh độ trễ token đầu (p50/p95/p99) và số request lỗi giữa:
+1. chỉ provider chính, không hạn chót (hành vi cũ);
+2. provider chính + hạn chót token đầu + hedge/failover sang provider dự phòng.
+Cuối cùng mô phỏng provider chính sập hẳn để xem circuit breaker bỏ qua nó (số lời gọi tới provider chính).
+
+Cách dùng:
+    python scripts/bench_hedging.py --requests 400
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from app.services.chat_model import FakeStreamingChatModel
+from app.services.resilient_generation import (
+    ChatProvider, CircuitBreaker, GenerationUnavailable, ResilientGenerator
+)
+
+PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Ngữ cảnh:\n- Nguồn: faq.txt\n  Nội dung: Hotline của ngân hàng ABC là 1900 1234, hoạt động 24/7.\n"),
+    ("human", "{question}"),
+])
+
+
+class CountingModel(FakeStreamingChatModel):
+    """Model giả lập đếm số request nhận được."""
+    calls: int = 0
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
+
+
+def make_provider(name: str, model: FakeStreamingChatModel, threshold: int, reset_seconds: float) -> ChatProvider:
+    return ChatProvider(name, PROMPT | model | StrOutputParser(), CircuitBreaker(name, threshold, reset_seconds))
+
+
+async def run(generator: ResilientGenerator, requests: int, concurrency: int) -> dict:
+    latencies, outcomes, semaphore = [], Counter(), asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            info = {}
+            started = time.perf_counter()
+            first = None
+            try:
+                async for chunk in generator.astream({"question": f"Số hotline là gì? #{i}"}, info):
+                    if first is None and chunk:
+                        first = time.perf_counter() - started
+                latencies.append(first * 1000)
+                outcomes[info["provider"] + (" (hedge)" if info.get("hedged") else "")] += 1
+            except GenerationUnavailable:
+                latencies.append((time.perf_counter() - started) * 1000)
+                outcomes["lỗi/quá hạn"] += 1
+            except Exception:
+                latencies.append((time.perf_counter() - started) * 1000)
+                outcomes["lỗi"] += 1
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    latencies.sort()
+
+    def pct(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+    return {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "outcomes": outcomes}
+
+
+def report(title: str, result: dict) -> None:
+    outcomes = ", ".join(f"{name}: {count}" for name, count in sorted(result["outcomes"].items()))
+    print(f"{title:<34} {result['p50']:>8.0f}ms {result['p95']:>8.0f}ms {result['p99']:>8.0f}ms   {outcomes}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Đo hiệu quả của hedging và failover khi sinh câu trả lời")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--primary-ms", type=float, default=300)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=4000)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--fallback-ms", type=float, default=600)
+    parser.add_argument("--timeout", type=float, default=5.0, help="Hạn chót token đầu (giây)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    def primary_model(error_rate: float = args.error_rate) -> CountingModel:
+        return CountingModel(first_token_delay=args.primary_ms / 1000, token_delay=0.0, error_rate=error_rate,
+                             slow_rate=args.slow_rate, slow_delay=args.slow_ms / 1000)
+
+    def fallback_model() -> CountingModel:
+        return CountingModel(first_token_delay=args.fallback_ms / 1000, token_delay=0.0)
+
+    print(f"{args.requests} request, {args.concurrency} đồng thời. Provider chính: {args.primary_ms:.0f} ms, "
+          f"{args.slow_rate:.0%} chậm thêm {args.slow_ms:.0f} ms, {args.error_rate:.0%} lỗi. "
+          f"Dự phòng: {args.fallback_ms:.0f} ms.")
+    print(f"{'cấu hình':<34} {'p50':>10} {'p95':>10} {'p99':>10}   kết quả")
+
+    random.seed(args.seed)
+    baseline = ResilientGenerator([make_provider("chính", primary_model(), 10 ** 9, 0)],
+                                  first_token_timeout=3600, hedge_enabled=False)
+    report("chỉ provider chính (cũ)", await run(baseline, args.requests, args.concurrency))
+
+    random.seed(args.seed)
+    resilient = ResilientGenerator(
+        [make_provider("chính", primary_model(), 5, 30), make_provider("dự phòng", fallback_model(), 5, 30)],
+        first_token_timeout=args.timeout, hedge_percentile=95, hedge_default_delay=1.0,
+        hedge_min_delay=0.2, hedge_min_samples=20,
+    )
+    result = await run(resilient, args.requests, args.concurrency)
+    report("hedge p95 + failover + hạn chót", result)
+    print(f"  ngưỡng hedge cuối cùng: {resilient.hedge_delay(resilient.primary) * 1000:.0f} ms")
+
+    # Provider chính sập hẳn: circuit breaker ngắt sau 5 lỗi, các request sau đi thẳng tới provider dự phòng
+    primary, fallback = primary_model(error_rate=1.0), fallback_model()
+    outage = ResilientGenerator(
+        [make_provider("chính", primary, 5, 30), make_provider("dự phòng", fallback, 5, 30)],
+        first_token_timeout=args.timeout, hedge_default_delay=1.0,
+    )
+    report("provider chính sập hẳn", await run(outage, args.requests, args.concurrency))
+    print(f"  lời gọi tới provider chính: {primary.calls}/{args.requests}, "
+          f"trạng thái breaker: {outage.primary.breaker.state}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+# scripts/bench_hot_swap.py
+"""
+Kiểm tra chia sẻ chỉ mục giữa nhiều worker và việc chuyển snapshot khi đang có tải:
+- Khởi chạy N tiến trình worker, mỗi tiến trình tạo VectorDBService và truy vấn liên tục.
+- Trong lúc đó xuất bản lại snapshot nhiều lần (sao chép snapshot hiện tại, đổi CURRENT)
+  và dọn snapshot cũ với thời gian ân hạn ngắn.
+- Mỗi worker báo cáo số truy vấn thành công/lỗi, các snapshot đã phục vụ, RSS và PSS
+  (PSS chia đều các trang dùng chung, nên PSS << RSS nghĩa là page cache đang được chia sẻ).
+
+Cách dùng (cần một chỉ mục đã nạp; --synthetic-size dựng chỉ mục tổng hợp trong thư mục tạm):
+    EMBEDDING_PROVIDER=hashing python scripts/bench_hot_swap.py --workers 4 --swaps 5
+    EMBEDDING_PROVIDER=hashing HYBRID_SEARCH_ENABLED=false python scripts/bench_hot_swap.py --synthetic-size 200000
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import asyncio
+import argparse
+import tempfile
+import multiprocessing as mp
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+import numpy as np
+
+QUESTIONS = [
+    "Số hotline của ngân hàng là gì?",
+    "Phí thường niên thẻ tín dụng là bao nhiêu?",
+    "Làm sao để mở tài khoản trực tuyến?",
+    "Lãi suất tiết kiệm kỳ hạn 12 tháng?",
+]
+
+
+def memory_mb() -> dict:
+    """RSS, PSS và phần RSS đến từ file memory-map (Linux)."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Pss_File", "Pss_Anon"):
+                values[key.lower()] = round(int(rest.split()[0]) / 1024, 1)
+    return values
+
+
+def worker(duration: float, ready, result_queue) -> None:
+    from app.services.vector_db_service import VectorDBService
+
+    async def run():
+        service = VectorDBService()
+        ready.release()
+        ok, errors, seen = 0, [], {service.snapshot.name}
+        deadline = time.monotonic() + duration
+        last_refresh = 0.0
+        i = 0
+        while time.monotonic() < deadline:
+            if time.monotonic() - last_refresh >= 0.2:
+                await service.refresh()
+                seen.add(service.snapshot.name)
+                last_refresh = time.monotonic()
+            try:
+                docs = await service.search(QUESTIONS[i % len(QUESTIONS)])
+                if not docs:
+                    raise RuntimeError("không có kết quả")
+                ok += 1
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            i += 1
+        result_queue.put({"pid": os.getpid(), "ok": ok, "errors": len(errors), "first_errors": errors[:3],
+                          "snapshots_served": len(seen), "swaps": service.swaps, **memory_mb()})
+
+    asyncio.run(run())
+
+
+def republish(root: str) -> str:
+    """Xuất bản một bản sao của snapshot hiện tại thành snapshot mới (giả lập một lần nạp dữ liệu)."""
+    from app.services.snapshot_store import create_snapshot_dir, publish_snapshot, resolve_current
+    name, staging = create_snapshot_dir(root)
+    source = resolve_current(root)
+    for filename in os.listdir(source):
+        shutil.copy2(os.path.join(source, filename), os.path.join(staging, filename))
+    publish_snapshot(root, name, staging)
+    return name
+
+
+def build_synthetic(root: str, size: int) -> None:
+    """Dựng một snapshot tổng hợp `size` đoạn, dùng provider embedding hiện tại để ghi metadata."""
+    from app.core.config import settings
+    from app.services.embedding_service import embedding_model_name, write_index_metadata
+    from app.services.index_store import build_faiss_index, index_factory_string, write_docstore, write_faiss_index
+    from app.services.lexical_index import BM25Index
+    from app.services.snapshot_store import create_snapshot_dir, publish_snapshot
+
+    dimension = settings.HASHING_EMBEDDING_DIMENSION
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((size, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Văn bản giả ~100 từ lấy từ một bộ từ vựng lớn, để chỉ mục BM25 có phân bố thưa như dữ liệu thật
+    vocabulary = np.array([f"tu{i}" for i in range(50_000)])
+    texts = [f"Đoạn tổng hợp {i}: " + " ".join(vocabulary[rng.integers(0, len(vocabulary), 100)])
+             + (" " + QUESTIONS[i % len(QUESTIONS)] if i % 100 == 0 else "") for i in range(size)]
+
+    name, staging = create_snapshot_dir(root)
+    factory = index_factory_string(settings.FAISS_INDEX_TYPE, size, dimension)
+    write_docstore(staging, ((text, {"source": f"data/synthetic_{i % 12}.txt"}) for i, text in enumerate(texts)))
+    write_faiss_index(staging, build_faiss_index(vectors, factory))
+    write_index_metadata(staging, embedding_model_name(), dimension, index_type=settings.FAISS_INDEX_TYPE,
+                         factory=factory, count=size)
+    if settings.HYBRID_SEARCH_ENABLED:
+        BM25Index.build(enumerate(texts)).save(staging)
+    publish_snapshot(root, name, staging)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo RSS/PSS mỗi worker và lỗi khi chuyển snapshot dưới tải")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--swaps", type=int, default=5)
+    parser.add_argument("--swap-interval", type=float, default=1.0)
+    parser.add_argument("--gc-grace", type=float, default=0.5, help="Thời gian ân hạn trước khi xóa snapshot cũ (giây)")
+    parser.add_argument("--synthetic-size", type=int, default=0)
+    args = parser.parse_args()
+
+    tmp_root = None
+    if args.synthetic_size:
+        tmp_root = tempfile.mkdtemp(prefix="bench_hot_swap_")
+        os.environ["VECTOR_DB_PATH"] = tmp_root
+    from app.core.config import settings
+    from app.services.snapshot_store import collect_garbage, list_snapshots
+    if tmp_root:
+        settings.VECTOR_DB_PATH = tmp_root
+        print(f"Dựng chỉ mục tổng hợp {args.synthetic_size} đoạn tại {tmp_root}...")
+        build_synthetic(tmp_root, args.synthetic_size)
+    root = settings.VECTOR_DB_PATH
+
+    try:
+        ctx = mp.get_context("spawn")
+        ready, results = ctx.Semaphore(0), ctx.Queue()
+        duration = args.swaps * args.swap_interval + 3
+        processes = [ctx.Process(target=worker, args=(duration, ready, results)) for _ in range(args.workers)]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.acquire()
+
+        published = []
+        for _ in range(args.swaps):
+            time.sleep(args.swap_interval)
+            published.append(republish(root))
+            removed = collect_garbage(root, args.gc_grace)
+            print(f"Đã xuất bản {published[-1]}, xóa {len(removed)} snapshot cũ")
+
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        for report in reports:
+            print(json.dumps(report, ensure_ascii=False))
+        total_ok = sum(r["ok"] for r in reports)
+        total_errors = sum(r["errors"] for r in reports)
+        print(f"\nTổng: {total_ok} truy vấn thành công, {total_errors} lỗi; "
+              f"snapshot còn lại trên đĩa: {len(list_snapshots(root))}")
+    finally:
+        if tmp_root:
+            shutil.rmtree(tmp_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# scripts/bench_index.py
+"""
+So sánh các loại chỉ mục FAISS và định dạng docstore trên corpus tổng hợp:
+thời gian tải, bộ nhớ thường trú (RSS) tăng thêm sau khi tải, độ trễ truy vấn và recall@k so với flat.
+Mỗi phép đo tải/truy vấn chạy trong một tiến trình con riêng để RSS không bị lẫn.
+
+Cách dùng:
+    python scripts/bench_index.py --sizes 1000 10000 100000 --dimension 768
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import multiprocessing as mp
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+import numpy as np
+from app.services.index_store import (
+    build_faiss_index, index_factory_string, load_faiss_index, write_docstore, write_faiss_index, MmapDocstore
+)
+
+INDEX_TYPES = ["flat", "flat_fp16", "ivf", "hnsw", "ivfpq"]
+NUM_QUERIES = 200
+K = 5
+
+
+def rss_mb() -> float:
+    """RSS hiện tại của tiến trình (MB), đọc từ /proc trên Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_corpus(size: int, dimension: int, seed: int = 0):
+    """Vector có cấu trúc cụm (giống embedding thật hơn nhiễu thuần) và văn bản giả ~800 ký tự."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, size // 200), dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.3 * rng.standard_normal((size, dimension)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(0, size, NUM_QUERIES)] + 0.05 * rng.standard_normal((NUM_QUERIES, dimension)).astype(np.float32)
+    docs = ((f"Đoạn văn bản tổng hợp số {i}. " * 30, {"source": f"data/synthetic_{i % 12}.txt"}) for i in range(size))
+    return vectors, queries.astype(np.float32), docs
+
+
+def measure_store(db_path: str, queries: np.ndarray, result_queue) -> None:
+    """Chạy trong tiến trình con: tải chỉ mục + docstore mới, đo RSS và độ trễ."""
+    base = rss_mb()
+    started = time.perf_counter()
+    index = load_faiss_index(db_path)
+    docstore = MmapDocstore(db_path)
+    load_ms = (time.perf_counter() - started) * 1000
+    loaded = rss_mb()
+
+    latencies, results = [], []
+    for query in queries:
+        t = time.perf_counter()
+        _, rows = index.search(query[None, :], K)
+        [docstore.get(int(r)) for r in rows[0] if r != -1]
+        latencies.append((time.perf_counter() - t) * 1000)
+        results.append(rows[0].tolist())
+    result_queue.put({
+        "load_ms": load_ms,
+        "rss_delta_mb": loaded - base,
+        "rss_after_queries_mb": rss_mb() - base,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "results": results,
+    })
+
+
+def measure_legacy(db_path: str, queries: np.ndarray, result_queue) -> None:
+    """Chuẩn so sánh: LangChain FAISS với docstore pickle (định dạng cũ)."""
+    from langchain_community.vectorstores import FAISS
+    from app.services.embedding_service import HashingEmbeddings
+    base = rss_mb()
+    started = time.perf_counter()
+    db = FAISS.load_local(db_path, HashingEmbeddings(), allow_dangerous_deserialization=True)
+    load_ms = (time.perf_counter() - started) * 1000
+    loaded = rss_mb()
+    latencies = []
+    for query in queries:
+        t = time.perf_counter()
+        db.similarity_search_by_vector(query.tolist(), k=K)
+        latencies.append((time.perf_counter() - t) * 1000)
+    result_queue.put({
+        "load_ms": load_ms,
+        "rss_delta_mb": loaded - base,
+        "rss_after_queries_mb": rss_mb() - base,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "results": None,
+    })
+
+
+def run_child(target, db_path, queries) -> dict:
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(db_path, queries, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def recall(results, reference) -> float:
+    hits = sum(len(set(r) & set(ref)) for r, ref in zip(results, reference))
+    return hits / (len(reference) * K)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loại chỉ mục FAISS và docstore memory-map")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--types", nargs="+", default=INDEX_TYPES)
+    parser.add_argument("--legacy", action="store_true", help="Đo thêm định dạng LangChain/pickle cũ")
+    parser.add_argument("--output", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    report = []
+    for size in args.sizes:
+        vectors, queries, docs = synthetic_corpus(size, args.dimension)
+        workdir = tempfile.mkdtemp(prefix="bench_index_")
+        try:
+            write_docstore(workdir, docs)
+            reference = None
+            for index_type in args.types:
+                factory = index_factory_string(index_type, size, args.dimension)
+                started = time.perf_counter()
+                index = build_faiss_index(vectors, factory)
+                build_s = time.perf_counter() - started
+                write_faiss_index(workdir, index)
+                size_mb = os.path.getsize(os.path.join(workdir, "index.faiss")) / 2**20
+                del index
+
+                result = run_child(measure_store, workdir, queries)
+                if index_type == "flat":
+                    reference = result["results"]
+                row = {
+                    "size": size, "index": index_type, "factory": factory, "build_s": round(build_s, 3),
+                    "index_mb": round(size_mb, 1), "load_ms": round(result["load_ms"], 2),
+                    "rss_delta_mb": round(result["rss_delta_mb"], 1),
+                    "rss_after_queries_mb": round(result["rss_after_queries_mb"], 1),
+                    "query_p50_ms": round(result["query_p50_ms"], 3), "query_p95_ms": round(result["query_p95_ms"], 3),
+                    "recall_at_k": round(recall(result["results"], reference), 3) if reference else None,
+                }
+                report.append(row)
+                print(json.dumps(row, ensure_ascii=False))
+
+            if args.legacy:
+                from langchain_community.vectorstores import FAISS
+                from app.services.embedding_service import HashingEmbeddings
+                legacy_dir = os.path.join(workdir, "legacy")
+                pairs = [(text, vector.tolist()) for (text, _), vector in zip(synthetic_corpus(size, args.dimension)[2], vectors)]
+                FAISS.from_embeddings(pairs, HashingEmbeddings()).save_local(legacy_dir)
+                result = run_child(measure_legacy, legacy_dir, queries)
+                row = {"size": size, "index": "langchain_pickle", "load_ms": round(result["load_ms"], 2),
+                       "rss_delta_mb": round(result["rss_delta_mb"], 1),
+                       "rss_after_queries_mb": round(result["rss_after_queries_mb"], 1),
+                       "query_p50_ms": round(result["query_p50_ms"], 3), "query_p95_ms": round(result["query_p95_ms"], 3)}
+                report.append(row)
+                print(json.dumps(row, ensure_ascii=False))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# scripts/bench_routing.py
+"""
+So sánh truy xuất qua bộ định tuyến danh mục (chỉ mục con) với truy xuất trên một chỉ mục toàn cục duy nhất:
+- độ chính xác: precision@k (tỷ lệ chunk trả về thuộc danh mục đúng) và top-1 đúng danh mục, trên bộ câu hỏi có nhãn;
+- độ trễ: p50/p95 của VectorDBService.search khi corpus được nhân bản `--scales` lần
+  (mỗi danh mục là một thư mục con data/<tên file>/, nên số danh mục giữ nguyên là 12).
+
+Dữ liệu được nạp bằng scripts/ingest_data.py trong thư mục tạm, embedding "hashing" (CPU, không cần mạng).
+Lexical fast path bị tắt để mọi câu hỏi đều đi qua FAISS và bộ định tuyến.
+
+Cách dùng:
+    python scripts/bench_routing.py --scales 1 100
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+os.environ["LEXICAL_FASTPATH_ENABLED"] = "false"
+
+DATA_DIR = os.path.join(project_root, "data")
+
+# (câu hỏi, các danh mục chứa câu trả lời)
+LABELLED_QUESTIONS = [
+    ("Lãi suất tiết kiệm online kỳ hạn 12 tháng là bao nhiêu?", {"san_pham_tiet_kiem"}),
+    ("Rút tiền tiết kiệm trước hạn thì được tính lãi thế nào?", {"san_pham_tiet_kiem"}),
+    ("Số tiền gửi tiết kiệm tối thiểu là bao nhiêu?", {"san_pham_tiet_kiem"}),
+    ("Điều kiện vay tiêu dùng tín chấp là gì?", {"san_pham_vay"}),
+    ("Hồ sơ vay mua ô tô gồm những gì?", {"san_pham_vay"}),
+    ("Phí thường niên thẻ Visa Platinum là bao nhiêu?", {"the_tin_dung", "san_pham_tai_khoan_the"}),
+    ("Hạn mức tín dụng của thẻ Mastercard Gold?", {"the_tin_dung", "san_pham_tai_khoan_the"}),
+    ("Hạn mức rút tiền của thẻ ghi nợ nội địa mỗi ngày?", {"san_pham_tai_khoan_the"}),
+    ("Cách kích hoạt thẻ mới nhận?", {"san_pham_tai_khoan_the", "the_tin_dung"}),
+    ("Mua ngoại tệ tiền mặt cần giấy tờ gì?", {"dich_vu_ngoai_te"}),
+    ("Cách đọc bảng tỷ giá ngoại tệ?", {"dich_vu_ngoai_te"}),
+    ("Nhận kiều hối từ nước ngoài mất bao lâu?", {"chuyen_tien_quoc_te"}),
+    ("Chuyển tiền đi nước ngoài cho du học cần hồ sơ gì?", {"chuyen_tien_quoc_te"}),
+    ("Ứng dụng ngân hàng số có những tính năng gì?", {"ngan_hang_so"}),
+    ("Tôi chuyển tiền nhầm tài khoản thì phải làm sao?", {"ngan_hang_so"}),
+    ("Làm sao nhận diện tin nhắn lừa đảo phishing?", {"ngan_hang_so", "chinh_sach_bao_mat"}),
+    ("Ngân hàng thu thập những thông tin cá nhân nào của tôi?", {"chinh_sach_bao_mat"}),
+    ("Ngân hàng có chia sẻ thông tin của tôi cho bên thứ ba không?", {"chinh_sach_bao_mat"}),
+    ("Máy ATM đa năng CDM có thể nộp tiền không?", {"mang_luoi_atm_chi_nhanh"}),
+    ("Làm sao tìm chi nhánh gần nhất?", {"mang_luoi_atm_chi_nhanh"}),
+    ("Chương trình hoàn tiền cho chủ thẻ tín dụng cuối năm?", {"khuyen_mai_hien_hanh"}),
+    ("Mở tài khoản mới có được quà tặng không?", {"khuyen_mai_hien_hanh"}),
+    ("Tầm nhìn và sứ mệnh của ngân hàng ABC là gì?", {"gioi_thieu_ngan_hang"}),
+    ("Ngân hàng ABC được thành lập năm nào?", {"gioi_thieu_ngan_hang"}),
+    ("SWIFT Code của ngân hàng là gì?", {"cau_hoi_thuong_gap", "chuyen_tien_quoc_te", "gioi_thieu_ngan_hang"}),
+    ("Máy ATM nuốt thẻ thì phải làm gì?", {"cau_hoi_thuong_gap", "mang_luoi_atm_chi_nhanh"}),
+]
+
+
+def build_corpus(workdir: str, scale: int) -> str:
+    """Nhân bản data/*.txt vào data/<tên file>/bản_i.txt rồi nạp dữ liệu; trả về VECTOR_DB_PATH."""
+    data_dir = os.path.join(workdir, "data")
+    for name in sorted(os.listdir(DATA_DIR)):
+        if not name.endswith(".txt"):
+            continue
+        category_dir = os.path.join(data_dir, name[:-4])
+        os.makedirs(category_dir, exist_ok=True)
+        for copy in range(scale):
+            shutil.copyfile(os.path.join(DATA_DIR, name), os.path.join(category_dir, f"ban_{copy}.txt"))
+    root = os.path.join(workdir, "vectorstore", "db_faiss")
+    env = dict(os.environ, VECTOR_DB_PATH=root, EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache"))
+    subprocess.run([sys.executable, os.path.join(project_root, "scripts", "ingest_data.py"), "--full"],
+                   cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+    return root
+
+
+async def evaluate(service, k: int, routed: bool, rounds: int) -> dict:
+    from app.services.category_router import document_category
+    snapshot = service.snapshot
+    router = snapshot.router
+    snapshot.router = router if routed else None
+    latencies, precision, top1, routed_count, route_correct = [], [], 0, 0, 0
+    try:
+        for question, expected in LABELLED_QUESTIONS:
+            embedding = await service.embed_query(question)
+            for _ in range(rounds):
+                started = time.perf_counter()
+                docs = await service.search(question, k=k, query_embedding=embedding)
+                latencies.append((time.perf_counter() - started) * 1000)
+            categories = [document_category(doc.metadata) for doc in docs]
+            precision.append(sum(c in expected for c in categories) / len(categories) if categories else 0.0)
+            top1 += bool(categories) and categories[0] in expected
+            if routed:
+                chosen = {router.names[i] for i in router.route(embedding)}
+                routed_count += bool(chosen)
+                route_correct += bool(chosen & expected)
+    finally:
+        snapshot.router = router
+    p50, p95 = np.percentile(latencies, [50, 95])
+    return {"p50": p50, "p95": p95, "precision": float(np.mean(precision)), "top1": top1,
+            "routed": routed_count, "route_correct": route_correct}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="So sánh truy xuất qua chỉ mục con theo danh mục với chỉ mục toàn cục")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 100])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    from app.services.vector_db_service import VectorDBService
+
+    workdir = tempfile.mkdtemp(prefix="bench_routing_")
+    # Cache embedding của các câu hỏi đo cũng nằm trong thư mục tạm, không ghi vào ./vectorstore
+    settings.EMBEDDING_CACHE_DIR = os.path.join(workdir, "embedding_cache")
+    try:
+        total = len(LABELLED_QUESTIONS)
+        print(f"{total} câu hỏi có nhãn, k={args.k}, ROUTER_MIN_SCORE={settings.ROUTER_MIN_SCORE}, "
+              f"ROUTER_MARGIN={settings.ROUTER_MARGIN}, ROUTER_MAX_CATEGORIES={settings.ROUTER_MAX_CATEGORIES}")
+        print(f"{'corpus':>14} {'chế độ':<9} {'p50':>8} {'p95':>8} {'precision@k':>12} {'top-1':>7} {'định tuyến':>11}")
+        for scale in args.scales:
+            settings.VECTOR_DB_PATH = build_corpus(os.path.join(workdir, f"x{scale}"), scale)
+            service = VectorDBService()
+            chunks = service.index.ntotal
+            for routed in (False, True):
+                result = await evaluate(service, args.k, routed, args.rounds)
+                routing = f"{result['route_correct']}/{result['routed']}" if routed else "-"
+                print(f"{chunks:>8} đoạn {'router' if routed else 'toàn cục':<9} {result['p50']:>6.2f}ms "
+                      f"{result['p95']:>6.2f}ms {result['precision']:>12.0%} {result['top1']:>3}/{total:<3} {routing:>11}")
+            await service.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,112 @@
+# scripts/bench_session_history.py
+"""
+So sánh kích thước prompt (ước lượng token) và payload theo số lượt hội thoại giữa:
+- "history": client gửi toàn bộ lịch sử mỗi lượt (cách cũ),
+- "session": lịch sử giữ phía server, giới hạn HISTORY_TOKEN_BUDGET + bản tóm tắt.
+Phần offline dựng prompt thật bằng template của GeminiService (không gọi Gemini; tóm tắt dùng bản rút gọn).
+Với --url, chạy thêm hai cuộc hội thoại thật qua server để đo TTFB và tổng thời gian ở lượt cuối.
+
+Cách dùng:
+    python scripts/bench_session_history.py --turns 20
+    python scripts/bench_session_history.py --turns 20 --url http://localhost:8000/api/v1/chat/query
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import requests
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import settings
+from app.core.prompts import estimate_tokens, format_context, format_summary
+from app.schemas.chat import ChatMessage
+from app.services.gemini_service import GeminiService, docs_to_chunks, history_to_messages
+from app.services.session_service import InMemorySessionBackend, SessionService
+from app.services.vector_db_service import VectorDBService
+from scripts.eval_retrieval import FAQ_FILE, load_faq
+
+
+def prompt_tokens(gemini: GeminiService, context: str, summary: str, history: list, question: str) -> int:
+    messages = gemini.prompt.format_messages(
+        context=context, summary=format_summary(summary), history=history_to_messages(history), question=question
+    )
+    return sum(estimate_tokens(message.content) for message in messages)
+
+
+async def offline(turns: int) -> None:
+    vector_db = VectorDBService()
+    gemini = GeminiService(vector_db)
+    faq = load_faq(FAQ_FILE)
+    sessions = SessionService(InMemorySessionBackend(), summarizer=None,
+                              history_token_budget=settings.HISTORY_TOKEN_BUDGET,
+                              summary_max_tokens=settings.SUMMARY_MAX_TOKENS)
+    session = sessions.get_or_create()
+    full_history = []
+
+    print(f"{'lượt':>4} {'history: token':>15} {'payload B':>10} {'session: token':>15} {'payload B':>10}")
+    for turn in range(1, turns + 1):
+        question, answer_start = faq[(turn - 1) % len(faq)]
+        # Câu trả lời giả lập có độ dài gần với câu trả lời thật của Gemini (~600 ký tự)
+        answer = (answer_start + " ") * 10
+        context = format_context(docs_to_chunks(await vector_db.search(question)))
+
+        legacy_payload = json.dumps({"question": question, "history": [m.model_dump() for m in full_history]},
+                                    ensure_ascii=False).encode("utf-8")
+        legacy_tokens = prompt_tokens(gemini, context, "", full_history, question)
+
+        session_payload = json.dumps({"question": question, "session_id": session.session_id},
+                                     ensure_ascii=False).encode("utf-8")
+        session_tokens = prompt_tokens(gemini, context, session.summary, sessions.history(session), question)
+
+        if turn in (1, 5, 10, 15, 20) or turn == turns:
+            print(f"{turn:>4} {legacy_tokens:>15} {len(legacy_payload):>10} {session_tokens:>15} {len(session_payload):>10}")
+
+        full_history += [ChatMessage(role="user", content=question), ChatMessage(role="ai", content=answer)]
+        sessions.record_turn(session, question, answer)
+        await sessions.compact(session)
+
+
+def run_turn(http: requests.Session, url: str, body: dict) -> tuple:
+    started = time.perf_counter()
+    ttfb, parts = None, []
+    with http.post(url, json=body, stream=True, timeout=120) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+            if chunk:
+                ttfb = ttfb or time.perf_counter() - started
+                parts.append(chunk)
+        session_id = response.headers.get("X-Session-ID")
+    return ttfb or time.perf_counter() - started, time.perf_counter() - started, "".join(parts), session_id
+
+
+def online(url: str, turns: int) -> None:
+    faq = load_faq(FAQ_FILE)
+    http = requests.Session()
+    history, session_id = [], None
+    for turn in range(1, turns + 1):
+        question = faq[(turn - 1) % len(faq)][0]
+        legacy = run_turn(http, url, {"question": question, "history": history})
+        history += [{"role": "user", "content": question}, {"role": "ai", "content": legacy[2]}]
+        session = run_turn(http, url, {"question": question, "session_id": session_id})
+        session_id = session[3]
+        print(f"lượt {turn:>2}: history TTFB={legacy[0]:.2f}s tổng={legacy[1]:.2f}s | "
+              f"session TTFB={session[0]:.2f}s tổng={session[1]:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh prompt/độ trễ giữa lịch sử phía client và phiên phía server")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--url", help="Endpoint /api/v1/chat/query để đo độ trễ thật")
+    args = parser.parse_args()
+
+    asyncio.run(offline(args.turns))
+    if args.url:
+        online(args.url, args.turns)
+
+
+if __name__ == "__main__":
+    main()
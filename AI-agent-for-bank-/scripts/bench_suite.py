@@ -0,0 +1,387 @@
+# scripts/bench_suite.py
+"""
+Bộ benchmark chạy hoàn toàn offline (chat CHAT_PROVIDER=fake, embedding EMBEDDING_PROVIDER=fake/hashing),
+ghi kết quả ra JSON để so sánh giữa các commit:
+- ingest:    thông lượng nạp dữ liệu (đoạn/giây) khi nhân bản 12 file data/*.txt lên `--ingest-scales` lần;
+- retrieval: độ trễ truy xuất p50/p95/p99 khi corpus được mở rộng tổng hợp tới `--sizes` đoạn
+             (câu lấy từ dữ liệu thật, thêm từ vựng tổng hợp; vector suy ra từ embedding của từng câu);
+- endpoint:  /api/v1/chat/query với N client stream đồng thời: TTFT, tổng thời gian p50/p95/p99 và thông lượng.
+
+Độ trễ của provider giả lập: FAKE_LLM_FIRST_TOKEN_MS, FAKE_LLM_TOKEN_DELAY_MS, FAKE_EMBEDDING_LATENCY_MS,
+FAKE_EMBEDDING_PER_TEXT_MS (biến môi trường hoặc .env).
+
+Cách dùng:
+    python scripts/bench_suite.py --output bench_results/$(git rev-parse --short HEAD).json
+    python scripts/bench_suite.py --sections retrieval --sizes 1000 10000 100000
+    python scripts/bench_suite.py --sections endpoint --clients 1 8 32 --baseline bench_results/abc123.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+# Benchmark luôn chạy offline: giá trị mặc định cho các biến bắt buộc, provider giả lập
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+os.environ["CHAT_PROVIDER"] = "fake"
+os.environ["EMBEDDING_PROVIDER"] = "fake"
+
+import numpy as np
+import httpx
+
+DATA_DIR = os.path.join(project_root, "data")
+FAQ_FILE = os.path.join(DATA_DIR, "cau_hoi_thuong_gap.txt")
+SECTIONS = ["ingest", "retrieval", "endpoint"]
+EXTRA_QUESTIONS = [
+    "Phí thường niên thẻ tín dụng là bao nhiêu?",
+    "Lãi suất tiết kiệm kỳ hạn 12 tháng là bao nhiêu?",
+    "Làm sao để chuyển tiền ra nước ngoài?",
+    "Điều kiện vay mua nhà là gì?",
+    "Ngân hàng số có những tính năng gì?",
+]
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2)}
+
+
+def load_questions() -> list:
+    with open(FAQ_FILE, "r", encoding="utf-8") as f:
+        faq = [line.split(":", 1)[1].strip() for line in f if line.startswith("## Câu hỏi:")]
+    return faq + EXTRA_QUESTIONS
+
+
+def git_commit() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=project_root, text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"],
+                                             cwd=project_root, text=True).strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def bench_env(**overrides) -> dict:
+    env = os.environ.copy()
+    env.update({key: str(value) for key, value in overrides.items()})
+    return env
+
+
+# --- Nạp dữ liệu ---
+
+def run_ingest(workdir: str, scale: int) -> dict:
+    """Nhân bản data/*.txt `scale` lần vào thư mục tạm rồi chạy scripts/ingest_data.py --full trong tiến trình mới."""
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    files = sorted(name for name in os.listdir(DATA_DIR) if name.endswith(".txt"))
+    for copy in range(scale):
+        for name in files:
+            target = name if copy == 0 else f"{name[:-4]}_{copy}.txt"
+            shutil.copyfile(os.path.join(DATA_DIR, name), os.path.join(data_dir, target))
+
+    root = os.path.join(workdir, "vectorstore", "db_faiss")
+    env = bench_env(VECTOR_DB_PATH=root, EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache"))
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(project_root, "scripts", "ingest_data.py"), "--full"],
+                   cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+    seconds = time.perf_counter() - started
+
+    from app.services.embedding_service import read_index_metadata
+    from app.services.snapshot_store import resolve_current
+    chunks = read_index_metadata(resolve_current(root)).get("count", 0)
+    return {"scale": scale, "files": scale * len(files), "chunks": chunks, "seconds": round(seconds, 2),
+            "chunks_per_s": round(chunks / seconds, 1), "root": root}
+
+
+def bench_ingest(workdir: str, scales: list) -> list:
+    results = []
+    for scale in scales:
+        result = run_ingest(os.path.join(workdir, f"ingest_x{scale}"), scale)
+        print(f"ingest x{scale}: {result['chunks']} đoạn trong {result['seconds']}s "
+              f"({result['chunks_per_s']} đoạn/s)")
+        results.append(result)
+    return results
+
+
+# --- Truy xuất trên corpus mở rộng tổng hợp ---
+
+def real_sentences() -> list:
+    sentences = []
+    for name in sorted(os.listdir(DATA_DIR)):
+        if not name.endswith(".txt"):
+            continue
+        with open(os.path.join(DATA_DIR, name), "r", encoding="utf-8") as f:
+            text = f.read()
+        sentences.extend(s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if len(s.strip()) > 20)
+    return sorted(set(sentences))
+
+
+def build_scaled_snapshot(root: str, size: int, seed: int = 0) -> float:
+    """
+    Dựng snapshot `size` đoạn: mỗi đoạn ghép 6-10 câu thật ngẫu nhiên cùng vài mã sản phẩm tổng hợp
+    (để từ vựng tăng theo corpus như dữ liệu thật). Vector của đoạn là tổng embedding các câu, cộng nhiễu
+    nhỏ rồi chuẩn hóa, nên không phải embed lại 100k+ đoạn. Trả về thời gian dựng (giây).
+    """
+    from app.core.config import settings
+    from app.services.embedding_service import HashingEmbeddings, embedding_model_name, write_index_metadata
+    from app.services.index_store import build_faiss_index, index_factory_string, write_docstore, write_faiss_index
+    from app.services.lexical_index import BM25Index
+    from app.services.snapshot_store import create_snapshot_dir, publish_snapshot
+
+    started = time.perf_counter()
+    sentences = real_sentences()
+    embedder = HashingEmbeddings(dimension=settings.HASHING_EMBEDDING_DIMENSION)
+    sentence_vectors = np.asarray(embedder.embed_documents(sentences), dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    texts, vectors = [], np.empty((size, sentence_vectors.shape[1]), dtype=np.float32)
+    for i in range(size):
+        picks = rng.choice(len(sentences), rng.integers(6, 11), replace=False)
+        codes = " ".join(f"SP{code}" for code in rng.integers(0, max(1000, size // 2), 3))
+        texts.append(" ".join(sentences[j] for j in picks) + f" Mã sản phẩm liên quan: {codes}.")
+        vectors[i] = sentence_vectors[picks].sum(axis=0)
+    vectors += 0.05 * rng.standard_normal(vectors.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    name, staging = create_snapshot_dir(root)
+    factory = index_factory_string(settings.FAISS_INDEX_TYPE, size, vectors.shape[1], settings.FAISS_HNSW_M)
+    write_docstore(staging, ((text, {"source": f"data/synthetic_{i % 12}.txt"}) for i, text in enumerate(texts)))
+    write_faiss_index(staging, build_faiss_index(vectors, factory))
+    write_index_metadata(staging, embedding_model_name(), vectors.shape[1], index_type=settings.FAISS_INDEX_TYPE,
+                         factory=factory, count=size)
+    if settings.HYBRID_SEARCH_ENABLED:
+        BM25Index.build(enumerate(texts)).save(staging)
+    publish_snapshot(root, name, staging)
+    return time.perf_counter() - started
+
+
+async def measure_retrieval(questions: list, repeats: int) -> dict:
+    from app.services.vector_db_service import VectorDBService
+    service = VectorDBService()
+    latencies = []
+    try:
+        for _ in range(repeats):
+            for question in questions:
+                started = time.perf_counter()
+                await service.search(question)
+                latencies.append((time.perf_counter() - started) * 1000)
+        return {"load_ms": round(service.load_seconds * 1000, 1), "queries": len(latencies),
+                "search_ms": percentiles(latencies), "lexical_fastpath_hits": service.lexical_fastpath_hits}
+    finally:
+        await service.close()
+
+
+def bench_retrieval(workdir: str, sizes: list, repeats: int) -> list:
+    from app.core.config import settings
+    # Đo riêng chi phí chỉ mục: embedding không có độ trễ giả lập và không dùng cache
+    settings.EMBEDDING_PROVIDER = "hashing"
+    settings.EMBEDDING_CACHE_ENABLED = False
+    questions = load_questions()
+    results = []
+    for size in sizes:
+        root = os.path.join(workdir, f"retrieval_{size}")
+        build_seconds = build_scaled_snapshot(root, size)
+        settings.VECTOR_DB_PATH = root
+        result = {"chunks": size, "build_s": round(build_seconds, 2), **asyncio.run(measure_retrieval(questions, repeats))}
+        print(f"retrieval {size} đoạn: search p50={result['search_ms']['p50']} ms, "
+              f"p95={result['search_ms']['p95']} ms, p99={result['search_ms']['p99']} ms")
+        results.append(result)
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+# --- Endpoint chat với N client stream đồng thời ---
+
+def start_server(root: str, workdir: str, port: int, max_clients: int) -> subprocess.Popen:
+    env = bench_env(
+        VECTOR_DB_PATH=root, EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache_server"),
+        ANSWER_CACHE_ENABLED="false", WARMUP_ENABLED="true", SNAPSHOT_POLL_SECONDS=3600,
+        CHAT_MAX_CONCURRENCY=max_clients, CHAT_MAX_QUEUE_DEPTH=max_clients * 2,
+    )
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                                "--log-level", "warning"], cwd=project_root, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/api/v1/health/ready", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server benchmark không sẵn sàng sau 60 giây.")
+
+
+async def client_loop(http: httpx.AsyncClient, url: str, client_id: int, questions: list, requests: int) -> list:
+    results = []
+    for i in range(requests):
+        question = questions[(client_id * 7 + i) % len(questions)]
+        started = time.perf_counter()
+        ttft, tokens = None, 0
+        try:
+            async with http.stream("POST", url, params={"format": "ndjson"}, json={"question": question},
+                                   headers={"X-Client-ID": f"bench-{client_id}"}) as response:
+                if response.status_code != 200:
+                    results.append({"ok": False, "status": response.status_code})
+                    continue
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)["event"]
+                    if event == "token":
+                        tokens += 1
+                        ttft = ttft or (time.perf_counter() - started) * 1000
+                    elif event == "error":
+                        raise RuntimeError("sự kiện error")
+            results.append({"ok": True, "ttft_ms": ttft, "total_ms": (time.perf_counter() - started) * 1000,
+                            "tokens": tokens})
+        except (httpx.HTTPError, RuntimeError) as e:
+            results.append({"ok": False, "status": type(e).__name__})
+    return results
+
+
+async def run_clients(base_url: str, clients: int, requests: int, questions: list) -> dict:
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as http:
+        started = time.perf_counter()
+        per_client = await asyncio.gather(*(
+            client_loop(http, f"{base_url}/api/v1/chat/query", client_id, questions, requests)
+            for client_id in range(clients)
+        ))
+        elapsed = time.perf_counter() - started
+    results = [r for client in per_client for r in client]
+    ok = [r for r in results if r["ok"]]
+    return {
+        "clients": clients,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "ttft_ms": percentiles([r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]),
+        "total_ms": percentiles([r["total_ms"] for r in ok]),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "tokens_per_s": round(sum(r["tokens"] for r in ok) / elapsed, 1),
+    }
+
+
+def bench_endpoint(workdir: str, root: str, clients_levels: list, requests: int, port: int) -> list:
+    questions = load_questions()
+    process = start_server(root, workdir, port, max(clients_levels))
+    results = []
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for clients in clients_levels:
+            result = asyncio.run(run_clients(base_url, clients, requests, questions))
+            print(f"endpoint {clients} client: TTFT p50={result['ttft_ms']['p50']} ms, "
+                  f"p99={result['ttft_ms']['p99']} ms, tổng p50={result['total_ms']['p50']} ms, "
+                  f"{result['throughput_rps']} req/s, lỗi={result['errors']}")
+            results.append(result)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return results
+
+
+# --- So sánh với kết quả của commit khác ---
+
+def flatten(value, prefix: str = "") -> dict:
+    """Làm phẳng kết quả thành {đường_dẫn: số} để so sánh; danh sách được khóa theo chunks/clients/scale."""
+    flat = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flat.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+    elif isinstance(value, list):
+        for item in value:
+            key = next((f"{k}={item[k]}" for k in ("chunks", "clients", "scale") if isinstance(item, dict) and k in item),
+                       str(value.index(item)))
+            flat.update(flatten(item, f"{prefix}[{key}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        flat[prefix] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> None:
+    old = flatten({name: baseline.get(name) for name in SECTIONS if name in baseline})
+    new = flatten({name: current.get(name) for name in SECTIONS if name in current})
+    print(f"\nSo sánh với {baseline.get('meta', {}).get('commit', '?')[:10]} (ngưỡng ±{threshold:.0%}):")
+    for key in sorted(set(old) & set(new)):
+        if not (key.endswith(("p50", "p95", "p99", "_per_s", "_rps", "load_ms")) and old[key]):
+            continue
+        change = (new[key] - old[key]) / old[key]
+        # Độ trễ tăng là xấu đi; thông lượng giảm là xấu đi
+        worse = change < -threshold if key.endswith(("_per_s", "_rps")) else change > threshold
+        marker = "⚠️ " if worse else "   "
+        print(f"{marker}{key}: {old[key]} -> {new[key]} ({change:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline: nạp dữ liệu, truy xuất theo quy mô, endpoint chat")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=SECTIONS)
+    parser.add_argument("--ingest-scales", nargs="+", type=int, default=[1, 10])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--retrieval-repeats", type=int, default=5)
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests-per-client", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8077)
+    parser.add_argument("--output", default=os.path.join(project_root, "bench_results", "latest.json"))
+    parser.add_argument("--baseline", help="File JSON kết quả của commit khác để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Ngưỡng thay đổi được đánh dấu là hồi quy")
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    report = {"meta": {
+        **git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {key: getattr(settings, key) for key in (
+            "FAKE_LLM_FIRST_TOKEN_MS", "FAKE_LLM_TOKEN_DELAY_MS", "FAKE_EMBEDDING_LATENCY_MS",
+            "FAKE_EMBEDDING_PER_TEXT_MS", "FAISS_INDEX_TYPE", "HYBRID_SEARCH_ENABLED", "RETRIEVAL_TOP_K",
+            "INGEST_CONCURRENCY", "INGEST_BATCH_SIZE", "EMBEDDING_REQUESTS_PER_MINUTE")},
+    }}
+
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        if "ingest" in args.sections or "endpoint" in args.sections:
+            scales = set(args.ingest_scales if "ingest" in args.sections else [])
+            if "endpoint" in args.sections:
+                # Endpoint chạy trên chỉ mục của dữ liệu thật (x1)
+                scales.add(1)
+            ingest = bench_ingest(workdir, sorted(scales))
+            if "ingest" in args.sections:
+                report["ingest"] = [{k: v for k, v in r.items() if k != "root"} for r in ingest]
+        if "retrieval" in args.sections:
+            report["retrieval"] = bench_retrieval(workdir, args.sizes, args.retrieval_repeats)
+        if "endpoint" in args.sections:
+            root = next(r["root"] for r in ingest if r["scale"] == 1)
+            report["endpoint"] = bench_endpoint(workdir, root, args.clients, args.requests_per_client, args.port)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Đã ghi kết quả vào {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f), args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# scripts/bench_tenants.py
+"""
+Đo sổ đăng ký tenant (tenant_registry) với N tenant tổng hợp, mỗi tenant một bản sao chỉ mục riêng:
+- độ trễ request đầu tiên tới tenant chưa nạp (nạp + truy xuất) và request khi tenant đã nạp sẵn;
+- dung lượng chỉ mục đang nạp (theo registry) và RSS của tiến trình, khi không giới hạn và khi có ngân sách bộ nhớ
+  (--budget-tenants: ngân sách vừa đủ cho bấy nhiêu tenant), cùng số lần nạp/giải phóng;
+- --burst request đồng thời tới cùng một tenant chưa nạp: phải chỉ có MỘT lần nạp.
+
+Dữ liệu được nạp một lần bằng scripts/ingest_data.py trong thư mục tạm (embedding "hashing", CPU, không cần mạng),
+corpus nhân bản --scale lần, rồi thư mục chỉ mục được sao chép cho từng tenant.
+Các tenant dùng chung model embedding và bộ gom lô như trong create_tenant_registry.
+
+Cách dùng:
+    python scripts/bench_tenants.py --tenants 50 --scale 20
+"""
+import io
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import contextlib
+import tempfile
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+os.environ["CHAT_PROVIDER"] = "fake"
+os.environ["EMBEDDING_PROVIDER"] = "hashing"
+os.environ["LEXICAL_FASTPATH_ENABLED"] = "false"
+
+from scripts.bench_routing import build_corpus
+
+QUESTIONS = [
+    "Lãi suất tiết kiệm online kỳ hạn 12 tháng là bao nhiêu?",
+    "Phí thường niên thẻ Visa Platinum là bao nhiêu?",
+    "Máy ATM nuốt thẻ thì phải làm gì?",
+    "Số hotline của ngân hàng là gì?",
+]
+UNLIMITED = 1 << 62
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def make_registry(source_root: str, tenants_dir: str, tenants: int, budget_bytes: int):
+    from app.schemas.tenant import TenantConfig
+    from app.services.gemini_service import GeminiService
+    from app.services.tenant_registry import TenantRegistry
+    from app.services.vector_db_service import VectorDBService
+
+    shared = VectorDBService(root=source_root)
+    configs = {}
+    for i in range(tenants):
+        tenant_id = f"bank{i:02d}"
+        root = os.path.join(tenants_dir, tenant_id)
+        if not os.path.exists(root):
+            shutil.copytree(source_root, root)
+        configs[tenant_id] = TenantConfig(tenant_id=tenant_id, bank_name=f"Ngân hàng {i}", vector_db_path=root,
+                                          language="English" if i % 5 == 0 else "tiếng Việt")
+
+    def build(config):
+        vector_db_service = VectorDBService(root=config.vector_db_path, embeddings=shared.embeddings,
+                                            batcher=shared.batcher)
+        return vector_db_service, GeminiService(vector_db_service, tenant=config)
+
+    return shared, TenantRegistry(configs, build, budget_bytes)
+
+
+async def request(registry, tenant_id: str, question: str) -> float:
+    started = time.perf_counter()
+    async with await registry.acquire(tenant_id) as lease:
+        await lease.vector_db_service.search(question)
+    return (time.perf_counter() - started) * 1000
+
+
+def percentiles(values) -> str:
+    p50, p95 = np.percentile(values, [50, 95])
+    return f"p50 {p50:7.1f} ms, p95 {p95:7.1f} ms"
+
+
+async def run(title: str, source_root: str, tenants_dir: str, tenants: int, budget_bytes: int, rounds: int,
+              burst: int) -> None:
+    # Bỏ log nạp/giải phóng của từng tenant
+    with contextlib.redirect_stdout(io.StringIO()):
+        shared, registry = make_registry(source_root, tenants_dir, tenants, budget_bytes)
+        rss_before = rss_mb()
+        cold, warm, peak_rss = [], [], rss_before
+        # Vòng 1: mỗi tenant một request đầu tiên (nạp); các vòng sau đi lại lần lượt mọi tenant
+        for round_no in range(rounds):
+            for i, tenant_id in enumerate(registry.configs):
+                loaded = tenant_id in registry.loaded()
+                latency = await request(registry, tenant_id, QUESTIONS[(i + round_no) % len(QUESTIONS)])
+                (warm if loaded else cold).append(latency)
+                peak_rss = max(peak_rss, rss_mb())
+        # Điểm nóng: vài tenant được hỏi liên tục thì luôn nằm trong bộ nhớ
+        hot = list(registry.configs)[:3]
+        for i in range(60):
+            tenant_id = hot[i % len(hot)]
+            loaded = tenant_id in registry.loaded()
+            latency = await request(registry, tenant_id, QUESTIONS[i % len(QUESTIONS)])
+            (warm if loaded else cold).append(latency)
+        stats = registry.stats()
+        await registry.close()
+        # Burst tới một tenant chưa nạp (registry mới)
+        burst_shared, burst_registry = make_registry(source_root, tenants_dir, tenants, budget_bytes)
+        started = time.perf_counter()
+        await asyncio.gather(*(request(burst_registry, "bank07", QUESTIONS[i % len(QUESTIONS)])
+                               for i in range(burst)))
+        burst_ms = (time.perf_counter() - started) * 1000
+        burst_loads = burst_registry.loads
+        await burst_registry.close()
+        await burst_shared.close()
+        await shared.close()
+
+    print(f"\n== {title} ==")
+    print(f"  request đầu (tenant chưa nạp, {len(cold):>4}): {percentiles(cold)}")
+    print(f"  request khi đã nạp       ({len(warm):>4}): {percentiles(warm) if warm else '-'}")
+    budget = f"{stats['memory_budget_mb']} MB" if budget_bytes < UNLIMITED else "không giới hạn"
+    print(f"  chỉ mục đang nạp: {stats['loaded']} tenant, {stats['memory_mb']} MB "
+          f"(ngân sách {budget}); lần nạp {stats['loads']}, giải phóng {stats['evictions']}")
+    print(f"  RSS tiến trình: {rss_before:.0f} MB trước, đỉnh {peak_rss:.0f} MB")
+    print(f"  {burst} request đồng thời tới một tenant chưa nạp: {burst_loads} lần nạp, {burst_ms:.0f} ms tổng")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Đo nạp/giải phóng tenant theo ngân sách bộ nhớ")
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--scale", type=int, default=20, help="Số lần nhân bản corpus trong chỉ mục mỗi tenant")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--budget-tenants", type=int, default=10)
+    parser.add_argument("--burst", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_tenants_")
+    try:
+        print(f"Nạp corpus x{args.scale} và sao chép chỉ mục cho {args.tenants} tenant...")
+        source_root = build_corpus(os.path.join(workdir, "source"), args.scale)
+        from app.core.config import settings
+        settings.EMBEDDING_CACHE_DIR = os.path.join(workdir, "source", "embedding_cache")
+        from app.services.vector_db_service import directory_size
+        from app.services.snapshot_store import current_snapshot_name, snapshot_path
+        per_tenant = directory_size(snapshot_path(source_root, current_snapshot_name(source_root)))
+        print(f"Chỉ mục mỗi tenant: {per_tenant / 1024 / 1024:.1f} MB, {os.cpu_count()} CPU")
+        tenants_dir = os.path.join(workdir, "tenants")
+        await run("không giới hạn bộ nhớ", source_root, tenants_dir, args.tenants, UNLIMITED, args.rounds, args.burst)
+        budget = int(per_tenant * args.budget_tenants + per_tenant // 2)
+        await run(f"ngân sách ~{args.budget_tenants} tenant ({budget / 1024 / 1024:.1f} MB)", source_root,
+                  tenants_dir, args.tenants, budget, args.rounds, args.burst)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
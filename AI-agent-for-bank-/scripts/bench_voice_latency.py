@@ -0,0 +1,114 @@
+# scripts/bench_voice_latency.py
+"""
+Đo độ trễ từ lúc khách NGỪNG NÓI tới lúc request được gửi lên server, với âm thanh tổng hợp phát theo thời gian thực
+(khung 30 ms: nhiễu nền → câu nói có các quãng ngắt giữa từ → im lặng) và backend nhận dạng giả lập (độ trễ cố định):
+- "legacy": như kiosk cũ — hiệu chỉnh nhiễu nền 0.5 giây mỗi lần bấm mic, hết câu sau 0.8 giây im lặng
+            (pause_threshold mặc định của speech_recognition);
+- "vad":    hiệu chỉnh một lần khi khởi động, VAD kết thúc câu sau END_SILENCE_MS im lặng, gửi ngay khi có văn bản.
+
+Không cần micro hay mạng. Độ trễ nhận dạng thật phụ thuộc backend (Google qua mạng, Vosk trên máy) và đặt bằng --recognition-ms.
+
+Cách dùng:
+    python scripts/bench_voice_latency.py --rounds 5 --recognition-ms 300
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from voice_input import FRAME_MS, FRAME_SAMPLES, END_SILENCE_MS, EnergyVAD, FakeSpeechBackend, UtteranceDetector, VoiceInput
+
+
+class SyntheticSource:
+    """Nguồn âm thanh giả lập: `lead_s` im lặng, các từ dài 250 ms cách nhau 150 ms trong `speech_s`, rồi im lặng."""
+
+    def __init__(self, lead_s: float = 0.6, speech_s: float = 1.5, seed: int = 0):
+        self.lead_s = lead_s
+        self.speech_s = speech_s
+        self.rng = np.random.default_rng(seed)
+        self.speech_ended = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+    def _frame(self, amplitude: float) -> bytes:
+        samples = self.rng.normal(0, amplitude, FRAME_SAMPLES)
+        return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+    def frames(self):
+        started = time.perf_counter()
+        index = 0
+        while True:
+            t = index * FRAME_MS / 1000
+            in_speech = self.lead_s <= t < self.lead_s + self.speech_s and ((t - self.lead_s) % 0.4) < 0.25
+            # Phát đúng nhịp thời gian thực như micro
+            delay = started + (index + 1) * FRAME_MS / 1000 - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if in_speech:
+                self.speech_ended = time.perf_counter()
+            yield self._frame(3000 if in_speech else 120)
+            index += 1
+
+
+def run_legacy(backend, recognition_source: SyntheticSource) -> dict:
+    pressed = time.perf_counter()
+    vad = EnergyVAD()
+    detector = UtteranceDetector(vad, end_silence_ms=800)
+    with recognition_source as source:
+        frames = source.frames()
+        vad.calibrate([next(frames) for _ in range(int(500 / FRAME_MS))])
+        for frame in frames:
+            utterance = detector.feed(frame, time.perf_counter())
+            if utterance is not None:
+                break
+    backend.transcribe(utterance.audio)
+    sent = time.perf_counter()
+    return {"press": sent - pressed, "speech_end": sent - source.speech_ended}
+
+
+def run_vad(voice: VoiceInput, source: SyntheticSource) -> dict:
+    voice.source_factory = lambda: source
+    pressed = time.perf_counter()
+    utterance = voice.listen()
+    voice.transcribe(utterance)
+    sent = time.perf_counter()
+    return {"press": sent - pressed, "speech_end": sent - source.speech_ended,
+            "vad_error": utterance.speech_ended - source.speech_ended}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo độ trễ hết câu → gửi request của đường nhập giọng nói")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--recognition-ms", type=float, default=300, help="Độ trễ giả lập của backend nhận dạng")
+    args = parser.parse_args()
+
+    backend = FakeSpeechBackend([], delay_ms=args.recognition_ms)
+    voice = VoiceInput(backend, source_factory=lambda: SyntheticSource(lead_s=0, speech_s=0), vad=EnergyVAD())
+    voice.calibrate()
+
+    results = {"legacy": [], "vad": []}
+    for round_index in range(args.rounds):
+        results["legacy"].append(run_legacy(backend, SyntheticSource(seed=round_index)))
+        results["vad"].append(run_vad(voice, SyntheticSource(seed=round_index)))
+
+    print(f"Nhận dạng giả lập: {args.recognition_ms:.0f} ms, END_SILENCE_MS={END_SILENCE_MS}, {args.rounds} lượt")
+    print(f"{'đường':<8} {'hết câu → gửi (p50)':>20} {'bấm mic → gửi (p50)':>20}")
+    for name, rows in results.items():
+        speech_end = statistics.median(row["speech_end"] for row in rows) * 1000
+        press = statistics.median(row["press"] for row in rows) * 1000
+        print(f"{name:<8} {speech_end:>18.0f}ms {press:>18.0f}ms")
+    vad_error = max(abs(row["vad_error"]) for row in results["vad"]) * 1000
+    print(f"Sai lệch lớn nhất giữa điểm hết câu VAD ghi nhận và thực tế: {vad_error:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
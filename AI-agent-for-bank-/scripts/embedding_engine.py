@@ -0,0 +1,170 @@
+# scripts/embedding_engine.py
+"""
+Bộ máy embedding bất đồng bộ cho quá trình nạp dữ liệu:
+- Nhiều lô chạy song song (giới hạn bởi `concurrency`).
+- Token bucket giới hạn theo số request/phút và số token/phút.
+- Thử lại với backoff lũy thừa khi gặp lỗi hết hạn mức (quota).
+- Ghi checkpoint sau mỗi lô để lần chạy bị gián đoạn có thể tiếp tục.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from app.core.prompts import estimate_tokens
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Lỗi hết hạn mức (429/ResourceExhausted) hoặc lỗi tạm thời phía server."""
+    text = f"{type(error).__name__} {error}".lower()
+    markers = ("429", "quota", "resourceexhausted", "resource_exhausted", "rate limit",
+               "503", "unavailable", "timeout", "deadline")
+    return any(marker in text for marker in markers)
+
+
+class TokenBucket:
+    """Token bucket bất đồng bộ: nạp lại `rate` đơn vị mỗi giây, tối đa `capacity` đơn vị."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        # Một yêu cầu lớn hơn dung lượng bucket sẽ chờ cho tới khi bucket đầy
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Kết hợp giới hạn request/phút và token/phút."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 60.0))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, max(1.0, tokens_per_minute / 60.0))
+
+    async def acquire(self, tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+class Checkpoint:
+    """File JSONL lưu các vector đã embed xong, để tiếp tục sau khi bị gián đoạn."""
+
+    def __init__(self, path: Optional[str], model_name: str):
+        self.path = path
+        self.model_name = model_name
+
+    def load(self) -> Dict[str, List[float]]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        vectors = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            header = f.readline()
+            try:
+                if json.loads(header).get("model") != self.model_name:
+                    return {}
+            except json.JSONDecodeError:
+                return {}
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Dòng cuối có thể bị ghi dở
+                vectors[item["id"]] = item["v"]
+        return vectors
+
+    def append(self, ids: List[str], vectors: List[List[float]]) -> None:
+        if not self.path:
+            return
+        is_new = not os.path.exists(self.path)
+        if is_new:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            if is_new:
+                f.write(json.dumps({"model": self.model_name}) + "\n")
+            for cid, vector in zip(ids, vectors):
+                f.write(json.dumps({"id": cid, "v": vector}) + "\n")
+
+    def remove(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class EmbeddingEngine:
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        concurrency: int = 4,
+        batch_size: int = 20,
+        requests_per_minute: float = 1500,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 6,
+        checkpoint: Optional[Checkpoint] = None,
+    ):
+        self.embeddings = embeddings
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.checkpoint = checkpoint or Checkpoint(None, "")
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        await self.limiter.acquire(sum(estimate_tokens(t) for t in texts))
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 0.5)
+                print(f"   - Hết hạn mức/lỗi tạm thời ({e}); thử lại sau {delay:.1f} giây...")
+                await asyncio.sleep(delay)
+                await self.limiter.acquire(sum(estimate_tokens(t) for t in texts))
+
+    async def run(self, items: List[Tuple[str, str]]) -> Dict[str, List[float]]:
+        """
+        Embed danh sách (id, văn bản). Trả về dictionary {id: vector}.
+        Các id đã có trong checkpoint được bỏ qua.
+        """
+        checkpointed = self.checkpoint.load()
+        results = {cid: checkpointed[cid] for cid, _ in items if cid in checkpointed}
+        pending = [(cid, text) for cid, text in items if cid not in results]
+        if results:
+            print(f"   - Tiếp tục từ checkpoint: đã có {len(results)} đoạn.")
+
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        done = 0
+
+        async def worker(batch):
+            nonlocal done
+            async with semaphore:
+                ids = [cid for cid, _ in batch]
+                vectors = await self._embed_batch([text for _, text in batch])
+                self.checkpoint.append(ids, vectors)
+                results.update(zip(ids, vectors))
+                done += len(batch)
+                elapsed = time.perf_counter() - started
+                print(f"   - {done}/{len(pending)} đoạn ({done / elapsed:.1f} đoạn/giây)")
+
+        await asyncio.gather(*(worker(batch) for batch in batches))
+
+        elapsed = time.perf_counter() - started
+        if pending:
+            print(f"Đã embed {len(pending)} đoạn trong {elapsed:.1f} giây "
+                  f"({len(pending) / elapsed:.1f} đoạn/giây, {len(batches)} lô).")
+        return results
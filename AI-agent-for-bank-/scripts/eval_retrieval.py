@@ -0,0 +1,126 @@
+# scripts/eval_retrieval.py
+"""
+Đánh giá truy xuất trên bộ câu hỏi thường gặp (data/cau_hoi_thuong_gap.txt):
+so sánh độ trễ và tỷ lệ trúng (hit@k) giữa FAISS, BM25 và truy xuất lai.
+
+Một câu hỏi được tính là "trúng" nếu một trong k chunk trả về chứa đoạn đầu câu trả lời chuẩn.
+Cuối cùng chạy các câu hỏi qua GeminiService (model giả lập, cache câu trả lời bật như mặc định) và kiểm tra
+các câu trúng đường tắt BM25 không gọi embedding lần nào.
+
+Cách dùng:
+    python scripts/eval_retrieval.py --k 5
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+from app.core.config import settings
+from app.services.vector_db_service import VectorDBService
+
+FAQ_FILE = os.path.join("data", "cau_hoi_thuong_gap.txt")
+ANSWER_PROBE_CHARS = 60
+
+
+def load_faq(path: str) -> list:
+    """Đọc các cặp (câu hỏi, đoạn đầu câu trả lời) từ file FAQ."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    pairs = []
+    for block in re.split(r"^## Câu hỏi:", text, flags=re.MULTILINE)[1:]:
+        question, _, answer = block.partition("Trả lời:")
+        answer_line = next((line.strip() for line in answer.splitlines() if line.strip()), "")
+        pairs.append((question.strip(), answer_line[:ANSWER_PROBE_CHARS]))
+    return pairs
+
+
+async def dense_only(service: VectorDBService, question: str, k: int) -> list:
+    embedding = await service.embed_query(question)
+    rows = service._dense_search(embedding, k)
+    return service._get_documents(rows)
+
+
+async def lexical_only(service: VectorDBService, question: str, k: int) -> list:
+    if service.bm25 is None:
+        return []
+    results, _ = service.bm25.search(question, k)
+    return service._get_documents([row for row, _ in results])
+
+
+async def hybrid(service: VectorDBService, question: str, k: int) -> list:
+    return await service.search(question, k=k)
+
+
+async def evaluate(service: VectorDBService, name: str, retrieve, pairs: list, k: int) -> None:
+    latencies, hits = [], 0
+    for question, probe in pairs:
+        started = time.perf_counter()
+        docs = await retrieve(service, question, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if any(probe in doc.page_content for doc in docs):
+            hits += 1
+    print(f"{name:<8} hit@{k}={hits}/{len(pairs)} ({hits / len(pairs):.0%}), "
+          f"p50={statistics.median(latencies):.2f} ms, max={max(latencies):.2f} ms")
+
+
+async def check_pipeline_fastpath(service: VectorDBService, pairs: list) -> None:
+    """Đếm lời gọi embedding khi câu hỏi (không lịch sử) đi qua toàn bộ pipeline của GeminiService."""
+    from app.services.gemini_service import GeminiService
+    settings.CHAT_PROVIDER = "fake"
+    settings.FAKE_LLM_FIRST_TOKEN_MS = 0
+    settings.FAKE_LLM_TOKEN_DELAY_MS = 0
+    settings.ANSWER_CACHE_ENABLED = True
+    gemini = GeminiService(service)
+    embed_calls = 0
+    embed_query = service.embed_query
+
+    async def counting_embed_query(question: str):
+        nonlocal embed_calls
+        embed_calls += 1
+        return await embed_query(question)
+
+    service.embed_query = counting_embed_query
+    try:
+        fastpath, leaked = 0, 0
+        for question, _ in pairs:
+            hits_before, calls_before = service.lexical_fastpath_hits, embed_calls
+            async for _ in gemini.stream_events(question, []):
+                pass
+            if service.lexical_fastpath_hits > hits_before:
+                fastpath += 1
+                leaked += embed_calls > calls_before
+    finally:
+        service.embed_query = embed_query
+    print(f"Qua GeminiService: {fastpath}/{len(pairs)} câu đi đường tắt BM25, "
+          f"{leaked} câu trong số đó vẫn gọi embedding (phải là 0)")
+    assert leaked == 0, "Đường tắt BM25 không được gọi embedding"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Đánh giá truy xuất trên bộ FAQ")
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    vector_db_service = VectorDBService()
+    pairs = load_faq(FAQ_FILE)
+    print(f"Đánh giá {len(pairs)} câu hỏi từ {FAQ_FILE}\n")
+    # Chạy một lượt làm nóng để cache embedding không làm lệch kết quả giữa các chế độ
+    for question, _ in pairs:
+        await vector_db_service.embed_query(question)
+
+    await evaluate(vector_db_service, "faiss", dense_only, pairs, args.k)
+    await evaluate(vector_db_service, "bm25", lexical_only, pairs, args.k)
+    fastpath_before = vector_db_service.lexical_fastpath_hits
+    await evaluate(vector_db_service, "hybrid", hybrid, pairs, args.k)
+    print(f"\nBỏ qua embedding nhờ kết quả từ khóa: {vector_db_service.lexical_fastpath_hits - fastpath_before}/{len(pairs)} câu hỏi")
+    await check_pipeline_fastpath(vector_db_service, pairs)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+# scripts/fake_embedding_server.py
+"""
+Máy chủ embedding giả lập để chạy thử quá trình nạp dữ liệu mà không tốn hạn mức API.
+Vector sinh ra là tất định (dựa trên hash của văn bản), có thể cấu hình độ trễ và giới hạn request/phút.
+
+Cách dùng:
+    uvicorn scripts.fake_embedding_server:app --port 8765
+    FAKE_EMBED_RPM=60 FAKE_EMBED_LATENCY_MS=200 uvicorn scripts.fake_embedding_server:app --port 8765
+    python scripts/ingest_data.py --embedding-endpoint http://localhost:8765/embed
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import deque
+from typing import List
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+DIMENSION = int(os.getenv("FAKE_EMBED_DIMENSION", "768"))
+LATENCY_MS = float(os.getenv("FAKE_EMBED_LATENCY_MS", "50"))
+REQUESTS_PER_MINUTE = int(os.getenv("FAKE_EMBED_RPM", "0"))  # 0 = không giới hạn
+
+app = FastAPI(title="Fake Embedding Server")
+_recent_requests: deque = deque()
+
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+
+def fake_vector(text: str) -> List[float]:
+    """Sinh vector tất định, đã chuẩn hóa, từ hash SHA-256 của văn bản."""
+    values = []
+    counter = 0
+    while len(values) < DIMENSION:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    values = values[:DIMENSION]
+    norm = sum(v * v for v in values) ** 0.5
+    return [v / norm for v in values]
+
+
+@app.post("/embed")
+async def embed(request: EmbedRequest):
+    if REQUESTS_PER_MINUTE:
+        now = time.monotonic()
+        while _recent_requests and now - _recent_requests[0] > 60:
+            _recent_requests.popleft()
+        if len(_recent_requests) >= REQUESTS_PER_MINUTE:
+            return JSONResponse(status_code=429, content={"error": "RESOURCE_EXHAUSTED: quota exceeded"})
+        _recent_requests.append(now)
+
+    await asyncio.sleep(LATENCY_MS / 1000)
+    return {"embeddings": [fake_vector(text) for text in request.texts]}
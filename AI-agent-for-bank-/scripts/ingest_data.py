@@ -1,62 +1,284 @@
 import os
 import sys
-import time # Thêm thư viện time để tạo độ trễ
+import json
+import asyncio
+import hashlib
+import argparse
+import numpy as np
 
 # Thêm thư mục gốc vào path để import
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(project_root)
 
 # Import các thư viện cần thiết
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.document_loaders import DirectoryLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from langchain_community.vectorstores import FAISS
 from app.core.config import settings
+from app.services.chunking_service import (
+    CHUNKER_VERSION, discover_files, file_sha256, iter_chunked_files, read_jsonl
+)
+from app.services.embedding_service import (
+    create_embeddings, embedding_model_name, write_index_metadata, read_index_metadata
+)
+from app.services.index_store import (
+    build_faiss_index, index_factory_string, read_arrays, read_docs, store_exists,
+    write_arrays, write_docstore, write_faiss_index
+)
+from app.services.category_router import write_category_indexes
+from app.services.lexical_index import BM25Index
+from app.services.snapshot_store import collect_garbage, create_snapshot_dir, publish_snapshot, resolve_current
+from scripts.embedding_engine import EmbeddingEngine, Checkpoint
+
+DATA_DIR = './data'
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 2
+# Manifest phiên bản 1 đi kèm chỉ mục LangChain (pickle), vẫn đọc được để chuyển đổi
+LEGACY_MANIFEST_VERSION = 1
+# File chỉ mục định dạng cũ nằm thẳng trong VECTOR_DB_PATH (trước khi có snapshot)
+LEGACY_INDEX_FILES = ("index.faiss", "index.pkl")
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, text: str, occurrence: int) -> str:
+    """
+    ID ổn định của một chunk, suy ra từ nội dung: chunk không đổi thì ID không đổi.
+    `occurrence` phân biệt các chunk có nội dung trùng nhau trong cùng một file.
+    """
+    return sha256_text(f"{source}\0{occurrence}\0{text}")[:32]
+
+
+def load_manifest(db_path: str, model_name: str) -> dict:
+    """Đọc manifest cũ; trả về manifest rỗng nếu không có hoặc không tương thích."""
+    path = os.path.join(db_path, MANIFEST_FILENAME)
+    empty = {"files": {}}
+    if not os.path.exists(path) or not os.path.exists(os.path.join(db_path, "index.faiss")):
+        return empty
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    legacy = manifest.get("version") == LEGACY_MANIFEST_VERSION
+    if not (store_exists(db_path) or (legacy and os.path.exists(os.path.join(db_path, "index.pkl")))):
+        return empty
+    expected = {
+        "version": LEGACY_MANIFEST_VERSION if legacy else MANIFEST_VERSION,
+        "embedding_model": model_name,
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "chunker": CHUNKER_VERSION,
+    }
+    for key, value in expected.items():
+        if manifest.get(key) != value:
+            print(f"Manifest không khớp cấu hình ({key}), sẽ dựng lại toàn bộ chỉ mục.")
+            return empty
+    return manifest
+
+
+def save_manifest(db_path: str, model_name: str, files: dict) -> None:
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "embedding_model": model_name,
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "chunker": CHUNKER_VERSION,
+        "files": files,
+    }
+    path = os.path.join(db_path, MANIFEST_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def split_file(file: dict) -> tuple:
+    """Chuyển các chunk của một file (dạng của chunk_file()) thành Document kèm ID ổn định và hash của từng chunk."""
+    docs = [Document(page_content=chunk["text"], metadata=chunk["metadata"]) for chunk in file["chunks"]]
+    seen = {}
+    ids, hashes = [], []
+    for doc in docs:
+        content_hash = sha256_text(doc.page_content)
+        occurrence = seen.get(content_hash, 0)
+        seen[content_hash] = occurrence + 1
+        ids.append(chunk_id(file["source"], doc.page_content, occurrence))
+        hashes.append(content_hash)
+    return docs, ids, hashes
+
+
+def plan_changes(old_files: dict, chunks_path: str = None, workers: int = None) -> tuple:
+    """
+    So sánh dữ liệu với manifest cũ.
+    Trả về (manifest mới, danh sách (id, Document) cần embed, danh sách id cần xóa).
+    Nguồn chunk: file JSONL của scripts/chunk_data.py nếu có `chunks_path`, nếu không thì chia trực tiếp
+    (chỉ các file đã thay đổi) trong process pool. Cả hai đều được đọc dần theo từng file.
+    """
+    new_files = {}
+    to_add = []
+    old_ids = {cid for entry in old_files.values() for cid in entry["chunk_ids"]}
+
+    if chunks_path:
+        chunked = read_jsonl(chunks_path)
+    else:
+        changed = []
+        for path in discover_files(DATA_DIR):
+            source = os.path.relpath(path, ".")
+            old_entry = old_files.get(source)
+            if old_entry and old_entry["sha256"] == file_sha256(path):
+                # File không đổi: giữ nguyên các chunk cũ, không cần chia lại
+                new_files[source] = old_entry
+            else:
+                changed.append(path)
+        chunked = iter_chunked_files(changed, workers=workers, data_dir=DATA_DIR)
+
+    for file in chunked:
+        source = file["source"]
+        old_entry = old_files.get(source)
+        if old_entry and old_entry["sha256"] == file["sha256"]:
+            new_files[source] = old_entry
+            continue
+
+        docs, ids, hashes = split_file(file)
+        new_files[source] = {"sha256": file["sha256"], "chunk_ids": ids, "chunk_hashes": hashes}
+        to_add.extend((cid, doc) for cid, doc in zip(ids, docs) if cid not in old_ids)
+        print(f"   - Thay đổi: {source} ({len(docs)} đoạn)")
+
+    new_ids = {cid for entry in new_files.values() for cid in entry["chunk_ids"]}
+    to_delete = sorted(old_ids - new_ids)
+    return new_files, to_add, to_delete
+
+
+def load_existing_store(db_path: str, manifest: dict, embeddings) -> tuple:
+    """
+    Đọc (ids, vectors, docs) của chỉ mục hiện có.
+    Chỉ mục định dạng cũ (LangChain FAISS + pickle) được chuyển đổi mà không cần embed lại.
+    """
+    if manifest.get("version") == MANIFEST_VERSION:
+        ids, vectors = read_arrays(db_path)
+        return ids, np.asarray(vectors), read_docs(db_path)
+
+    print("Chuyển đổi chỉ mục định dạng cũ (pickle) sang định dạng mới...")
+    legacy = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
+    ids = [legacy.index_to_docstore_id[i] for i in range(legacy.index.ntotal)]
+    vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+    docs = []
+    for doc_id in ids:
+        doc = legacy.docstore.search(doc_id)
+        docs.append((doc.page_content, doc.metadata))
+    return ids, vectors, docs
+
+
+def save_lexical_index(docs: list, db_path: str) -> None:
+    """Dựng lại chỉ mục BM25 trên toàn bộ chunk (không cần gọi embedding). ID tài liệu là số dòng."""
+    BM25Index.build((row, text) for row, (text, _) in enumerate(docs)).save(db_path)
+    print(f"   - Đã dựng chỉ mục BM25 cho {len(docs)} đoạn.")
+
+
+def write_store(db_path: str, model_name: str, ids: list, vectors: np.ndarray, docs: list) -> None:
+    """Ghi docstore, vector gốc, chỉ mục FAISS theo loại cấu hình, metadata, BM25 và chỉ mục con theo danh mục vào thư mục snapshot."""
+    factory = index_factory_string(settings.FAISS_INDEX_TYPE, len(ids), vectors.shape[1], settings.FAISS_HNSW_M)
+    print(f"   - Dựng chỉ mục FAISS '{factory}' cho {len(ids)} đoạn...")
+    index = build_faiss_index(vectors, factory)
+
+    write_docstore(db_path, docs)
+    write_arrays(db_path, ids, vectors)
+    write_faiss_index(db_path, index)
+    write_index_metadata(db_path, model_name, index.d,
+                         index_type=settings.FAISS_INDEX_TYPE, factory=factory, count=len(ids))
+    save_lexical_index(docs, db_path)
+    categories = write_category_indexes(db_path, docs, vectors, settings.FAISS_INDEX_TYPE, settings.FAISS_HNSW_M)
+    print(f"   - Đã dựng {len(categories)} chỉ mục con theo danh mục: "
+          + ", ".join(f"{name} ({count})" for name, count in categories.items()))
+
+
+def remove_old_snapshots(root: str) -> None:
+    for name in collect_garbage(root, settings.SNAPSHOT_GC_GRACE_SECONDS):
+        print(f"   - Đã xóa snapshot cũ: {name}")
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Nạp dữ liệu vào FAISS (tăng dần theo manifest).")
+    parser.add_argument("--full", action="store_true", help="Bỏ qua manifest và dựng lại toàn bộ chỉ mục.")
+    parser.add_argument("--embedding-endpoint", help="Dùng dịch vụ embedding HTTP (ví dụ máy chủ giả lập) thay cho provider trong cấu hình.")
+    parser.add_argument("--concurrency", type=int, default=settings.INGEST_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_SIZE)
+    parser.add_argument("--chunks", help="Đọc chunk từ file JSONL do scripts/chunk_data.py tạo thay vì chia lại thư mục dữ liệu.")
+    parser.add_argument("--workers", type=int, default=settings.CHUNK_WORKERS, help="Số tiến trình chia file (0 = số CPU).")
+    args = parser.parse_args()
+
     print("--- Bắt đầu nạp dữ liệu ---")
-    
-    # Khởi tạo model embedding
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model=settings.GEMINI_EMBEDDING_MODEL,
-        google_api_key=settings.GOOGLE_API_KEY
+
+    # Khởi tạo model embedding theo provider trong cấu hình
+    if args.embedding_endpoint:
+        settings.EMBEDDING_PROVIDER = "http"
+        settings.EMBEDDING_HTTP_ENDPOINT = args.embedding_endpoint
+    embeddings = create_embeddings()
+    model_name = embedding_model_name()
+    print(f"Sử dụng model embedding: {model_name}")
+
+    # Đọc từ snapshot đang được phục vụ, ghi ra một snapshot mới (không bao giờ ghi đè tại chỗ)
+    root = settings.VECTOR_DB_PATH
+    db_path = resolve_current(root)
+
+    old_manifest = {"files": {}} if args.full else load_manifest(db_path, model_name)
+    new_files, to_add, to_delete = plan_changes(old_manifest["files"], args.chunks, args.workers)
+    print(f"Cần embed {len(to_add)} đoạn mới/thay đổi, xóa {len(to_delete)} đoạn cũ.")
+
+    index_type_changed = read_index_metadata(db_path).get("index_type") != settings.FAISS_INDEX_TYPE
+    if (not to_add and not to_delete and old_manifest["files"]
+            and old_manifest.get("version") == MANIFEST_VERSION and not index_type_changed):
+        print("--- Dữ liệu không thay đổi, không cần cập nhật chỉ mục ---")
+        remove_old_snapshots(root)
+        return
+
+    # Embed song song, có giới hạn tốc độ; checkpoint nằm cạnh (không nằm trong) thư mục chỉ mục
+    checkpoint = Checkpoint(root.rstrip("/\\") + ".checkpoint.jsonl", model_name)
+    engine = EmbeddingEngine(
+        embeddings,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        requests_per_minute=settings.EMBEDDING_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.EMBEDDING_TOKENS_PER_MINUTE,
+        max_retries=settings.INGEST_MAX_RETRIES,
+        checkpoint=checkpoint,
     )
+    new_vectors = asyncio.run(engine.run([(cid, doc.page_content) for cid, doc in to_add]))
+
+    # Ghép các chunk cũ còn giữ lại với các chunk mới, theo ID ổn định
+    ids, vectors, docs = [], None, []
+    if old_manifest["files"]:
+        old_ids, old_vectors, old_docs = load_existing_store(db_path, old_manifest, embeddings)
+        deleted = set(to_delete)
+        keep = [row for row, cid in enumerate(old_ids) if cid not in deleted]
+        ids = [old_ids[row] for row in keep]
+        vectors = old_vectors[keep]
+        docs = [old_docs[row] for row in keep]
+        if to_delete:
+            print(f"   - Đã loại bỏ {len(to_delete)} vector của các đoạn bị xóa.")
+    if to_add:
+        added = np.asarray([new_vectors[cid] for cid, _ in to_add], dtype=np.float32)
+        vectors = added if vectors is None else np.vstack([vectors, added])
+        ids.extend(cid for cid, _ in to_add)
+        docs.extend((doc.page_content, doc.metadata) for _, doc in to_add)
+
+    if not ids:
+        print("Không có đoạn văn bản nào để nạp.")
+        return
+
+    # Ghi chỉ mục và manifest vào snapshot tạm, rồi mới xuất bản (đổi CURRENT) để các worker
+    # đang chạy chỉ thấy snapshot khi nó đã đầy đủ và nhất quán
+    snapshot_name, staging = create_snapshot_dir(root)
+    print(f"Đang ghi snapshot '{snapshot_name}' tại: '{root}'...")
+    write_store(staging, model_name, ids, vectors, docs)
+    save_manifest(staging, model_name, new_files)
+    publish_snapshot(root, snapshot_name, staging)
+    checkpoint.remove()
+    legacy_files = [name for name in LEGACY_INDEX_FILES if os.path.exists(os.path.join(root, name))]
+    if db_path == root and legacy_files:
+        print(f"ℹ️ Các file định dạng cũ nằm trực tiếp trong '{root}' ({', '.join(legacy_files)}) "
+              f"không còn được sử dụng và có thể xóa.")
+    remove_old_snapshots(root)
 
-    # Tải và xử lý tài liệu
-    loader = DirectoryLoader('./data', glob="**/*.txt", show_progress=True)
-    documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    docs = text_splitter.split_documents(documents)
-    
-    print(f"Đã chia thành {len(docs)} đoạn văn bản.")
-    
-    db_path = settings.VECTOR_DB_PATH 
-    print(f"Đang tạo vector và lưu vào FAISS tại: '{db_path}'...")
-    
-    # ✅ THAY ĐỔI: Xử lý theo từng lô nhỏ để tránh lỗi server
-    
-    # 1. Tạo một cơ sở dữ liệu rỗng trước
-    # Lấy vector của đoạn văn bản đầu tiên để khởi tạo DB
-    first_doc_text = [docs[0].page_content]
-    first_embedding = embeddings.embed_documents(first_doc_text)
-    
-    # Tạo index với kích thước vector chính xác
-    index = FAISS.from_embeddings(text_embeddings=list(zip(first_doc_text, first_embedding)), embedding=embeddings)
-    
-    # Thêm các tài liệu còn lại theo từng lô
-    batch_size = 20  # Mỗi lần chỉ xử lý 20 đoạn
-    for i in range(1, len(docs), batch_size):
-        batch = docs[i:i + batch_size]
-        print(f"   - Đang xử lý lô {i//batch_size + 1} (gồm {len(batch)} đoạn)...")
-        index.add_documents(batch)
-        print("   - Nghỉ 1 giây để tránh quá tải API...")
-        time.sleep(1) # Nghỉ 1 giây giữa các lần gọi
-
-    # 2. Lưu cơ sở dữ liệu sau khi đã thêm tất cả
-    index.save_local(db_path)
-    
     print(f"--- Hoàn tất! Đã lưu DB thành công ---")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,62 @@
+# scripts/smoke_chat_use_case.py
+"""
+Kiểm tra nhanh ChatUseCase với model giả lập (CHAT_PROVIDER=fake), không cần mạng:
+`process_message` phải trả về câu trả lời thật từ pipeline (không phải thông báo lỗi kỹ thuật),
+cả khi use case dùng service dựng sẵn (như của ServiceContainer) lẫn khi tự dựng; `close_services` chỉ đóng
+service do use case tự dựng.
+Chỉ mục lấy từ VECTOR_DB_PATH (chạy scripts/ingest_data.py trước).
+
+Cách dùng:
+    python scripts/smoke_chat_use_case.py
+"""
+import os
+import sys
+import asyncio
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+os.environ["CHAT_PROVIDER"] = "fake"
+os.environ["FAKE_LLM_FIRST_TOKEN_MS"] = "0"
+os.environ["FAKE_LLM_TOKEN_DELAY_MS"] = "0"
+
+from app.core.config import settings
+from app.services.gemini_service import GeminiService
+from app.services.vector_db_service import VectorDBService
+from app.use_cases.chat_use_case import ChatUseCase
+
+ERROR_REPLY = "Xin lỗi, đã xảy ra lỗi kỹ thuật"
+
+
+async def check(use_case: ChatUseCase) -> None:
+    reply = await use_case.process_message("Số hotline của ngân hàng là gì?")
+    print(f"Câu trả lời: {reply[:200]}")
+    assert reply.strip(), "process_message trả về câu trả lời rỗng"
+    assert not reply.startswith(ERROR_REPLY), "process_message trả về thông báo lỗi thay vì câu trả lời"
+    assert await use_case.process_message("") == "Xin vui lòng nhập câu hỏi của bạn."
+
+
+async def main():
+    # Service dựng sẵn (như ServiceContainer): use case dùng chung chỉ mục và không đóng nó
+    vector_db_service = VectorDBService()
+    shared = ChatUseCase(settings, GeminiService(vector_db_service))
+    assert shared.vector_db_service is vector_db_service
+    try:
+        await check(shared)
+        await shared.close_services()
+        await check(shared)
+    finally:
+        await vector_db_service.close()
+
+    # Use case tự dựng service của mình và tự đóng
+    standalone = ChatUseCase(settings)
+    try:
+        await check(standalone)
+    finally:
+        await standalone.close_services()
+    print("✅ ChatUseCase trả lời được qua pipeline RAG.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,16 @@
+# tests/conftest.py
+"""
+Cấu hình chung cho pytest: chạy từ thư mục gốc dự án (`python -m pytest -q`), không cần mạng hay khóa API.
+Các test chỉ dùng các lớp thuần (kiểm soát tải, gộp request, circuit breaker); biến môi trường dưới đây
+chỉ để `Settings` khởi tạo được khi import.
+"""
+import os
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("CHAT_MODEL_NAME", "fake-chat")
+os.environ.setdefault("CHAT_PROVIDER", "fake")
+os.environ.setdefault("EMBEDDING_PROVIDER", "hashing")
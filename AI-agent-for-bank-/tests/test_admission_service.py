@@ -0,0 +1,173 @@
+# tests/test_admission_service.py
+import asyncio
+import pytest
+from app.services.admission_service import AdmissionController, AdmissionRejected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle():
+    """Cho các task vừa tạo chạy tới điểm chờ (vào hàng đợi / nhận suất)."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_admits_up_to_max_concurrency_then_queues():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=2, max_queue_depth=4, max_per_client=4)
+        first = await admission.acquire("a")
+        await admission.acquire("b")
+        waiting = asyncio.create_task(admission.acquire("c"))
+        await settle()
+        assert not waiting.done()
+        assert admission.stats()["queue_depth"] == 1
+
+        first.release()
+        await settle()
+        assert waiting.done()
+        # Suất được chuyển thẳng cho request đang chờ: số request đang chạy không đổi
+        assert admission.stats()["in_flight"] == 2
+        assert admission.stats()["queue_depth"] == 0
+    run(scenario())
+
+
+def test_client_limit_rejects_with_429_and_retry_after():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=8, max_queue_depth=8, max_per_client=2)
+        await admission.acquire("kiosk-1")
+        await admission.acquire("kiosk-1")
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await admission.acquire("kiosk-1")
+        assert excinfo.value.status_code == 429
+        assert excinfo.value.reason == "client_limit"
+        assert 1 <= excinfo.value.retry_after <= 60
+        # Client khác không bị ảnh hưởng
+        await admission.acquire("kiosk-2")
+        assert admission.stats()["rejected"] == {"client_limit": 1}
+    run(scenario())
+
+
+def test_full_queue_rejects_with_503():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue_depth=1, max_per_client=4)
+        await admission.acquire("a")
+        waiting = asyncio.create_task(admission.acquire("b"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await admission.acquire("c")
+        assert excinfo.value.status_code == 503
+        assert excinfo.value.reason == "queue_full"
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+    run(scenario())
+
+
+def test_queue_timeout_rejects_with_503_and_leaves_the_queue():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue_depth=4, queue_timeout=0.05, max_per_client=4)
+        holder = await admission.acquire("a")
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await admission.acquire("b")
+        assert excinfo.value.status_code == 503
+        assert excinfo.value.reason == "queue_timeout"
+        assert admission.stats()["queue_depth"] == 0
+
+        # Request hết hạn không giữ suất: suất được trả về khi request đang chạy xong
+        holder.release()
+        assert admission.stats()["in_flight"] == 0
+        await admission.acquire("b")
+    run(scenario())
+
+
+def test_waiting_clients_are_served_round_robin():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue_depth=8, max_per_client=8)
+        holder = await admission.acquire("x")
+        order = []
+
+        async def request(name: str, client_id: str):
+            ticket = await admission.acquire(client_id)
+            order.append(name)
+            return ticket
+
+        tasks = {}
+        # Kiosk A gửi dồn 3 request trước khi kiosk B gửi 1
+        for name, client_id in (("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")):
+            tasks[name] = asyncio.create_task(request(name, client_id))
+            await settle()
+
+        # Mỗi lần request đang chạy xong, suất đi tới đúng một request đang chờ
+        ticket = holder
+        for served in range(1, len(tasks) + 1):
+            ticket.release()
+            await settle()
+            assert len(order) == served
+            ticket = tasks[order[-1]].result()
+        assert order == ["a1", "b1", "a2", "a3"]
+    run(scenario())
+
+
+def test_cancelled_waiter_is_removed_from_the_queue():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue_depth=4, max_per_client=4)
+        holder = await admission.acquire("a")
+        waiting = asyncio.create_task(admission.acquire("b"))
+        await settle()
+        assert admission.stats()["queue_depth"] == 1
+
+        # Client ngắt kết nối khi đang chờ: endpoint hủy task xin suất
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        stats = admission.stats()
+        assert stats["queue_depth"] == 0
+        assert stats["client_disconnects"] == 1
+
+        holder.release()
+        assert admission.stats()["in_flight"] == 0
+        # Client "b" không còn bị tính là đang có request: vẫn được đủ max_per_client suất
+        admission.max_concurrency = 4
+        for _ in range(4):
+            await admission.acquire("b")
+    run(scenario())
+
+
+def test_release_is_idempotent():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=2, max_queue_depth=4, max_per_client=4)
+        ticket = await admission.acquire("a")
+        await admission.acquire("b")
+        ticket.release()
+        ticket.release()
+        assert admission.stats()["in_flight"] == 1
+    run(scenario())
+
+
+def test_hand_off_moves_the_slot_to_the_returned_release():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue_depth=4, max_per_client=4)
+        ticket = await admission.acquire("a")
+        release = ticket.hand_off()
+
+        # Request mở luồng chung đã rời đi: suất vẫn được giữ cho luồng
+        ticket.release()
+        assert admission.stats()["in_flight"] == 1
+        waiting = asyncio.create_task(admission.acquire("b"))
+        await settle()
+        assert not waiting.done()
+
+        release()
+        await settle()
+        assert waiting.done()
+        waiting.result().release()
+        release()
+        assert admission.stats()["in_flight"] == 0
+
+        # Ticket đã trả thì không còn gì để chuyển giao
+        spent = await admission.acquire("a")
+        spent.release()
+        spent.hand_off()()
+        assert admission.stats()["in_flight"] == 0
+    run(scenario())
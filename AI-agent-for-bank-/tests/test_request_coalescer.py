@@ -0,0 +1,169 @@
+# tests/test_request_coalescer.py
+import asyncio
+from app.services.request_coalescer import RequestCoalescer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class GatedSource:
+    """Pipeline giả: phát từng sự kiện khi test cho phép (`step()`), ghi lại việc bị hủy."""
+
+    def __init__(self, events, error: Exception = None):
+        self.events = list(events)
+        self.error = error
+        self.gate = asyncio.Queue()
+        self.cancelled = False
+        self.calls = 0
+
+    def factory(self):
+        self.calls += 1
+        return self._run()
+
+    async def _run(self):
+        try:
+            for event in self.events:
+                await self.gate.get()
+                yield event
+            if self.error is not None:
+                await self.gate.get()
+                raise self.error
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+    async def step(self, count: int = 1):
+        for _ in range(count):
+            self.gate.put_nowait(None)
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+
+EVENTS = [("sources", ["faq.txt"]), ("token", "Xin "), ("token", "chào"), ("done", {})]
+
+
+async def collect(subscription, into: list):
+    async for event in subscription:
+        into.append(event)
+
+
+def test_late_subscriber_gets_replay_then_tail():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        source = GatedSource(EVENTS)
+        first, joined_first = coalescer.stream("k", source.factory)
+        first_events = []
+        first_task = asyncio.create_task(collect(first, first_events))
+        await source.step(2)
+        assert first_events == EVENTS[:2]
+
+        second, joined_second = coalescer.stream("k", source.factory)
+        second_events = []
+        second_task = asyncio.create_task(collect(second, second_events))
+        await source.step(0)
+        # Các sự kiện đã phát được gửi lại ngay cho người đăng ký muộn
+        assert second_events == EVENTS[:2]
+
+        await source.step(2)
+        await asyncio.gather(first_task, second_task)
+        assert (joined_first, joined_second) == (False, True)
+        assert first_events == second_events == EVENTS
+        assert source.calls == 1
+        assert coalescer.stats() == {"in_flight": 0, "started": 1, "joined": 1}
+    run(scenario())
+
+
+def test_subscriber_disconnect_does_not_cancel_the_others():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        source = GatedSource(EVENTS)
+        leader, _ = coalescer.stream("k", source.factory)
+        follower, _ = coalescer.stream("k", source.factory)
+        follower_events = []
+        follower_task = asyncio.create_task(collect(follower, follower_events))
+
+        await source.step()
+        assert await leader.__anext__() == EVENTS[0]
+        # Request mở luồng ngắt kết nối
+        await leader.aclose()
+
+        await source.step(3)
+        await follower_task
+        assert follower_events == EVENTS
+        assert not source.cancelled
+    run(scenario())
+
+
+def test_last_subscriber_leaving_cancels_the_pipeline():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        source = GatedSource(EVENTS)
+        subscription, _ = coalescer.stream("k", source.factory)
+        await source.step()
+        assert await subscription.__anext__() == EVENTS[0]
+        await subscription.aclose()
+        await source.step(0)
+        assert source.cancelled
+        assert coalescer.in_flight() == 0
+
+        # Request trùng tới sau mở luồng mới
+        coalescer.stream("k", source.factory)
+        assert source.calls == 2
+    run(scenario())
+
+
+def test_errors_reach_every_subscriber():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        source = GatedSource(EVENTS[:1], error=RuntimeError("model lỗi"))
+        subscriptions = [coalescer.stream("k", source.factory)[0] for _ in range(2)]
+        tasks = [asyncio.create_task(collect(subscription, [])) for subscription in subscriptions]
+        await source.step(2)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert coalescer.in_flight() == 0
+    run(scenario())
+
+
+def test_handed_off_slot_is_released_when_the_pipeline_ends():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        source = GatedSource(EVENTS)
+        releases = []
+
+        def hand_off():
+            return lambda: releases.append("slot")
+
+        leader, _ = coalescer.stream("k", source.factory, hand_off)
+        # Request tham gia sau không chuyển giao gì (nó tự trả suất của mình ngay)
+        follower, _ = coalescer.stream("k", source.factory, hand_off)
+        follower_events = []
+        follower_task = asyncio.create_task(collect(follower, follower_events))
+
+        await source.step()
+        assert await leader.__anext__() == EVENTS[0]
+        await leader.aclose()
+        # Request mở luồng đã rời đi nhưng model vẫn đang sinh cho người khác: suất vẫn được giữ
+        assert releases == []
+
+        await source.step(3)
+        await follower_task
+        await source.step(0)
+        assert releases == ["slot"]
+    run(scenario())
+
+
+def test_handed_off_slot_is_released_when_the_pipeline_is_cancelled():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        source = GatedSource(EVENTS)
+        releases = []
+        subscription, _ = coalescer.stream("k", source.factory, lambda: lambda: releases.append("slot"))
+        await source.step()
+        await subscription.__anext__()
+        await subscription.aclose()
+        await source.step(0)
+        assert source.cancelled
+        assert releases == ["slot"]
+    run(scenario())
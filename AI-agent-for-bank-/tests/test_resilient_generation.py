@@ -0,0 +1,122 @@
+# tests/test_resilient_generation.py
+import asyncio
+import pytest
+from app.services.resilient_generation import (
+    ChatProvider, CircuitBreaker, GenerationUnavailable, ResilientGenerator
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_breaker(clock: FakeClock, threshold: int = 3) -> CircuitBreaker:
+    return CircuitBreaker("fake", failure_threshold=threshold, reset_seconds=30, clock=clock)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = make_breaker(FakeClock())
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = make_breaker(FakeClock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_a_single_probe_then_closes_on_success():
+    clock = FakeClock()
+    breaker = make_breaker(clock, threshold=1)
+    breaker.record_failure()
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Chỉ một request thử trong lúc half_open
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_a_full_period():
+    clock = FakeClock()
+    breaker = make_breaker(clock, threshold=3)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened_at == clock.now
+    clock.now += 29
+    assert not breaker.allow()
+
+
+def test_cancelled_probe_gives_the_probe_back():
+    clock = FakeClock()
+    breaker = make_breaker(clock, threshold=1)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    # Request thử thua hedge: không phải lỗi của provider, cho thử lại
+    breaker.record_cancelled()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+class FailingChain:
+    def __init__(self):
+        self.calls = 0
+
+    async def astream(self, inputs):
+        self.calls += 1
+        raise RuntimeError("503")
+        yield  # pragma: no cover
+
+
+class AnsweringChain:
+    async def astream(self, inputs):
+        for chunk in ("Xin ", "chào"):
+            yield chunk
+
+
+def test_generator_fails_over_and_skips_an_open_breaker():
+    async def scenario():
+        clock = FakeClock()
+        failing = FailingChain()
+        primary = ChatProvider("primary", failing, make_breaker(clock, threshold=1))
+        fallback = ChatProvider("fallback", AnsweringChain(), make_breaker(clock))
+        generator = ResilientGenerator([primary, fallback], first_token_timeout=1.0, hedge_enabled=False)
+
+        info = {}
+        assert "".join([chunk async for chunk in generator.astream({}, info)]) == "Xin chào"
+        assert info["provider"] == "fallback"
+        assert primary.breaker.state == "open"
+
+        # Provider chính đang bị ngắt mạch: không gọi lại nó
+        assert "".join([chunk async for chunk in generator.astream({})]) == "Xin chào"
+        assert failing.calls == 1
+
+        fallback.breaker.state = "open"
+        fallback.breaker.opened_at = clock.now
+        with pytest.raises(GenerationUnavailable):
+            async for _ in generator.astream({}):
+                pass
+    asyncio.run(scenario())
@@ -0,0 +1,275 @@
+# voice_input.py
+"""
+Nhập câu hỏi bằng giọng nói cho kiosk:
+- hiệu chỉnh nhiễu nền MỘT lần khi khởi động và làm mới định kỳ lúc kiosk rảnh (không phải mỗi lần bấm mic);
+- phát hiện hết câu bằng VAD theo từng khung 30 ms (năng lượng so với nhiễu nền, thêm webrtcvad nếu đã cài),
+  nên câu hỏi kết thúc sau ~0.4 giây im lặng thay vì chờ timeout cố định;
+- nhận dạng qua backend thay thế được: "google" (Google Web Speech), "vosk" (offline) hoặc "fake" (kiểm thử).
+
+Cấu hình qua biến môi trường: VOICE_BACKEND, VOICE_LANGUAGE, VOSK_MODEL_PATH, FAKE_TRANSCRIPTS, FAKE_RECOGNITION_MS.
+"""
+import os
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+SAMPLE_WIDTH = 2  # PCM 16-bit mono
+
+# Hết câu khi im lặng liên tục bấy nhiêu mili giây (speech_recognition mặc định chờ 0.8 giây)
+END_SILENCE_MS = int(os.getenv("VOICE_END_SILENCE_MS", "400"))
+NO_SPEECH_TIMEOUT_S = 5.0
+MAX_UTTERANCE_S = 10.0
+# Làm mới mức nhiễu nền sau bấy nhiêu giây (chỉ khi kiosk đang rảnh)
+RECALIBRATE_SECONDS = 300
+
+
+class NoSpeechError(Exception):
+    """Không phát hiện giọng nói trong thời gian chờ."""
+
+
+class RecognitionError(Exception):
+    """Backend nhận dạng không trả về được văn bản (không hiểu hoặc lỗi dịch vụ)."""
+
+
+@dataclass
+class Utterance:
+    audio: bytes
+    speech_started: float
+    # Thời điểm (perf_counter) kết thúc khung có tiếng nói cuối cùng, tức "hết câu" thực sự
+    speech_ended: float
+    # Thời điểm VAD kết luận câu đã hết (sau END_SILENCE_MS im lặng)
+    detected_at: float
+
+
+# --- Phát hiện tiếng nói ---
+
+def frame_rms(frame: bytes) -> float:
+    samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+    return float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+
+
+class EnergyVAD:
+    """Khung có tiếng nói khi năng lượng vượt mức nhiễu nền đã hiệu chỉnh nhân `ratio`."""
+
+    def __init__(self, ratio: float = 3.0, min_threshold: float = 300.0):
+        self.ratio = ratio
+        self.min_threshold = min_threshold
+        self.threshold = min_threshold
+        self.calibrated_at: Optional[float] = None
+
+    def calibrate(self, frames: List[bytes]) -> None:
+        if frames:
+            noise = float(np.median([frame_rms(frame) for frame in frames]))
+            self.threshold = max(self.min_threshold, noise * self.ratio)
+        self.calibrated_at = time.monotonic()
+
+    def is_speech(self, frame: bytes) -> bool:
+        return frame_rms(frame) >= self.threshold
+
+
+class WebRtcVAD(EnergyVAD):
+    """Kết hợp webrtcvad (phân biệt giọng nói với tiếng ồn) với ngưỡng năng lượng đã hiệu chỉnh."""
+
+    def __init__(self, aggressiveness: int = 2, **kwargs):
+        super().__init__(**kwargs)
+        import webrtcvad
+        self.vad = webrtcvad.Vad(aggressiveness)
+
+    def is_speech(self, frame: bytes) -> bool:
+        return super().is_speech(frame) and self.vad.is_speech(frame, SAMPLE_RATE)
+
+
+def create_vad() -> EnergyVAD:
+    try:
+        return WebRtcVAD()
+    except ImportError:
+        return EnergyVAD()
+
+
+class UtteranceDetector:
+    """
+    Máy trạng thái theo từng khung: bắt đầu câu sau `min_speech_ms` có tiếng nói, kết thúc sau
+    `end_silence_ms` im lặng liên tục (hoặc khi vượt `max_utterance_s`). Giữ lại `pre_roll_ms` âm thanh
+    trước khi bắt đầu để không mất âm tiết đầu.
+    """
+
+    def __init__(self, vad: EnergyVAD, end_silence_ms: int = END_SILENCE_MS, min_speech_ms: int = 90,
+                 max_utterance_s: float = MAX_UTTERANCE_S, pre_roll_ms: int = 300):
+        self.vad = vad
+        self.end_silence_frames = max(1, end_silence_ms // FRAME_MS)
+        self.min_speech_frames = max(1, min_speech_ms // FRAME_MS)
+        self.max_frames = int(max_utterance_s * 1000 / FRAME_MS)
+        self.pre_roll = deque(maxlen=max(1, pre_roll_ms // FRAME_MS))
+        self.frames: List[bytes] = []
+        self.voiced_run = 0
+        self.silence_run = 0
+        self.speech_started: Optional[float] = None
+        self.last_voiced: Optional[float] = None
+
+    def feed(self, frame: bytes, now: float) -> Optional[Utterance]:
+        """Nhận một khung (kết thúc tại thời điểm `now`); trả về Utterance khi câu vừa kết thúc."""
+        voiced = self.vad.is_speech(frame)
+        if self.speech_started is None:
+            self.pre_roll.append(frame)
+            self.voiced_run = self.voiced_run + 1 if voiced else 0
+            if self.voiced_run >= self.min_speech_frames:
+                self.speech_started = now - self.voiced_run * FRAME_MS / 1000
+                self.frames = list(self.pre_roll)
+                self.last_voiced = now
+            return None
+
+        self.frames.append(frame)
+        if voiced:
+            self.silence_run = 0
+            self.last_voiced = now
+        else:
+            self.silence_run += 1
+        if self.silence_run >= self.end_silence_frames or len(self.frames) >= self.max_frames:
+            return Utterance(b"".join(self.frames), self.speech_started, self.last_voiced, now)
+        return None
+
+
+# --- Nguồn âm thanh ---
+
+class MicrophoneSource:
+    """Đọc khung PCM 16 kHz từ micro mặc định (qua speech_recognition/PyAudio)."""
+
+    def __enter__(self) -> "MicrophoneSource":
+        import speech_recognition as sr
+        self.microphone = sr.Microphone(sample_rate=SAMPLE_RATE, chunk_size=FRAME_SAMPLES)
+        self.source = self.microphone.__enter__()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.microphone.__exit__(*exc)
+
+    def frames(self) -> Iterator[bytes]:
+        while True:
+            yield self.source.stream.read(FRAME_SAMPLES)
+
+
+# --- Backend nhận dạng ---
+
+class SpeechBackend:
+    name = "base"
+
+    def transcribe(self, audio: bytes) -> str:
+        """Nhận PCM 16-bit mono 16 kHz, trả về văn bản; ném RecognitionError nếu thất bại."""
+        raise NotImplementedError
+
+
+class GoogleSpeechBackend(SpeechBackend):
+    name = "google"
+
+    def __init__(self, language: str = "vi-VN"):
+        import speech_recognition as sr
+        self.sr = sr
+        self.recognizer = sr.Recognizer()
+        self.language = language
+
+    def transcribe(self, audio: bytes) -> str:
+        try:
+            return self.recognizer.recognize_google(
+                self.sr.AudioData(audio, SAMPLE_RATE, SAMPLE_WIDTH), language=self.language
+            )
+        except self.sr.UnknownValueError as e:
+            raise RecognitionError("Không thể nhận dạng giọng nói.") from e
+        except self.sr.RequestError as e:
+            raise RecognitionError(f"Lỗi dịch vụ: {e}") from e
+
+
+class VoskSpeechBackend(SpeechBackend):
+    """Nhận dạng offline bằng Vosk; model (vd. vosk-model-small-vn) được nạp một lần."""
+    name = "vosk"
+
+    def __init__(self, model_path: str):
+        try:
+            import vosk
+        except ImportError as e:
+            raise RuntimeError("Backend 'vosk' cần cài thêm gói vosk và tải model tiếng Việt.") from e
+        if not os.path.isdir(model_path):
+            raise RuntimeError(f"Không tìm thấy model Vosk tại '{model_path}'.")
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def transcribe(self, audio: bytes) -> str:
+        recognizer = self.vosk.KaldiRecognizer(self.model, SAMPLE_RATE)
+        recognizer.AcceptWaveform(audio)
+        text = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        if not text:
+            raise RecognitionError("Không thể nhận dạng giọng nói.")
+        return text
+
+
+class FakeSpeechBackend(SpeechBackend):
+    """Trả về lần lượt các câu cho trước sau một độ trễ cố định; dùng để kiểm thử và đo độ trễ."""
+    name = "fake"
+
+    def __init__(self, transcripts: List[str], delay_ms: float = 0.0):
+        self.transcripts = transcripts or ["Số hotline của ngân hàng là gì?"]
+        self.delay_ms = delay_ms
+        self.calls = 0
+
+    def transcribe(self, audio: bytes) -> str:
+        time.sleep(self.delay_ms / 1000)
+        text = self.transcripts[self.calls % len(self.transcripts)]
+        self.calls += 1
+        return text
+
+
+def create_speech_backend(name: Optional[str] = None) -> SpeechBackend:
+    name = name or os.getenv("VOICE_BACKEND", "google")
+    if name == "google":
+        return GoogleSpeechBackend(language=os.getenv("VOICE_LANGUAGE", "vi-VN"))
+    if name == "vosk":
+        return VoskSpeechBackend(os.getenv("VOSK_MODEL_PATH", "./models/vosk"))
+    if name == "fake":
+        transcripts = [t for t in os.getenv("FAKE_TRANSCRIPTS", "").split("|") if t]
+        return FakeSpeechBackend(transcripts, float(os.getenv("FAKE_RECOGNITION_MS", "0")))
+    raise ValueError(f"VOICE_BACKEND không hợp lệ: '{name}'")
+
+
+# --- Ghép lại ---
+
+class VoiceInput:
+    """Hiệu chỉnh nhiễu nền, nghe tới khi hết câu và nhận dạng; mọi hàm đều chặn nên chạy trên luồng làm việc."""
+
+    def __init__(self, backend: SpeechBackend, source_factory: Callable = MicrophoneSource,
+                 vad: Optional[EnergyVAD] = None, calibration_s: float = 0.5):
+        self.backend = backend
+        self.source_factory = source_factory
+        self.vad = vad or create_vad()
+        self.calibration_s = calibration_s
+
+    @property
+    def needs_calibration(self) -> bool:
+        return self.vad.calibrated_at is None or time.monotonic() - self.vad.calibrated_at > RECALIBRATE_SECONDS
+
+    def calibrate(self) -> None:
+        count = int(self.calibration_s * 1000 / FRAME_MS)
+        with self.source_factory() as source:
+            frames = source.frames()
+            self.vad.calibrate([next(frames) for _ in range(count)])
+        print(f"ℹ️ Đã hiệu chỉnh nhiễu nền, ngưỡng năng lượng giọng nói: {self.vad.threshold:.0f}")
+
+    def listen(self, no_speech_timeout_s: float = NO_SPEECH_TIMEOUT_S) -> Utterance:
+        detector = UtteranceDetector(self.vad)
+        started = time.perf_counter()
+        with self.source_factory() as source:
+            for frame in source.frames():
+                now = time.perf_counter()
+                utterance = detector.feed(frame, now)
+                if utterance is not None:
+                    return utterance
+                if detector.speech_started is None and now - started > no_speech_timeout_s:
+                    raise NoSpeechError("Không nghe thấy gì, thử lại.")
+        raise NoSpeechError("Micro đã đóng.")
+
+    def transcribe(self, utterance: Utterance) -> str:
+        return self.backend.transcribe(utterance.audio)